@@ -0,0 +1,259 @@
+# app/Services/analytics.py
+"""Agrégat colonnaire en mémoire des transactions (volume / nombre / frais).
+
+Chaque transaction devient une ligne de tableaux NumPy : horodatage
+(secondes), montant, frais, et un code entier par dimension (devise,
+type, direction, méthode de recharge). Une requête (filtres +
+regroupement par période et dimensions) se résout en masques et
+bincount, sans toucher à la table transactions.
+
+Le chargement se fait par created_at, pas par id : sur Postgres les ids
+ne sont pas committés dans l'ordre. Les lignes plus anciennes que
+ANALYTICS_SETTLE_SECONDS sont « figées » et chargées une seule fois ; la
+fenêtre récente est relue en entier à chaque rafraîchissement (au plus
+une fois toutes les ANALYTICS_REFRESH_SECONDS), ce qui rattrape les
+commits tardifs et les suppressions récentes. Toutes les
+ANALYTICS_REBUILD_SECONDS, un COUNT sur la partie figée détecte les
+suppressions plus anciennes (comptes supprimés) et force un rechargement
+complet.
+
+Les frais sont Transaction.fee_amount (renseigné sur les recharges),
+comme /admin/fees/stats. ~30 octets par transaction, local au worker.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..models import Transaction
+
+ANALYTICS_REFRESH_SECONDS = float(os.getenv("ANALYTICS_REFRESH_SECONDS", "5"))
+# doit dépasser la durée d'une transaction SQL (created_at -> commit)
+ANALYTICS_SETTLE_SECONDS = int(os.getenv("ANALYTICS_SETTLE_SECONDS", "300"))
+ANALYTICS_REBUILD_SECONDS = float(os.getenv("ANALYTICS_REBUILD_SECONDS", "600"))
+LOAD_BATCH = 50000
+
+DIMENSIONS = ("currency", "type", "direction", "method")
+BUCKETS = ("hour", "day", "week", "month")
+EPOCH = datetime(1970, 1, 1)
+
+
+def _epoch(dt: datetime) -> int:
+    """Secondes depuis 1970 ; les dates naïves sont en UTC (datetime.utcnow)."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return int((dt - EPOCH).total_seconds())
+
+
+class _Column:
+    """Tableau NumPy extensible (capacité doublée à chaque dépassement)."""
+
+    def __init__(self, dtype):
+        self._data = np.empty(1024, dtype=dtype)
+        self.size = 0
+
+    def extend(self, values) -> None:
+        values = np.asarray(values, dtype=self._data.dtype)
+        need = self.size + len(values)
+        if need > len(self._data):
+            grown = np.empty(max(need, 2 * len(self._data)), dtype=self._data.dtype)
+            grown[:self.size] = self._data[:self.size]
+            self._data = grown
+        self._data[self.size:need] = values
+        self.size = need
+
+    def truncate(self, size: int) -> None:
+        self.size = size
+
+    @property
+    def values(self):
+        return self._data[:self.size]
+
+
+class _Codes:
+    """Dictionnaire libellé <-> code entier pour une dimension."""
+
+    def __init__(self):
+        self.labels: list = []
+        self._index: dict = {}
+
+    def code(self, label) -> int:
+        c = self._index.get(label)
+        if c is None:
+            c = self._index[label] = len(self.labels)
+            self.labels.append(label)
+        return c
+
+    def lookup(self, labels) -> list[int]:
+        return [self._index[l] for l in labels if l in self._index]
+
+
+class TransactionCube:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded_at = 0.0
+        self.as_of: datetime | None = None
+        self._reset()
+
+    def _reset(self) -> None:
+        # lignes [0, _settled) : created_at < settled_until, jamais relues
+        # lignes [_settled, size) : fenêtre récente, relue à chaque refresh
+        self.settled_until: datetime | None = None
+        self._settled = 0
+        self._checked_at = time.monotonic()
+        self._ts = _Column(np.int64)
+        self._amount = _Column(np.float64)
+        self._fee = _Column(np.float64)
+        self._dims = {d: _Column(np.int32) for d in DIMENSIONS}
+        self._codes = {d: _Codes() for d in DIMENSIONS}
+
+    def _columns(self):
+        return [self._ts, self._amount, self._fee, *self._dims.values()]
+
+    # -------------------------
+    # CHARGEMENT
+    # -------------------------
+    def refresh(self, db: Session, force: bool = False) -> None:
+        if not force and time.monotonic() - self._loaded_at < ANALYTICS_REFRESH_SECONDS:
+            return
+        with self._lock:
+            now = datetime.utcnow()
+            if self.settled_until is not None and (
+                force or time.monotonic() - self._checked_at >= ANALYTICS_REBUILD_SECONDS
+            ):
+                self._checked_at = time.monotonic()
+                count = (
+                    db.query(func.count(Transaction.id))
+                    .filter(Transaction.created_at < self.settled_until)
+                    .scalar()
+                )
+                if count != self._settled:
+                    self._reset()
+
+            for column in self._columns():
+                column.truncate(self._settled)
+
+            cutoff = now - timedelta(seconds=ANALYTICS_SETTLE_SECONDS)
+            if self.settled_until is not None:
+                cutoff = max(cutoff, self.settled_until)
+            self._load(db, self.settled_until, cutoff)
+            self._settled = self._ts.size
+            self.settled_until = cutoff
+
+            self._load(db, cutoff, None)
+            self.as_of = now
+            self._loaded_at = time.monotonic()
+
+    def _load(self, db: Session, since: datetime | None, until: datetime | None) -> None:
+        """Ajoute les transactions since <= created_at < until, par lots d'id."""
+        last_id = 0
+        while True:
+            q = db.query(
+                Transaction.id,
+                Transaction.created_at,
+                Transaction.amount,
+                Transaction.fee_amount,
+                Transaction.currency,
+                Transaction.type,
+                Transaction.direction,
+                Transaction.method,
+            ).filter(Transaction.id > last_id)
+            if since is not None:
+                q = q.filter(Transaction.created_at >= since)
+            if until is not None:
+                q = q.filter(Transaction.created_at < until)
+            rows = q.order_by(Transaction.id.asc()).limit(LOAD_BATCH).all()
+            if not rows:
+                return
+            self._append(rows)
+            last_id = rows[-1][0]
+            if len(rows) < LOAD_BATCH:
+                return
+
+    def _append(self, rows) -> None:
+        _, created, amount, fee, currency, tx_type, direction, method = zip(*rows)
+        self._ts.extend([_epoch(c) if c else 0 for c in created])
+        # volume = montants déplacés : certains débits sont stockés négatifs
+        # (partner_spend), le sens est porté par direction
+        self._amount.extend([abs(a or 0.0) for a in amount])
+        self._fee.extend([f or 0.0 for f in fee])
+        for dim, values in zip(DIMENSIONS, (currency, tx_type, direction, method)):
+            codes = self._codes[dim]
+            self._dims[dim].extend([codes.code((v or "").lower()) for v in values])
+
+    # -------------------------
+    # REQUÊTE
+    # -------------------------
+    def _bucket_starts(self, ts, bucket: str):
+        if bucket == "week":
+            # semaines ISO (lundi) ; le 01/01/1970 est un jeudi
+            days = ts // 86400
+            return ((days + 3) // 7 * 7 - 3) * 86400
+        unit = {"hour": "h", "day": "D", "month": "M"}[bucket]
+        return ts.astype("datetime64[s]").astype(f"datetime64[{unit}]").astype("datetime64[s]").astype(np.int64)
+
+    def query(
+        self,
+        bucket: str = "day",
+        start: datetime | None = None,
+        end: datetime | None = None,
+        filters: dict | None = None,
+        group_by: tuple = (),
+    ) -> list[dict]:
+        # sous le verrou : refresh réécrit la fenêtre récente sur place
+        with self._lock:
+            return self._query(bucket, start, end, filters, group_by)
+
+    def _query(self, bucket, start, end, filters, group_by) -> list[dict]:
+        ts = self._ts.values
+        amount = self._amount.values
+        fee = self._fee.values
+        dims = {d: c.values for d, c in self._dims.items()}
+        labels = {d: c.labels for d, c in self._codes.items()}
+
+        mask = np.ones(len(ts), dtype=bool)
+        if start is not None:
+            mask &= ts >= _epoch(start)
+        if end is not None:
+            mask &= ts < _epoch(end)
+        for dim, wanted in (filters or {}).items():
+            mask &= np.isin(dims[dim], self._codes[dim].lookup(wanted))
+
+        if not mask.any():
+            return []
+
+        keys = [self._bucket_starts(ts[mask], bucket)] + [dims[d][mask] for d in group_by]
+        groups, inverse = np.unique(np.stack(keys, axis=1), axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        counts = np.bincount(inverse, minlength=len(groups))
+        volumes = np.bincount(inverse, weights=amount[mask], minlength=len(groups))
+        fees = np.bincount(inverse, weights=fee[mask], minlength=len(groups))
+
+        out = []
+        for i, key in enumerate(groups):
+            row = {"period": (EPOCH + timedelta(seconds=int(key[0]))).isoformat()}
+            for j, dim in enumerate(group_by, start=1):
+                row[dim] = labels[dim][int(key[j])]
+            row["count"] = int(counts[i])
+            row["volume"] = round(float(volumes[i]), 2)
+            row["fees"] = round(float(fees[i]), 2)
+            out.append(row)
+        return out
+
+
+_cube: TransactionCube | None = None
+_cube_lock = threading.Lock()
+
+
+def cube(db: Session) -> TransactionCube:
+    """Cube du worker, rafraîchi si le dernier chargement est trop ancien."""
+    global _cube
+    with _cube_lock:
+        if _cube is None:
+            _cube = TransactionCube()
+    _cube.refresh(db)
+    return _cube
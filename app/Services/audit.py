@@ -0,0 +1,105 @@
+# app/Services/audit.py
+"""Journal d'audit en écriture différée.
+
+record() ne fait qu'empiler l'événement en mémoire : aucune requête, aucun
+commit dans la route. Un thread vide la file par lots (AUDIT_BATCH_SIZE
+événements ou AUDIT_FLUSH_SECONDS écoulées, le premier des deux) avec un
+seul INSERT multi-lignes. drain() écrit ce qui reste à l'arrêt.
+
+Best effort : si la file est pleine (base indisponible longtemps), les
+événements en trop sont comptés dans `dropped` et perdus.
+"""
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from ..db import SessionLocal
+from ..models_audit import AuditLog
+
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "2"))
+AUDIT_QUEUE_MAX = int(os.getenv("AUDIT_QUEUE_MAX", "10000"))
+
+_queue: "queue.Queue[dict]" = queue.Queue(maxsize=AUDIT_QUEUE_MAX)
+_stop = threading.Event()
+_thread: threading.Thread | None = None
+_flush_lock = threading.Lock()
+dropped = 0
+
+
+def record(
+    action: str,
+    user_id: int | None = None,
+    ip_address: str | None = None,
+    target_user_id: int | None = None,
+    detail: str | None = None,
+) -> None:
+    """user_id = auteur de l'action (l'admin), target_user_id = compte visé."""
+    global dropped
+    try:
+        _queue.put_nowait({
+            "user_id": user_id,
+            "action": action,
+            "ip_address": ip_address,
+            "target_user_id": target_user_id,
+            "detail": detail,
+            "created_at": datetime.utcnow(),
+        })
+    except queue.Full:
+        dropped += 1
+
+
+def _take(max_items: int, deadline: float) -> list[dict]:
+    batch = []
+    while len(batch) < max_items:
+        timeout = deadline - time.monotonic()
+        try:
+            batch.append(_queue.get(timeout=timeout) if timeout > 0 else _queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+def _write(batch: list[dict]) -> None:
+    if not batch:
+        return
+    with _flush_lock:
+        db = SessionLocal()
+        try:
+            db.execute(insert(AuditLog), batch)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Audit flush error ({len(batch)} événements perdus):", e)
+        finally:
+            db.close()
+
+
+def _run() -> None:
+    while not _stop.is_set():
+        _write(_take(AUDIT_BATCH_SIZE, time.monotonic() + AUDIT_FLUSH_SECONDS))
+
+
+def start() -> None:
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_run, name="audit-writer", daemon=True)
+    _thread.start()
+
+
+def drain(timeout: float = 5.0) -> None:
+    """Arrête le thread puis écrit tout ce qui reste dans la file."""
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout)
+    while True:
+        batch = _take(AUDIT_BATCH_SIZE, 0)
+        if not batch:
+            return
+        _write(batch)
@@ -0,0 +1,119 @@
+# app/Services/export.py
+"""Export en flux : lignes tirées par lots, sérialisées au fil de l'eau.
+
+iter_rows() exécute un SELECT de colonnes (tuples, pas d'objets ORM) avec
+yield_per : curseur côté serveur sous Postgres, fetchmany sous SQLite. Les
+encodeurs transforment ces lignes en morceaux de bytes et gzip_chunks()
+les compresse à la volée : la mémoire reste bornée par un lot, quelle que
+soit la taille de l'export.
+"""
+import csv
+import json
+import zlib
+from datetime import datetime
+from io import StringIO
+from typing import Iterable, Iterator, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..models import Transaction, User
+
+YIELD_PER = 2000
+
+TX_COLUMNS = ["id", "user_email", "type", "currency", "amount", "note", "direction", "rate_used", "created_at"]
+
+
+def transactions_stmt(
+    user_id: Optional[int] = None,
+    user_email: Optional[str] = None,
+    tx_type: Optional[str] = None,
+    currency: Optional[str] = None,
+    from_dt: Optional[datetime] = None,
+    to_dt: Optional[datetime] = None,
+    limit: Optional[int] = None,
+):
+    """SELECT des colonnes TX_COLUMNS (tuples), filtres de l'export admin.
+
+    Trié par id décroissant (= ordre de création, suit l'index (user_id, id)
+    au lieu d'un tri sur created_at)."""
+    stmt = (
+        select(
+            Transaction.id,
+            User.email,
+            Transaction.type,
+            Transaction.currency,
+            Transaction.amount,
+            Transaction.note,
+            Transaction.direction,
+            Transaction.rate_used,
+            Transaction.created_at,
+        )
+        .join(User, User.id == Transaction.user_id)
+    )
+    if user_id is not None:
+        stmt = stmt.where(Transaction.user_id == user_id)
+    if user_email:
+        stmt = stmt.where(User.email == user_email.strip().lower())
+    if tx_type:
+        stmt = stmt.where(Transaction.type == tx_type.strip())
+    if currency:
+        stmt = stmt.where(Transaction.currency == currency.strip().lower())
+    if from_dt:
+        stmt = stmt.where(Transaction.created_at >= from_dt)
+    if to_dt:
+        stmt = stmt.where(Transaction.created_at <= to_dt)
+
+    stmt = stmt.order_by(Transaction.id.desc())
+    if limit:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def iter_rows(db: Session, stmt, yield_per: int = YIELD_PER) -> Iterator[list[tuple]]:
+    """Lots de tuples (un lot = une partition de yield_per lignes)."""
+    result = db.execute(stmt.execution_options(yield_per=yield_per))
+    for partition in result.partitions():
+        yield partition
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def csv_chunks(header: list[str], batches: Iterable[list[tuple]]) -> Iterator[bytes]:
+    buf = StringIO()
+    w = csv.writer(buf)
+    w.writerow(header)
+    for batch in batches:
+        w.writerows([_cell(v) for v in row] for row in batch)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate(0)
+    tail = buf.getvalue()
+    if tail:
+        yield tail.encode("utf-8")
+
+
+def ndjson_chunks(columns: list[str], batches: Iterable[list[tuple]]) -> Iterator[bytes]:
+    for batch in batches:
+        lines = [
+            json.dumps({c: (v.isoformat() if hasattr(v, "isoformat") else v) for c, v in zip(columns, row)},
+                       ensure_ascii=False)
+            for row in batch
+        ]
+        if lines:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 : conteneur gzip
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out:
+            yield out
+    yield z.flush()
@@ -0,0 +1,262 @@
+# app/Services/export_jobs.py
+"""Jobs d'export en tâche de fond.
+
+La route enregistre un ExportJob (pending) et rend la main. Le thread de
+main.py réserve le plus ancien job en attente (UPDATE gardé sur le
+statut, donc un seul worker le prend), écrit le fichier par lots dans
+EXPORT_DIR sous un nom temporaire puis le renomme : un fichier visible
+est toujours complet. Le client interroge le statut et télécharge quand
+le job est `done`.
+
+Formats : csv, ndjson (gzip optionnel, compressé à la volée) et parquet
+(pyarrow, dépendance optionnelle ; gzip = compression interne des
+colonnes, le fichier reste un .parquet lisible tel quel).
+
+Les fichiers sont supprimés après EXPORT_RETENTION_HOURS. Le worker
+signale qu'il est vivant (heartbeat_at) toutes les
+EXPORT_HEARTBEAT_SECONDS pendant l'écriture ; un job `running` sans signe
+de vie depuis EXPORT_JOB_TIMEOUT_MINUTES (worker mort) est relancé.
+Chaque réservation incrémente `attempt` : c'est le jeton du worker. Le
+fichier temporaire porte ce numéro (deux tentatives n'écrivent jamais le
+même .part), et le passage à `done` / `failed` est un UPDATE gardé sur
+le jeton, fait avant le renommage : un worker relancé à tort abandonne
+son fichier au lieu d'écraser celui de la tentative en cours.
+"""
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import update, func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from ..models import ExportJob
+from .export import TX_COLUMNS, transactions_stmt, iter_rows, csv_chunks, ndjson_chunks, gzip_chunks
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # dépendance optionnelle
+    pa = pq = None
+
+EXPORT_DIR = Path(os.getenv("EXPORT_DIR", "exports"))
+EXPORT_RETENTION_HOURS = int(os.getenv("EXPORT_RETENTION_HOURS", "24"))
+EXPORT_JOB_TIMEOUT_MINUTES = int(os.getenv("EXPORT_JOB_TIMEOUT_MINUTES", "10"))
+EXPORT_HEARTBEAT_SECONDS = float(os.getenv("EXPORT_HEARTBEAT_SECONDS", "30"))
+
+FORMATS = ("csv", "ndjson", "parquet")
+_EXTENSIONS = {"csv": ".csv", "ndjson": ".ndjson", "parquet": ".parquet"}
+_MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+
+
+def parquet_available() -> bool:
+    return pq is not None
+
+
+def filename(job: ExportJob) -> str:
+    name = f"transactions_job{job.id}{_EXTENSIONS[job.format]}"
+    if job.gzip and job.format != "parquet":
+        name += ".gz"
+    return name
+
+
+def media_type(job: ExportJob) -> str:
+    if job.gzip and job.format != "parquet":
+        return "application/gzip"
+    return _MEDIA_TYPES[job.format]
+
+
+# -------------------------
+# RÉSERVATION
+# -------------------------
+def claim_next(db: Session) -> ExportJob | None:
+    now = datetime.utcnow()
+
+    # jobs abandonnés par un worker mort (plus de heartbeat) : on les remet en file
+    db.execute(
+        update(ExportJob)
+        .where(
+            ExportJob.status == "running",
+            func.coalesce(ExportJob.heartbeat_at, ExportJob.started_at)
+            < now - timedelta(minutes=EXPORT_JOB_TIMEOUT_MINUTES),
+        )
+        .values(status="pending")
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+    while True:
+        job = (
+            db.query(ExportJob)
+            .filter(ExportJob.status == "pending")
+            .order_by(ExportJob.id.asc())
+            .first()
+        )
+        if job is None:
+            return None
+        res = db.execute(
+            update(ExportJob)
+            .where(ExportJob.id == job.id, ExportJob.status == "pending")
+            .values(status="running", started_at=now, heartbeat_at=now, attempt=ExportJob.attempt + 1)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        if res.rowcount == 1:
+            db.refresh(job)
+            return job
+
+
+# -------------------------
+# PRODUCTION DU FICHIER
+# -------------------------
+class _Superseded(Exception):
+    """Le job a été relancé sous une autre tentative : ce worker abandonne."""
+
+
+def _owned(job_id: int, attempt: int):
+    return (
+        ExportJob.id == job_id,
+        ExportJob.attempt == attempt,
+        ExportJob.status == "running",
+    )
+
+
+def _heartbeat(db: Session, job_id: int, attempt: int) -> bool:
+    """Signe de vie, sur une session courte à part : la session du job a un
+    curseur de lecture ouvert qu'un commit fermerait (sous SQLite, le WAL de
+    db.py laisse l'écriture passer à côté du lecteur). False si le job n'est
+    plus à nous ; un échec d'écriture ne prouve rien : True."""
+    with Session(bind=db.get_bind()) as hb:
+        try:
+            res = hb.execute(
+                update(ExportJob)
+                .where(*_owned(job_id, attempt))
+                .values(heartbeat_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            hb.commit()
+        except OperationalError:
+            return True
+        return res.rowcount == 1
+
+
+def _finish(db: Session, job_id: int, attempt: int, **values) -> bool:
+    """Passe le job à son état final si la tentative est toujours la nôtre.
+    Ne commit pas : la ligne reste verrouillée jusqu'au commit de l'appelant."""
+    res = db.execute(
+        update(ExportJob)
+        .where(*_owned(job_id, attempt))
+        .values(finished_at=datetime.utcnow(), **values)
+        .execution_options(synchronize_session=False)
+    )
+    return res.rowcount == 1
+
+
+def _write_stream(path: Path, chunks, gzip: bool) -> None:
+    with open(path, "wb") as fh:
+        for chunk in gzip_chunks(chunks) if gzip else chunks:
+            fh.write(chunk)
+
+
+def _write_parquet(path: Path, batches, gzip: bool) -> None:
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("user_email", pa.string()),
+        ("type", pa.string()),
+        ("currency", pa.string()),
+        ("amount", pa.float64()),
+        ("note", pa.string()),
+        ("direction", pa.string()),
+        ("rate_used", pa.float64()),
+        ("created_at", pa.timestamp("us")),
+    ])
+    with pq.ParquetWriter(path, schema, compression="gzip" if gzip else "snappy") as writer:
+        for batch in batches:
+            columns = list(zip(*batch)) if batch else [[] for _ in TX_COLUMNS]
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(col, type=schema.field(i).type) for i, col in enumerate(columns)],
+                schema=schema,
+            ))
+
+
+def run(db: Session, job: ExportJob) -> None:
+    """Produit le fichier du job (déjà réservé) et enregistre le résultat."""
+    # jeton lu une fois : après un rollback, `job` rechargé porterait la
+    # tentative courante en base, plus forcément la nôtre
+    job_id, attempt = job.id, job.attempt
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    final = EXPORT_DIR / filename(job)
+    tmp = final.with_name(f"{final.name}.{attempt}.part")
+
+    rows = 0
+    beat = time.monotonic()
+
+    def counted(batches):
+        nonlocal rows, beat
+        for batch in batches:
+            rows += len(batch)
+            if time.monotonic() - beat >= EXPORT_HEARTBEAT_SECONDS:
+                if not _heartbeat(db, job_id, attempt):
+                    raise _Superseded()
+                beat = time.monotonic()
+            yield batch
+
+    try:
+        filters = json.loads(job.filters or "{}")
+        for key in ("from_dt", "to_dt"):
+            if filters.get(key):
+                filters[key] = datetime.fromisoformat(filters[key])
+
+        batches = counted(iter_rows(db, transactions_stmt(**filters)))
+        if job.format == "csv":
+            _write_stream(tmp, csv_chunks(TX_COLUMNS, batches), job.gzip)
+        elif job.format == "ndjson":
+            _write_stream(tmp, ndjson_chunks(TX_COLUMNS, batches), job.gzip)
+        elif job.format == "parquet":
+            if not parquet_available():
+                raise RuntimeError("pyarrow non installé")
+            _write_parquet(tmp, batches, job.gzip)
+        else:
+            raise ValueError(f"Format inconnu: {job.format}")
+
+        # d'abord le jeton (UPDATE gardé, ligne verrouillée), ensuite le
+        # renommage, enfin le commit
+        done = _finish(
+            db, job_id, attempt, status="done", file_path=str(final),
+            row_count=rows, size_bytes=tmp.stat().st_size,
+        )
+        if not done:
+            raise _Superseded()
+        os.replace(tmp, final)
+        db.commit()
+    except _Superseded:
+        db.rollback()
+        tmp.unlink(missing_ok=True)
+    except Exception as e:
+        db.rollback()
+        tmp.unlink(missing_ok=True)
+        _finish(db, job_id, attempt, status="failed", error=str(e)[:500])
+        db.commit()
+    finally:
+        db.expire(job)
+
+
+# -------------------------
+# RÉTENTION
+# -------------------------
+def purge_expired(db: Session) -> int:
+    cutoff = datetime.utcnow() - timedelta(hours=EXPORT_RETENTION_HOURS)
+    jobs = (
+        db.query(ExportJob)
+        .filter(ExportJob.status.in_(("done", "failed")), ExportJob.finished_at < cutoff)
+        .all()
+    )
+    for job in jobs:
+        if job.file_path:
+            Path(job.file_path).unlink(missing_ok=True)
+        job.status = "expired"
+        job.file_path = None
+    db.commit()
+    return len(jobs)
@@ -0,0 +1,178 @@
+# app/Services/fx.py
+"""Taux FX en mémoire, invalidés par numéro de version.
+
+`current()` sert le taux depuis la mémoire du worker. Au plus toutes les
+FX_VERSION_CHECK_SECONDS, il relit seulement `fx_settings.version` ; le
+taux complet n'est rechargé que si un admin l'a changé (set_rates incrémente
+la version, ce qui propage le changement aux autres workers). Aucune
+écriture sur le chemin de lecture : sans ligne en base on sert les défauts.
+
+Les devis (`issue_quote` / `redeem_quote`) figent un taux pour
+FX_QUOTE_TTL_SECONDS. L'identifiant du devis est un jeton signé qui porte
+le taux : l'émission n'écrit rien. L'usage unique est garanti en base :
+redeem_quote insère le jti dans fx_quote_redemptions (clé primaire), dans
+la transaction de la conversion ; un second usage, sur n'importe quel
+worker, bute sur la contrainte. Si la conversion échoue (rollback), le
+devis reste utilisable jusqu'à son expiration.
+"""
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+
+from jose import jwt, JWTError
+from sqlalchemy import delete
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from ..models import FxSetting, FxQuoteRedemption
+from ..security import SECRET_KEY, ALGORITHM
+
+DEFAULT_SELL_USD = 134.0
+DEFAULT_BUY_USD = 126.0
+
+VERSION_CHECK_SECONDS = float(os.getenv("FX_VERSION_CHECK_SECONDS", "5"))
+QUOTE_TTL_SECONDS = int(os.getenv("FX_QUOTE_TTL_SECONDS", "30"))
+
+
+class FxRates(NamedTuple):
+    sell_usd: float
+    buy_usd: float
+    version: int
+
+
+_lock = threading.Lock()
+_cached: Optional[FxRates] = None
+_checked_at = 0.0
+
+
+def _remember(rates: FxRates) -> FxRates:
+    global _cached, _checked_at
+    with _lock:
+        _cached = rates
+        _checked_at = time.monotonic()
+    return rates
+
+
+def current(db: Session) -> FxRates:
+    cached = _cached
+    if cached is not None and time.monotonic() - _checked_at < VERSION_CHECK_SECONDS:
+        return cached
+
+    row = db.query(FxSetting.version).first()
+    if row is None:
+        return _remember(FxRates(DEFAULT_SELL_USD, DEFAULT_BUY_USD, 0))
+
+    if cached is not None and row.version == cached.version:
+        return _remember(cached)
+
+    fx = db.query(FxSetting.sell_usd, FxSetting.buy_usd, FxSetting.version).first()
+    return _remember(FxRates(float(fx.sell_usd), float(fx.buy_usd), int(fx.version)))
+
+
+def set_rates(db: Session, sell_usd: float, buy_usd: float) -> FxRates:
+    """Met à jour le taux, incrémente la version et commit."""
+    fx = db.query(FxSetting).first()
+    if not fx:
+        fx = FxSetting(version=1)
+        db.add(fx)
+    else:
+        fx.version = FxSetting.version + 1
+    fx.sell_usd = float(sell_usd)
+    fx.buy_usd = float(buy_usd)
+    fx.updated_at = datetime.utcnow()
+    db.commit()
+    db.refresh(fx)
+    return _remember(FxRates(float(fx.sell_usd), float(fx.buy_usd), int(fx.version)))
+
+
+def apply_rate(direction: str, amount: float, rates: FxRates) -> tuple[float, float]:
+    """(taux, montant converti) pour une direction htg_to_usd / usd_to_htg."""
+    if direction == "htg_to_usd":
+        rate = float(rates.sell_usd)
+        return rate, amount / rate
+    rate = float(rates.buy_usd)
+    return rate, amount * rate
+
+
+# -------------------------
+# DEVIS (quote & lock)
+# -------------------------
+class FxQuote(NamedTuple):
+    quote_id: str
+    user_id: int
+    direction: str
+    amount_in: float
+    amount_out: float
+    rate: float
+    expires_at: datetime
+
+
+def issue_quote(db: Session, user_id: int, direction: str, amount: float) -> FxQuote:
+    """Lecture seule : taux du cache mémoire, aucune écriture en base."""
+    rate, out = apply_rate(direction, float(amount), current(db))
+    expires_at = datetime.utcnow().replace(microsecond=0) + timedelta(seconds=QUOTE_TTL_SECONDS)
+
+    quote_id = jwt.encode({
+        "type": "fx_quote",
+        "jti": secrets.token_hex(8),
+        "uid": user_id,
+        "dir": direction,
+        "amt": float(amount),
+        "rate": rate,
+        "exp": expires_at,
+    }, SECRET_KEY, algorithm=ALGORITHM)
+
+    return FxQuote(quote_id, user_id, direction, float(amount), out, rate, expires_at)
+
+
+def redeem_quote(db: Session, quote_id: str, user_id: int) -> Optional[FxQuote]:
+    """Renvoie le devis s'il est valide pour cet utilisateur et pas encore
+    utilisé, sinon None. Marque le devis utilisé ; ne commit pas (le
+    marquage part avec la conversion)."""
+    try:
+        payload = jwt.decode(quote_id, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("type") != "fx_quote" or int(payload["uid"]) != user_id:
+        return None
+
+    rate = float(payload["rate"])
+    amount = float(payload["amt"])
+    _, out = apply_rate(payload["dir"], amount, FxRates(rate, rate, 0))
+    q = FxQuote(quote_id, user_id, payload["dir"], amount, out, rate,
+                datetime.utcfromtimestamp(payload["exp"]))
+    if q.expires_at < datetime.utcnow():
+        return None
+
+    # INSERT ... ON CONFLICT DO NOTHING : 0 ligne = déjà utilisé (ou en
+    # cours d'utilisation par une transaction concurrente, qui nous bloque
+    # jusqu'à son commit / rollback)
+    res = db.execute(
+        _insert_ignore(db)
+        .values(jti=payload["jti"], user_id=user_id, redeemed_at=datetime.utcnow(), expires_at=q.expires_at)
+        .on_conflict_do_nothing(index_elements=["jti"])
+    )
+    if res.rowcount != 1:
+        return None
+    return q
+
+
+def _insert_ignore(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(FxQuoteRedemption)
+    if dialect == "sqlite":
+        return sqlite.insert(FxQuoteRedemption)
+    raise RuntimeError(f"INSERT ... ON CONFLICT non supporté pour {dialect}")
+
+
+def purge_redeemed(db: Session) -> int:
+    """Supprime les marques de devis expirés (ils ne passent plus de toute façon)."""
+    res = db.execute(
+        delete(FxQuoteRedemption).where(FxQuoteRedemption.expires_at < datetime.utcnow())
+    )
+    db.commit()
+    return res.rowcount
@@ -0,0 +1,64 @@
+# app/Services/hash_pool.py
+"""Pool borné pour le hachage de mots de passe (bcrypt / argon2).
+
+Le hachage est volontairement coûteux en CPU : on le sort des threads de
+requête vers un executor de HASH_WORKERS threads (argon2-cffi et bcrypt
+relâchent le GIL). Au-delà de HASH_QUEUE_MAX tâches en attente, ou si une
+tâche a attendu plus de HASH_QUEUE_TIMEOUT secondes avant de démarrer,
+on refuse (HashPoolBusy) au lieu d'empiler : une rafale de logins ne peut
+plus affamer le reste de l'API.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 2)))
+HASH_QUEUE_MAX = int(os.getenv("HASH_QUEUE_MAX", "64"))
+HASH_QUEUE_TIMEOUT = float(os.getenv("HASH_QUEUE_TIMEOUT", "5"))
+
+
+class HashPoolBusy(Exception):
+    pass
+
+
+_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="pwd-hash")
+_lock = threading.Lock()
+_inflight = 0
+
+
+def _release(_fut) -> None:
+    global _inflight
+    with _lock:
+        _inflight -= 1
+
+
+def submit(fn, *args) -> Future:
+    global _inflight
+    with _lock:
+        if _inflight >= HASH_WORKERS + HASH_QUEUE_MAX:
+            raise HashPoolBusy("file de hachage pleine")
+        _inflight += 1
+
+    enqueued_at = time.monotonic()
+
+    def job():
+        # trop attendu : le client a probablement déjà abandonné
+        if time.monotonic() - enqueued_at > HASH_QUEUE_TIMEOUT:
+            raise HashPoolBusy("attente de hachage trop longue")
+        return fn(*args)
+
+    fut = _executor.submit(job)
+    fut.add_done_callback(_release)
+    return fut
+
+
+def run(fn, *args):
+    """Version sync : le thread appelant attend sans consommer de CPU."""
+    return submit(fn, *args).result()
+
+
+async def run_async(fn, *args):
+    """Version async : n'occupe aucun thread de requête pendant l'attente."""
+    return await asyncio.wrap_future(submit(fn, *args))
@@ -0,0 +1,272 @@
+# app/Services/ledger.py
+"""Journal append-only des mouvements de solde.
+
+Chaque jambe d'un mouvement (débit de l'émetteur, crédit du destinataire,
+chaque devise d'une conversion...) est une ligne `LedgerEntry` en unités
+mineures (centimes). Toutes les SNAPSHOT_EVERY écritures d'un couple
+(user, devise), un `BalanceSnapshot` fige le solde cumulé : lire un solde
+coûte donc le dernier snapshot + une queue d'environ SNAPSHOT_EVERY lignes.
+
+Les snapshots ne sont pas posés sur le chemin d'écriture (pas de requête
+de plus par jambe) : snapshot_pending(), appelé par un thread de main.py,
+reprend les écritures après un curseur persistant (worker_cursors), donc
+rien n'est perdu si le thread a été arrêté ou en retard. C'est sûr sans
+verrou parce que toute écriture d'un couple se fait sous le verrou de
+ligne du wallet (les UPDATE gardés de wallet_engine, lock_wallets pour
+les lots) : les écritures committées d'un user forment toujours un
+préfixe de ses id. Chaque worker uvicorn fait tourner le thread : un
+snapshot posé deux fois est ignoré (index unique, ON CONFLICT DO NOTHING).
+
+`Wallet.htg` / `Wallet.usd` restent le solde "cache" lu par l'app ; le
+journal est la source auditable (soldes à une date, réconciliation).
+"""
+import os
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Optional
+
+from sqlalchemy import func, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from ..models import LedgerEntry, BalanceSnapshot, Transaction, WorkerCursor
+
+# HTG et USD ont tous deux 2 décimales
+MINOR_UNITS = {"htg": 100, "usd": 100}
+
+SNAPSHOT_EVERY = 200
+LEDGER_SNAPSHOT_SECONDS = float(os.getenv("LEDGER_SNAPSHOT_SECONDS", "60"))
+# sous Postgres un id peut être committé après un id supérieur : le curseur
+# ne dépasse pas les écritures de moins de LEDGER_SNAPSHOT_SLACK_SECONDS,
+# relues au passage suivant
+LEDGER_SNAPSHOT_SLACK_SECONDS = 300
+SCAN_BATCH = 5000
+CURSOR_NAME = "ledger_snapshots"
+
+
+def to_minor(amount: float, currency: str) -> int:
+    units = MINOR_UNITS[currency.lower()]
+    q = (Decimal(str(amount)) * units).quantize(Decimal("1"), rounding=ROUND_HALF_UP)
+    return int(q)
+
+
+def from_minor(value: int, currency: str) -> float:
+    return int(value or 0) / MINOR_UNITS[currency.lower()]
+
+
+# -------------------------
+# ÉCRITURE
+# -------------------------
+def post_entry(
+    db: Session,
+    user_id: int,
+    currency: str,
+    amount: float,
+    kind: str,
+    tx: Optional[Transaction] = None,
+) -> LedgerEntry:
+    """Ajoute une jambe (amount signé, en unités majeures) au journal.
+
+    Ne commit pas : l'écriture fait partie de la transaction de la route,
+    qui doit tenir le verrou du wallet (cf. docstring du module).
+    """
+    currency = currency.lower()
+    entry = LedgerEntry(
+        user_id=user_id,
+        currency=currency,
+        amount_minor=to_minor(amount, currency),
+        kind=kind,
+        transaction=tx,
+        created_at=datetime.utcnow(),
+    )
+    db.add(entry)
+    db.flush()
+    return entry
+
+
+def post_entries(db: Session, entries: list[dict]) -> None:
+    """Insert en masse (un seul INSERT multi-lignes) pour les lots.
+
+    Chaque dict : user_id, currency, amount (signé, unités majeures), kind,
+    tx_id. Les snapshots suivent via snapshot_pending().
+    """
+    if not entries:
+        return
+    now = datetime.utcnow()
+    rows = [
+        {
+            "user_id": e["user_id"],
+            "currency": e["currency"].lower(),
+            "amount_minor": to_minor(e["amount"], e["currency"]),
+            "kind": e["kind"],
+            "tx_id": e.get("tx_id"),
+            "created_at": now,
+        }
+        for e in entries
+    ]
+    db.execute(insert(LedgerEntry), rows)
+
+
+def _latest_snapshot(db: Session, user_id: int, currency: str, at: Optional[datetime] = None):
+    q = db.query(BalanceSnapshot).filter(
+        BalanceSnapshot.user_id == user_id,
+        BalanceSnapshot.currency == currency,
+    )
+    if at is not None:
+        q = q.filter(BalanceSnapshot.as_of <= at)
+    return q.order_by(BalanceSnapshot.last_entry_id.desc()).first()
+
+
+def _tail(db: Session, user_id: int, currency: str, after_id: int,
+          until_id: Optional[int] = None, at: Optional[datetime] = None):
+    """(count, somme, max id, max date) des écritures après `after_id`."""
+    q = db.query(
+        func.count(LedgerEntry.id),
+        func.coalesce(func.sum(LedgerEntry.amount_minor), 0),
+        func.max(LedgerEntry.id),
+        func.max(LedgerEntry.created_at),
+    ).filter(
+        LedgerEntry.user_id == user_id,
+        LedgerEntry.currency == currency,
+        LedgerEntry.id > after_id,
+    )
+    if until_id is not None:
+        q = q.filter(LedgerEntry.id <= until_id)
+    if at is not None:
+        q = q.filter(LedgerEntry.created_at <= at)
+    return q.one()
+
+
+def _insert_ignore(db: Session, model):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model)
+    if dialect == "sqlite":
+        return sqlite.insert(model)
+    raise RuntimeError(f"INSERT ... ON CONFLICT non supporté pour {dialect}")
+
+
+def snapshot_if_due(db: Session, user_id: int, currency: str) -> bool:
+    """Pose un snapshot si la queue atteint SNAPSHOT_EVERY ; False aussi si
+    un autre worker l'a posé au même endroit. Ne commit pas."""
+    snap = _latest_snapshot(db, user_id, currency)
+    base = snap.balance_minor if snap else 0
+    after_id = snap.last_entry_id if snap else 0
+
+    count, total, last_id, last_at = _tail(db, user_id, currency, after_id)
+    if count < SNAPSHOT_EVERY:
+        return False
+
+    res = db.execute(
+        _insert_ignore(db, BalanceSnapshot)
+        .values(
+            user_id=user_id,
+            currency=currency,
+            balance_minor=base + int(total),
+            last_entry_id=last_id,
+            as_of=last_at,
+            created_at=datetime.utcnow(),
+        )
+        .on_conflict_do_nothing(index_elements=["user_id", "currency", "last_entry_id"])
+    )
+    return res.rowcount == 1
+
+
+def _save_cursor(db: Session, position: int) -> None:
+    db.execute(
+        _insert_ignore(db, WorkerCursor)
+        .values(name=CURSOR_NAME, position=0, updated_at=datetime.utcnow())
+        .on_conflict_do_nothing(index_elements=["name"])
+    )
+    # jamais en arrière (un autre worker a pu aller plus loin)
+    db.execute(
+        update(WorkerCursor)
+        .where(WorkerCursor.name == CURSOR_NAME, WorkerCursor.position < position)
+        .values(position=position, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def snapshot_pending(db: Session) -> int:
+    """Pose les snapshots dus pour les couples écrits après le curseur, par
+    lots de SCAN_BATCH écritures ; renvoie le nombre posé. Commit."""
+    position = db.query(WorkerCursor.position).filter(WorkerCursor.name == CURSOR_NAME).scalar() or 0
+    settled = datetime.utcnow() - timedelta(seconds=LEDGER_SNAPSHOT_SLACK_SECONDS)
+    created = 0
+    while True:
+        batch = (
+            db.query(LedgerEntry.id, LedgerEntry.user_id, LedgerEntry.currency, LedgerEntry.created_at)
+            .filter(LedgerEntry.id > position)
+            .order_by(LedgerEntry.id.asc())
+            .limit(SCAN_BATCH)
+            .all()
+        )
+        if not batch:
+            break
+        for user_id, currency in {(u, c) for _, u, c, _ in batch}:
+            if snapshot_if_due(db, user_id, currency):
+                created += 1
+        db.commit()
+
+        # le curseur avance jusqu'à la première écriture encore récente
+        advanced = position
+        for entry_id, _, _, at in batch:
+            if at >= settled:
+                break
+            advanced = entry_id
+        if advanced > position:
+            _save_cursor(db, advanced)
+        if advanced != batch[-1][0] or len(batch) < SCAN_BATCH:
+            break
+        position = advanced
+    return created
+
+
+# -------------------------
+# LECTURE
+# -------------------------
+def balance_minor(db: Session, user_id: int, currency: str) -> int:
+    """Solde courant : dernier snapshot + queue courte."""
+    currency = currency.lower()
+    snap = _latest_snapshot(db, user_id, currency)
+    base = snap.balance_minor if snap else 0
+    after_id = snap.last_entry_id if snap else 0
+
+    _, total, _, _ = _tail(db, user_id, currency, after_id)
+    return base + int(total)
+
+
+def balance_at_minor(db: Session, user_id: int, currency: str, at: datetime) -> int:
+    """Solde à une date : snapshot précédent + écritures jusqu'au snapshot suivant.
+
+    La queue est bornée des deux côtés par des snapshots, donc jamais plus
+    de ~SNAPSHOT_EVERY lignes lues quelle que soit l'ancienneté du compte.
+    """
+    currency = currency.lower()
+    snap = _latest_snapshot(db, user_id, currency, at=at)
+    base = snap.balance_minor if snap else 0
+    after_id = snap.last_entry_id if snap else 0
+
+    nxt = (
+        db.query(BalanceSnapshot.last_entry_id)
+        .filter(
+            BalanceSnapshot.user_id == user_id,
+            BalanceSnapshot.currency == currency,
+            BalanceSnapshot.as_of > at,
+        )
+        .order_by(BalanceSnapshot.last_entry_id.asc())
+        .first()
+    )
+    until_id = nxt[0] if nxt else None
+
+    _, total, _, _ = _tail(db, user_id, currency, after_id, until_id=until_id, at=at)
+    return base + int(total)
+
+
+def balances(db: Session, user_id: int, at: Optional[datetime] = None) -> dict:
+    out = {}
+    for cur in MINOR_UNITS:
+        value = balance_minor(db, user_id, cur) if at is None else balance_at_minor(db, user_id, cur, at)
+        out[cur] = from_minor(value, cur)
+    return out
@@ -0,0 +1,220 @@
+# app/Services/mailer.py
+"""Outbox email.
+
+Les routes n'envoient rien : enqueue() ajoute une ligne `EmailOutbox` dans
+leur transaction. Un thread (main.py) appelle send_pending() : il réserve
+un lot de messages dus et les envoie sur une seule connexion SMTP,
+gardée ouverte entre deux passages tant qu'elle sert (SMTP_IDLE_SECONDS).
+
+Réservation : `next_attempt_at` repoussé de SEND_LEASE_SECONDS par un
+UPDATE gardé sur l'ancienne valeur, donc un message n'est pris que par un
+worker ; s'il meurt en cours d'envoi, le message redevient dû à la fin du
+bail.
+
+Échecs :
+- refus propre au message (destinataire refusé, DATA refusé...) : seul ce
+  message est touché, la connexion et le reste du lot continuent ; code
+  5xx = abandon (failed), 4xx = nouvel essai avec backoff exponentiel ;
+- perte de connexion (serveur injoignable, déconnexion, timeout) : le
+  message reprend avec backoff, la connexion est fermée et le reste du lot
+  est libéré tout de suite (redevient dû au prochain passage).
+Abandon après SMTP_MAX_ATTEMPTS dans tous les cas.
+
+SMTP_HOST / SMTP_PORT / SMTP_SSL permettent de pointer sur un serveur SMTP
+local (aiosmtpd, MailHog...) en développement.
+"""
+import os
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
+from email.mime.text import MIMEText
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from ..models import EmailOutbox
+
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))
+SMTP_SSL = os.getenv("SMTP_SSL", "1") == "1"
+SMTP_USER = os.getenv("SMTP_USER")
+SMTP_PASS = os.getenv("SMTP_PASS")
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "15"))
+SMTP_IDLE_SECONDS = float(os.getenv("SMTP_IDLE_SECONDS", "60"))
+SMTP_MAX_ATTEMPTS = int(os.getenv("SMTP_MAX_ATTEMPTS", "8"))
+SMTP_BACKOFF_SECONDS = float(os.getenv("SMTP_BACKOFF_SECONDS", "30"))
+SMTP_BACKOFF_MAX_SECONDS = float(os.getenv("SMTP_BACKOFF_MAX_SECONDS", "3600"))
+SEND_BATCH = 50
+SEND_LEASE_SECONDS = 300
+
+# SMTPException hérite d'OSError : l'ordre des tests compte (voir _is_connection_error)
+_CONNECTION_ERRORS = (
+    smtplib.SMTPServerDisconnected,
+    smtplib.SMTPConnectError,
+    smtplib.SMTPHeloError,
+    smtplib.SMTPAuthenticationError,
+)
+
+_conn: smtplib.SMTP | None = None
+_last_used = 0.0
+_lock = threading.Lock()
+
+
+def enqueue(db: Session, to_email: str, subject: str, body: str) -> EmailOutbox:
+    """Ajoute le message à l'outbox. Ne commit pas."""
+    msg = EmailOutbox(
+        to_email=to_email,
+        subject=subject,
+        body=body,
+        status="pending",
+        attempts=0,
+        next_attempt_at=datetime.utcnow(),
+    )
+    db.add(msg)
+    return msg
+
+
+# -------------------------
+# CONNEXION SMTP
+# -------------------------
+def _connect() -> smtplib.SMTP:
+    if SMTP_SSL:
+        conn = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+    else:
+        conn = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+    if SMTP_USER:
+        conn.login(SMTP_USER, SMTP_PASS or "")
+    return conn
+
+
+def _close() -> None:
+    global _conn
+    if _conn is not None:
+        try:
+            _conn.quit()
+        except smtplib.SMTPException:
+            pass
+        except OSError:
+            pass
+        _conn = None
+
+
+def _send(msg: EmailOutbox) -> None:
+    """Envoie sur la connexion courante ; une reconnexion si le serveur l'a fermée."""
+    global _conn, _last_used
+    mime = MIMEText(msg.body)
+    mime["Subject"] = msg.subject
+    mime["From"] = SMTP_USER or "no-reply@haitiwallet.local"
+    mime["To"] = msg.to_email
+
+    if _conn is not None and time.monotonic() - _last_used > SMTP_IDLE_SECONDS:
+        _close()
+    if _conn is None:
+        _conn = _connect()
+    try:
+        _conn.send_message(mime)
+    except smtplib.SMTPServerDisconnected:
+        _conn = _connect()
+        _conn.send_message(mime)
+    _last_used = time.monotonic()
+
+
+# -------------------------
+# ENVOI
+# -------------------------
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(SMTP_BACKOFF_SECONDS * 2 ** (attempts - 1), SMTP_BACKOFF_MAX_SECONDS))
+
+
+def _is_connection_error(e: Exception) -> bool:
+    if isinstance(e, _CONNECTION_ERRORS):
+        return True
+    # socket / TLS / timeout : OSError qui n'est pas une réponse SMTP
+    return isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException)
+
+
+def _is_permanent(e: Exception) -> bool:
+    """Refus définitif du serveur (5xx) pour ce message."""
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in e.recipients.values())
+    if isinstance(e, smtplib.SMTPNotSupportedError):
+        return True
+    code = getattr(e, "smtp_code", None)
+    return code is not None and code >= 500
+
+
+def _fail(msg: EmailOutbox, e: Exception, permanent: bool) -> None:
+    msg.attempts += 1
+    msg.last_error = str(e)[:500]
+    if permanent or msg.attempts >= SMTP_MAX_ATTEMPTS:
+        msg.status = "failed"
+    else:
+        msg.next_attempt_at = datetime.utcnow() + _backoff(msg.attempts)
+
+
+def _release(db: Session, msgs: list[EmailOutbox]) -> None:
+    """Rend tout de suite les messages réservés mais pas tentés."""
+    if not msgs:
+        return
+    db.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.id.in_([m.id for m in msgs]), EmailOutbox.status == "pending")
+        .values(next_attempt_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _claim(db: Session) -> list[EmailOutbox]:
+    now = datetime.utcnow()
+    due = (
+        db.query(EmailOutbox)
+        .filter(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+        .order_by(EmailOutbox.next_attempt_at.asc())
+        .limit(SEND_BATCH)
+        .all()
+    )
+    lease = now + timedelta(seconds=SEND_LEASE_SECONDS)
+    claimed = []
+    for msg in due:
+        res = db.execute(
+            update(EmailOutbox)
+            .where(
+                EmailOutbox.id == msg.id,
+                EmailOutbox.status == "pending",
+                EmailOutbox.next_attempt_at == msg.next_attempt_at,
+            )
+            .values(next_attempt_at=lease)
+            .execution_options(synchronize_session=False)
+        )
+        if res.rowcount == 1:
+            claimed.append(msg)
+    db.commit()
+    return claimed
+
+
+def send_pending(db: Session) -> int:
+    """Envoie les messages dus ; renvoie le nombre envoyés."""
+    with _lock:
+        sent = 0
+        claimed = _claim(db)
+        for i, msg in enumerate(claimed):
+            try:
+                _send(msg)
+            except OSError as e:  # inclut smtplib.SMTPException
+                if _is_connection_error(e):
+                    # serveur injoignable : inutile de tenter le reste du lot
+                    _close()
+                    _fail(msg, e, permanent=False)
+                    _release(db, claimed[i + 1:])
+                    db.commit()
+                    break
+                # refus propre à ce message : la connexion reste utilisable
+                _fail(msg, e, permanent=_is_permanent(e))
+                db.commit()
+            else:
+                msg.status = "sent"
+                msg.sent_at = datetime.utcnow()
+                sent += 1
+                db.commit()
+        return sent
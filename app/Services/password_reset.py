@@ -0,0 +1,94 @@
+# app/Services/password_reset.py
+"""Codes de réinitialisation de mot de passe.
+
+Le code (8 caractères) n'est jamais stocké : seule une HMAC-SHA256
+(SECRET_KEY, email + code) l'est, et la vérification est une seule sonde
+sur l'index (email, token, used). Au plus RESET_MAX_OUTSTANDING codes
+valides par email ; les lignes expirées ou utilisées sont supprimées par
+lots (purge_expired, thread de main.py).
+"""
+import hashlib
+import hmac
+import os
+import secrets
+import string
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_, update
+from sqlalchemy.orm import Session
+
+from ..models import PasswordReset
+from ..security import SECRET_KEY
+
+RESET_TOKEN_TTL_MINUTES = int(os.getenv("RESET_TOKEN_TTL_MINUTES", "15"))
+RESET_MAX_OUTSTANDING = int(os.getenv("RESET_MAX_OUTSTANDING", "3"))
+PURGE_BATCH = 1000
+
+_ALPHABET = string.ascii_uppercase + string.digits
+
+
+def hash_token(email: str, token: str) -> str:
+    msg = f"{email.strip().lower()}:{token.strip().upper()}".encode()
+    return hmac.new(SECRET_KEY.encode(), msg, hashlib.sha256).hexdigest()
+
+
+def issue(db: Session, email: str) -> str | None:
+    """Crée un code pour `email` et renvoie le code en clair (à envoyer),
+    ou None si l'email a déjà RESET_MAX_OUTSTANDING codes valides.
+    Ne commit pas."""
+    now = datetime.utcnow()
+    outstanding = db.query(func.count(PasswordReset.id)).filter(
+        PasswordReset.email == email,
+        PasswordReset.used == False,
+        PasswordReset.expires_at > now,
+    ).scalar()
+    if outstanding >= RESET_MAX_OUTSTANDING:
+        return None
+
+    token = "".join(secrets.choice(_ALPHABET) for _ in range(8))
+    db.add(PasswordReset(
+        email=email,
+        token_hash=hash_token(email, token),
+        created_at=now,
+        expires_at=now + timedelta(minutes=RESET_TOKEN_TTL_MINUTES),
+        used=False,
+    ))
+    return token
+
+
+def find_valid(db: Session, email: str, token: str) -> PasswordReset | None:
+    pr = db.query(PasswordReset).filter(
+        PasswordReset.email == email,
+        PasswordReset.token_hash == hash_token(email, token),
+        PasswordReset.used == False,
+    ).first()
+    if not pr or pr.expires_at < datetime.utcnow():
+        return None
+    return pr
+
+
+def consume_all(db: Session, email: str) -> None:
+    """Marque utilisés tous les codes de l'email (après un reset réussi)."""
+    db.execute(
+        update(PasswordReset)
+        .where(PasswordReset.email == email, PasswordReset.used == False)
+        .values(used=True)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def purge_expired(db: Session) -> int:
+    """Supprime les codes expirés ou utilisés par lots ; renvoie le nombre supprimé."""
+    deleted = 0
+    while True:
+        ids = [
+            i for (i,) in db.query(PasswordReset.id)
+            .filter(or_(PasswordReset.expires_at < datetime.utcnow(), PasswordReset.used == True))
+            .limit(PURGE_BATCH)
+            .all()
+        ]
+        if not ids:
+            return deleted
+        db.query(PasswordReset).filter(PasswordReset.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        deleted += len(ids)
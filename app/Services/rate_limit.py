@@ -0,0 +1,165 @@
+# app/Services/rate_limit.py
+"""Limiteurs des échecs de login : fenêtre glissante (par IP) et délai
+progressif (par email).
+
+Backend mémoire par défaut (local au worker). Si RATE_LIMIT_REDIS_URL est
+défini et que le paquet `redis` est installé, les compteurs sont partagés
+entre workers via des sorted sets Redis. Rien ici ne bloque un thread :
+on répond "trop de tentatives" (avec Retry-After) au lieu de faire attendre.
+
+client_ip() donne l'IP du client derrière le proxy de l'hébergeur
+(TRUSTED_PROXY_HOPS proxies devant l'app, X-Forwarded-For).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+MEMORY_MAX_KEYS = 100_000
+# nombre de proxies de confiance devant l'app (Render : 1) ; 0 = IP du pair
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+
+def client_ip(request) -> Optional[str]:
+    """IP du client. Chaque proxy ajoute l'adresse qu'il voit à droite de
+    X-Forwarded-For : avec N proxies de confiance, l'IP du client est la
+    N-ième en partant de la droite ; ce qui est plus à gauche vient du
+    client et peut être forgé."""
+    peer = request.client.host if request.client else None
+    if TRUSTED_PROXY_HOPS <= 0:
+        return peer
+    forwarded = [p.strip() for p in request.headers.get("x-forwarded-for", "").split(",") if p.strip()]
+    if len(forwarded) < TRUSTED_PROXY_HOPS:
+        return peer
+    return forwarded[-TRUSTED_PROXY_HOPS]
+
+
+class MemoryBackend:
+    def __init__(self):
+        self._hits: "OrderedDict[str, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _prune(self, key: str, window: float, now: float) -> deque:
+        q = self._hits.get(key)
+        if q is None:
+            return deque()
+        while q and q[0] <= now - window:
+            q.popleft()
+        if not q:
+            del self._hits[key]
+        return q
+
+    async def count(self, key: str, window: float) -> tuple[int, float, float]:
+        """(nb de hits dans la fenêtre, timestamps du plus ancien et du plus récent)."""
+        now = time.time()
+        with self._lock:
+            q = self._prune(key, window, now)
+            return len(q), (q[0] if q else now), (q[-1] if q else now)
+
+    async def hit(self, key: str, window: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._prune(key, window, now)
+            q = self._hits.setdefault(key, deque())
+            q.append(now)
+            self._hits.move_to_end(key)
+            while len(self._hits) > MEMORY_MAX_KEYS:
+                self._hits.popitem(last=False)
+
+    async def reset(self, key: str) -> None:
+        with self._lock:
+            self._hits.pop(key, None)
+
+
+class RedisBackend:
+    def __init__(self, url: str):
+        import redis.asyncio as redis  # dépendance optionnelle
+        self._r = redis.from_url(url)
+
+    async def count(self, key: str, window: float) -> tuple[int, float, float]:
+        now = time.time()
+        pipe = self._r.pipeline()
+        pipe.zremrangebyscore(key, 0, now - window)
+        pipe.zcard(key)
+        pipe.zrange(key, 0, 0, withscores=True)
+        pipe.zrange(key, -1, -1, withscores=True)
+        _, n, oldest, newest = await pipe.execute()
+        return int(n), (oldest[0][1] if oldest else now), (newest[0][1] if newest else now)
+
+    async def hit(self, key: str, window: float) -> None:
+        now = time.time()
+        pipe = self._r.pipeline()
+        pipe.zadd(key, {f"{now:.6f}": now})
+        pipe.expire(key, int(window) + 1)
+        await pipe.execute()
+
+    async def reset(self, key: str) -> None:
+        await self._r.delete(key)
+
+
+def _make_backend():
+    if REDIS_URL:
+        try:
+            return RedisBackend(REDIS_URL)
+        except ImportError:
+            print("RATE_LIMIT_REDIS_URL défini mais paquet redis absent : limiteur en mémoire")
+    return MemoryBackend()
+
+
+_backend = _make_backend()
+
+
+class SlidingWindowLimiter:
+    def __init__(self, prefix: str, limit: int, window: float):
+        self.prefix = prefix
+        self.limit = limit
+        self.window = window
+
+    def _key(self, key: str) -> str:
+        return f"rl:{self.prefix}:{key}"
+
+    async def retry_after(self, key: Optional[str]) -> int:
+        """0 si la clé est sous la limite, sinon secondes avant le prochain essai."""
+        if not key:
+            return 0
+        n, oldest, _ = await _backend.count(self._key(key), self.window)
+        if n < self.limit:
+            return 0
+        return max(1, int(oldest + self.window - time.time()) + 1)
+
+    async def hit(self, key: Optional[str]) -> None:
+        if key:
+            await _backend.hit(self._key(key), self.window)
+
+    async def reset(self, key: Optional[str]) -> None:
+        if key:
+            await _backend.reset(self._key(key))
+
+
+class ProgressiveDelay(SlidingWindowLimiter):
+    """Pas de blocage dur : après `free` échecs dans la fenêtre, chaque
+    nouvel essai doit attendre base * 2^(échecs - free) secondes depuis le
+    dernier échec, plafonné à max_delay. Un tiers qui tape le mauvais mot
+    de passe d'un compte ne peut donc pas en bloquer le propriétaire plus
+    de max_delay secondes d'affilée."""
+
+    def __init__(self, prefix: str, free: int, base: float, max_delay: float, window: float):
+        super().__init__(prefix, free, window)
+        self.base = base
+        self.max_delay = max_delay
+
+    def delay_for(self, failures: int) -> float:
+        if failures < self.limit:
+            return 0.0
+        # exposant borné : au-delà de ~1024, float * 2**n lève OverflowError
+        # (rafale sur un même email), et 2**32 s dépasse déjà tout plafond
+        return min(self.base * 2 ** min(failures - self.limit, 32), self.max_delay)
+
+    async def retry_after(self, key: Optional[str]) -> int:
+        if not key:
+            return 0
+        n, _, newest = await _backend.count(self._key(key), self.window)
+        wait = newest + self.delay_for(n) - time.time()
+        return int(wait) + 1 if wait > 0 else 0
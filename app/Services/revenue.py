@@ -0,0 +1,104 @@
+# app/Services/revenue.py
+"""Rollup quotidien des recharges approuvées (revenus = frais).
+
+Une ligne par (jour, devise, méthode), incrémentée par un UPSERT dans la
+transaction qui approuve la recharge : le dashboard lit quelques
+centaines de lignes au lieu de sommer toute la table topup_requests.
+rebuild() recalcule tout depuis topup_requests (python -m app.backfill_revenue).
+"""
+from datetime import date, datetime
+
+from sqlalchemy import func, delete, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from ..models import RevenueDaily, TopupRequest
+
+
+def _upsert(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(RevenueDaily)
+    if dialect == "sqlite":
+        return sqlite.insert(RevenueDaily)
+    raise RuntimeError(f"UPSERT non supporté pour {dialect}")
+
+
+def record_topup(db: Session, req: TopupRequest, decided_at: datetime) -> None:
+    """Ajoute une recharge approuvée au rollup. Ne commit pas."""
+    record_topups(db, [req], decided_at)
+
+
+def record_topups(db: Session, reqs: list[TopupRequest], decided_at: datetime) -> None:
+    """Idem pour un lot : un UPSERT par (devise, méthode) du lot."""
+    groups = {}
+    for req in reqs:
+        key = (req.currency.lower(), req.method)
+        g = groups.setdefault(key, [0, 0.0, 0.0, 0.0])
+        g[0] += 1
+        g[1] += float(req.amount or 0)
+        g[2] += float(req.fee_amount or 0)
+        g[3] += float(req.net_amount or 0)
+
+    for (currency, method), (count, amount, fee, net) in groups.items():
+        _add(db, decided_at.date(), currency, method, count, amount, fee, net)
+
+
+def _add(db: Session, day: date, currency: str, method: str,
+         count: int, amount: float, fee: float, net: float) -> None:
+    stmt = _upsert(db).values(
+        day=day,
+        currency=currency,
+        method=method,
+        topup_count=count,
+        amount_total=amount,
+        fee_total=fee,
+        net_total=net,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["day", "currency", "method"],
+        set_={
+            "topup_count": RevenueDaily.topup_count + stmt.excluded.topup_count,
+            "amount_total": RevenueDaily.amount_total + stmt.excluded.amount_total,
+            "fee_total": RevenueDaily.fee_total + stmt.excluded.fee_total,
+            "net_total": RevenueDaily.net_total + stmt.excluded.net_total,
+        },
+    )
+    db.execute(stmt)
+
+
+def rebuild(db: Session) -> int:
+    """Recalcule tout le rollup depuis topup_requests ; renvoie le nombre de lignes."""
+    day = func.date(TopupRequest.decided_at)
+    rows = (
+        db.query(
+            day,
+            func.lower(TopupRequest.currency),
+            TopupRequest.method,
+            func.count(TopupRequest.id),
+            func.coalesce(func.sum(TopupRequest.amount), 0),
+            func.coalesce(func.sum(TopupRequest.fee_amount), 0),
+            func.coalesce(func.sum(TopupRequest.net_amount), 0),
+        )
+        .filter(TopupRequest.status == "APPROVED", TopupRequest.decided_at != None)
+        .group_by(day, func.lower(TopupRequest.currency), TopupRequest.method)
+        .all()
+    )
+
+    db.execute(delete(RevenueDaily))
+    if rows:
+        db.execute(insert(RevenueDaily), [
+            {
+                # func.date renvoie une chaîne sous SQLite, une date sous Postgres
+                "day": d if isinstance(d, date) else date.fromisoformat(str(d)[:10]),
+                "currency": cur,
+                "method": method,
+                "topup_count": count,
+                "amount_total": float(amount),
+                "fee_total": float(fee),
+                "net_total": float(net),
+            }
+            for d, cur, method, count, amount, fee, net in rows
+        ])
+    db.commit()
+    return len(rows)
@@ -0,0 +1,91 @@
+# app/Services/revocation.py
+"""Versions de token révoquées, en mémoire.
+
+Les access tokens portent `tv` (User.token_version au moment de
+l'émission) : l'auth se fait sans base. Quand un admin change le statut
+ou le rôle d'un compte (ou le supprime), token_version est incrémenté et
+une ligne token_revocations (user_id, version minimale) est écrite ; un
+token dont la version est inférieure est refusé.
+
+Seuls les comptes révoqués depuis moins d'une durée de vie d'access token
+peuvent avoir un token encore valide mais périmé : c'est tout ce que
+contient la table en mémoire, rechargée toutes les
+REVOCATION_REFRESH_SECONDS depuis token_revocations (refresh) par un
+thread de main.py. Le worker qui fait la modification l'applique tout de
+suite (revoke) ; les autres suivent au prochain rechargement, comptes
+supprimés compris (la ligne de révocation n'a pas de FK vers users).
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, delete, func
+from sqlalchemy.orm import Session
+
+from ..models import TokenRevocation
+
+EPOCH = datetime(1970, 1, 1)
+
+# user_id -> (version minimale acceptée, instant de la révocation en
+# secondes epoch) : seuls les tokens émis avant cet instant sont visés, ce
+# qui protège un compte créé plus tard avec le même id (SQLite réutilise
+# le plus grand id supprimé)
+_versions: dict[int, tuple[int, float]] = {}
+# révocations locales pas encore vues en base :
+# user_id -> (version, instant epoch, expire_monotonic)
+_local: dict[int, tuple[int, float, float]] = {}
+_lock = threading.Lock()
+
+
+def _epoch(dt: datetime) -> float:
+    return (dt - EPOCH).total_seconds()
+
+
+def _newer(a: tuple[int, float] | None, b: tuple[int, float]) -> tuple[int, float]:
+    return b if a is None or b[0] > a[0] else a
+
+
+def refresh(db: Session, window_seconds: int) -> int:
+    """Recharge les révocations de la fenêtre ; renvoie le nombre de comptes."""
+    since = datetime.utcnow() - timedelta(seconds=window_seconds)
+    rows = db.execute(
+        select(
+            TokenRevocation.user_id,
+            func.max(TokenRevocation.min_version),
+            func.max(TokenRevocation.created_at),
+        )
+        .where(TokenRevocation.created_at >= since)
+        .group_by(TokenRevocation.user_id)
+    ).all()
+    fresh = {user_id: (version, _epoch(at)) for user_id, version, at in rows}
+
+    # au-delà de la fenêtre, les tokens concernés ont expiré d'eux-mêmes
+    db.execute(delete(TokenRevocation).where(TokenRevocation.created_at < since))
+    db.commit()
+
+    global _versions
+    now = time.monotonic()
+    with _lock:
+        for user_id, (version, at, until) in list(_local.items()):
+            if until < now:
+                del _local[user_id]
+            else:
+                fresh[user_id] = _newer(fresh.get(user_id), (version, at))
+        _versions = fresh
+    return len(fresh)
+
+
+def revoke(user_id: int, version: int, window_seconds: int) -> None:
+    """Refuse tout de suite, dans ce worker, les tokens déjà émis de version < `version`."""
+    at = _epoch(datetime.utcnow())
+    with _lock:
+        _local[user_id] = (version, at, time.monotonic() + window_seconds)
+        _versions[user_id] = _newer(_versions.get(user_id), (version, at))
+
+
+def is_revoked(user_id: int, version: int, issued_at: float | None = None) -> bool:
+    entry = _versions.get(user_id)
+    if entry is None or version >= entry[0]:
+        return False
+    # iat est arrondi à la seconde : un token de la même seconde est visé
+    return issued_at is None or issued_at <= entry[1]
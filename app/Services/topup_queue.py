@@ -0,0 +1,102 @@
+# app/Services/topup_queue.py
+"""File de revue des recharges partagée entre admins.
+
+claim() réserve les N plus anciennes demandes PENDING libres pour un
+admin : claimed_by / claimed_until (bail de TOPUP_CLAIM_LEASE_SECONDS).
+Une demande réservée n'est plus proposée aux autres admins jusqu'à la
+décision, release() ou l'expiration du bail (admin parti sans décider).
+renew() prolonge le bail des demandes que l'admin détient encore : claim()
+ne les repropose pas (elles ne sont pas libres) et en réserve d'autres.
+
+Sous Postgres, la sélection se fait en SELECT ... FOR UPDATE SKIP LOCKED :
+deux admins qui réservent en même temps obtiennent des lots disjoints
+sans s'attendre. Sous SQLite (un seul écrivain à la fois), un seul
+UPDATE ... WHERE id IN (SELECT ... LIMIT n) est déjà atomique.
+"""
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, or_
+from sqlalchemy.orm import Session
+
+from ..db import IS_SQLITE
+from ..models import TopupRequest
+
+TOPUP_CLAIM_LEASE_SECONDS = int(os.getenv("TOPUP_CLAIM_LEASE_SECONDS", "600"))
+CLAIM_MAX = 50
+
+
+def is_free(now: datetime):
+    """Filtre SQL : demande sans bail en cours."""
+    return or_(TopupRequest.claimed_until.is_(None), TopupRequest.claimed_until < now)
+
+
+def claim(db: Session, admin_id: int, n: int) -> list[int]:
+    """Réserve jusqu'à n demandes pour admin_id ; renvoie leurs id. Commit."""
+    now = datetime.utcnow()
+    until = now + timedelta(seconds=TOPUP_CLAIM_LEASE_SECONDS)
+
+    candidates = (
+        select(TopupRequest.id)
+        .where(TopupRequest.status == "PENDING", is_free(now))
+        # un admin ne revoit pas ses propres recharges (cf. decide_request)
+        .where(TopupRequest.user_id != admin_id)
+        .order_by(TopupRequest.id.asc())
+        .limit(n)
+    )
+    if IS_SQLITE:
+        target = TopupRequest.id.in_(candidates.scalar_subquery())
+    else:
+        ids = db.scalars(candidates.with_for_update(skip_locked=True)).all()
+        if not ids:
+            db.rollback()
+            return []
+        target = TopupRequest.id.in_(ids)
+
+    db.execute(
+        update(TopupRequest)
+        .where(target)
+        .values(claimed_by=admin_id, claimed_until=until)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+    if not IS_SQLITE:
+        return sorted(ids)
+    return db.scalars(
+        select(TopupRequest.id)
+        .where(TopupRequest.claimed_by == admin_id, TopupRequest.claimed_until == until)
+        .order_by(TopupRequest.id.asc())
+    ).all()
+
+
+def renew(db: Session, admin_id: int) -> list[int]:
+    """Prolonge le bail des demandes PENDING détenues par admin_id ; renvoie
+    leurs id. Une demande dont le bail a expiré et qu'un autre admin a
+    réservée entre-temps n'est plus à lui. Commit."""
+    until = datetime.utcnow() + timedelta(seconds=TOPUP_CLAIM_LEASE_SECONDS)
+    held = (
+        TopupRequest.claimed_by == admin_id,
+        TopupRequest.status == "PENDING",
+    )
+    db.execute(
+        update(TopupRequest)
+        .where(*held)
+        .values(claimed_until=until)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return db.scalars(
+        select(TopupRequest.id).where(*held).order_by(TopupRequest.id.asc())
+    ).all()
+
+
+def release(db: Session, admin_id: int, req_id: int) -> bool:
+    """Rend une demande à la file (seul l'admin qui la détient). Ne commit pas."""
+    res = db.execute(
+        update(TopupRequest)
+        .where(TopupRequest.id == req_id, TopupRequest.claimed_by == admin_id)
+        .values(claimed_by=None, claimed_until=None)
+        .execution_options(synchronize_session=False)
+    )
+    return res.rowcount == 1
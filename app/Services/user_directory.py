@@ -0,0 +1,105 @@
+# app/Services/user_directory.py
+"""Annuaire admin des utilisateurs : filtres, recherche par préfixe,
+pagination par keyset (id décroissant) et total mis en cache.
+
+La recherche `q` porte sur l'email, le téléphone, le prénom et le nom,
+chacun par préfixe sur une colonne indexée (copies minuscules pour
+l'email et les noms). Sous Postgres, LIKE 'abc%' avec des index
+text_pattern_ops ; sous SQLite, l'intervalle [abc, abd) qui utilise
+l'index binaire ordinaire.
+
+Le total (X-Total-Count) est un COUNT par combinaison de filtres, gardé
+USER_COUNT_CACHE_SECONDS : il peut retarder de quelques secondes.
+"""
+import os
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, func, or_, and_
+from sqlalchemy.orm import Session
+
+from ..db import IS_SQLITE
+from ..models import User
+from .cache import TTLCache
+
+PAGE_DEFAULT = 50
+PAGE_MAX = 200
+USER_COUNT_CACHE_SECONDS = int(os.getenv("USER_COUNT_CACHE_SECONDS", "30"))
+
+_counts = TTLCache(maxsize=1000, ttl=USER_COUNT_CACHE_SECONDS)
+
+
+def _prefix(col, q: str):
+    if IS_SQLITE:
+        upper = q[:-1] + chr(ord(q[-1]) + 1)
+        return and_(col >= q, col < upper)
+    escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return col.like(escaped + "%", escape="\\")
+
+
+def _filters(
+    q: Optional[str],
+    role: Optional[str],
+    status: Optional[str],
+    created_from: Optional[datetime],
+    created_to: Optional[datetime],
+) -> list:
+    where = []
+    if role:
+        where.append(User.role == role)
+    if status:
+        where.append(User.status == status)
+    if created_from:
+        where.append(User.created_at >= created_from)
+    if created_to:
+        where.append(User.created_at <= created_to)
+
+    q = (q or "").strip().lower()
+    if q:
+        where.append(or_(
+            _prefix(User.email_lower, q),
+            _prefix(User.phone, q),
+            _prefix(User.first_name_lower, q),
+            _prefix(User.last_name_lower, q),
+        ))
+    return where
+
+
+def search(
+    db: Session,
+    q: Optional[str] = None,
+    role: Optional[str] = None,
+    status: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    cursor: Optional[int] = None,
+    limit: int = PAGE_DEFAULT,
+) -> tuple[list[User], Optional[int]]:
+    """(page, curseur suivant) ; curseur None en fin de liste."""
+    stmt = select(User).where(*_filters(q, role, status, created_from, created_to))
+    if cursor is not None:
+        stmt = stmt.where(User.id < cursor)
+
+    rows = db.scalars(stmt.order_by(User.id.desc()).limit(limit + 1)).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1].id
+    return rows, None
+
+
+def count(
+    db: Session,
+    q: Optional[str] = None,
+    role: Optional[str] = None,
+    status: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+) -> int:
+    key = ((q or "").strip().lower(), role, status, created_from, created_to)
+    total = _counts.get(key)
+    if total is None:
+        total = db.scalar(
+            select(func.count(User.id)).where(*_filters(q, role, status, created_from, created_to))
+        )
+        _counts.set(key, total)
+    return total
@@ -0,0 +1,162 @@
+# app/Services/wallet_engine.py
+"""Mouvements de solde atomiques.
+
+Chaque mouvement est un seul UPDATE gardé côté base :
+
+    UPDATE wallets SET htg = htg - :amt WHERE user_id = :id AND htg >= :amt
+
+Le contrôle de solde et le débit se font donc dans la même instruction :
+deux workers qui débitent le même wallet ne peuvent plus perdre une mise
+à jour ni passer en négatif. Les fonctions renvoient True si la ligne a
+été modifiée (rowcount == 1), False sinon (wallet absent / solde
+insuffisant) ; c'est à la route de lever l'erreur HTTP.
+
+Rien n'est commité ici. Les UPDATE ne synchronisent pas les objets
+Wallet déjà chargés dans la session : relire les soldes après commit
+(expire_on_commit les recharge).
+"""
+from typing import Optional
+
+from sqlalchemy import update, select, case
+from sqlalchemy.orm import Session
+
+from ..models import Wallet, Transaction
+from .ledger import post_entry
+
+CURRENCIES = ("htg", "usd")
+
+
+def _column(currency: str):
+    currency = currency.lower()
+    if currency not in CURRENCIES:
+        raise ValueError(f"Devise invalide: {currency}")
+    return getattr(Wallet, currency)
+
+
+def _execute(db: Session, stmt) -> int:
+    res = db.execute(stmt.execution_options(synchronize_session=False))
+    return res.rowcount
+
+
+def debit(db: Session, user_id: int, currency: str, amount: float,
+          kind: str, tx: Optional[Transaction] = None) -> bool:
+    col = _column(currency)
+    amount = float(amount)
+    stmt = (
+        update(Wallet)
+        .where(Wallet.user_id == user_id, col >= amount)
+        .values({col: col - amount})
+    )
+    if _execute(db, stmt) != 1:
+        return False
+    post_entry(db, user_id, currency, -amount, kind, tx=tx)
+    return True
+
+
+def credit(db: Session, user_id: int, currency: str, amount: float,
+           kind: str, tx: Optional[Transaction] = None) -> bool:
+    col = _column(currency)
+    amount = float(amount)
+    stmt = (
+        update(Wallet)
+        .where(Wallet.user_id == user_id)
+        .values({col: col + amount})
+    )
+    if _execute(db, stmt) != 1:
+        return False
+    post_entry(db, user_id, currency, amount, kind, tx=tx)
+    return True
+
+
+def transfer(db: Session, from_user_id: int, to_user_id: int, currency: str, amount: float,
+             kind: str, tx_out: Optional[Transaction] = None,
+             tx_in: Optional[Transaction] = None) -> bool:
+    """Débite l'un, crédite l'autre.
+
+    Les deux lignes sont toujours verrouillées dans l'ordre croissant de
+    user_id, quel que soit le sens : deux virements croisés A->B / B->A ne
+    peuvent pas s'interbloquer. En cas d'échec (solde insuffisant ou
+    wallet absent), l'une des deux jambes a pu être écrite : c'est à la
+    route de faire le rollback, comme pour tout le reste de sa transaction.
+    """
+    if from_user_id < to_user_id:
+        ok = debit(db, from_user_id, currency, amount, kind, tx=tx_out) and \
+            credit(db, to_user_id, currency, amount, kind, tx=tx_in)
+    else:
+        ok = credit(db, to_user_id, currency, amount, kind, tx=tx_in) and \
+            debit(db, from_user_id, currency, amount, kind, tx=tx_out)
+    return ok
+
+
+def exchange(db: Session, user_id: int, from_currency: str, amount_in: float,
+             to_currency: str, amount_out: float,
+             kind: str, tx: Optional[Transaction] = None) -> bool:
+    """Conversion dans le même wallet : un seul UPDATE pour les deux devises."""
+    src = _column(from_currency)
+    dst = _column(to_currency)
+    amount_in = float(amount_in)
+    amount_out = float(amount_out)
+    stmt = (
+        update(Wallet)
+        .where(Wallet.user_id == user_id, src >= amount_in)
+        .values({src: src - amount_in, dst: dst + amount_out})
+    )
+    if _execute(db, stmt) != 1:
+        return False
+    post_entry(db, user_id, from_currency, -amount_in, kind, tx=tx)
+    post_entry(db, user_id, to_currency, amount_out, kind, tx=tx)
+    return True
+
+
+def lock_wallets(db: Session, user_ids) -> set:
+    """Verrouille les wallets (SELECT ... FOR UPDATE) dans l'ordre des user_id.
+
+    Renvoie les user_id qui ont effectivement un wallet. Sous SQLite le
+    FOR UPDATE est ignoré (la base sérialise déjà les écritures).
+    """
+    stmt = (
+        select(Wallet.user_id)
+        .where(Wallet.user_id.in_(set(user_ids)))
+        .order_by(Wallet.user_id.asc())
+        .with_for_update()
+    )
+    return set(db.scalars(stmt).all())
+
+
+def fan_out(db: Session, from_user_id: int, currency: str, credits: dict) -> bool:
+    """Débite la somme de `credits` d'un coup, puis crédite tous les
+    destinataires ({user_id: montant}) en un seul UPDATE ... CASE.
+
+    Ne poste pas le journal : l'appelant insère ses jambes en masse avec
+    ledger.post_entries. Appeler lock_wallets avant pour l'ordre des verrous.
+    En cas d'échec le débit a pu être écrit : rollback côté appelant.
+    """
+    col = _column(currency)
+    total = float(sum(credits.values()))
+
+    stmt = (
+        update(Wallet)
+        .where(Wallet.user_id == from_user_id, col >= total)
+        .values({col: col - total})
+    )
+    if _execute(db, stmt) != 1:
+        return False
+
+    return credit_many(db, currency, credits)
+
+
+def credit_many(db: Session, currency: str, credits: dict) -> bool:
+    """Crédite plusieurs wallets ({user_id: montant}) en un seul UPDATE ... CASE.
+
+    True si tous les wallets existent (rowcount == len(credits)). Ne poste
+    pas le journal (ledger.post_entries côté appelant) et ne rollback pas.
+    """
+    if not credits:
+        return True
+    col = _column(currency)
+    stmt = (
+        update(Wallet)
+        .where(Wallet.user_id.in_(list(credits)))
+        .values({col: col + case({uid: float(a) for uid, a in credits.items()}, value=Wallet.user_id)})
+    )
+    return _execute(db, stmt) == len(credits)
@@ -0,0 +1,74 @@
+# app/backfill_ledger.py
+# Usage: python -m app.backfill_ledger
+#
+# À lancer une fois après le déploiement du journal : pour chaque wallet, poste
+# une écriture "opening" égale au solde actuel moins ce que le journal contient
+# déjà, pour que ledger et Wallet.htg / Wallet.usd partent alignés.
+#
+# Le trafic continue pendant et avant le backfill : chaque wallet est verrouillé
+# (SELECT ... FOR UPDATE) le temps de lire son solde et la somme de ses
+# écritures, ce qui fige un point de coupure cohérent par wallet. Les couples
+# qui ont déjà leur "opening" sont sautés : relancer le script est sans effet.
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal, Base, engine
+from app.models import Wallet, LedgerEntry
+from app.Services.ledger import post_entry, to_minor, from_minor, MINOR_UNITS
+
+BATCH = 500
+
+
+def _journal(db: Session, user_id: int) -> dict:
+    """{devise: (somme en centimes, a déjà une opening)}"""
+    rows = (
+        db.query(
+            LedgerEntry.currency,
+            func.coalesce(func.sum(LedgerEntry.amount_minor), 0),
+            func.count(LedgerEntry.id).filter(LedgerEntry.kind == "opening"),
+        )
+        .filter(LedgerEntry.user_id == user_id)
+        .group_by(LedgerEntry.currency)
+        .all()
+    )
+    return {cur: (int(total), bool(openings)) for cur, total, openings in rows}
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    db: Session = SessionLocal()
+
+    created = 0
+    last_id = 0
+    while True:
+        ids = [
+            wid for (wid,) in db.query(Wallet.id)
+            .filter(Wallet.id > last_id)
+            .order_by(Wallet.id.asc())
+            .limit(BATCH)
+        ]
+        if not ids:
+            break
+
+        for wid in ids:
+            # un wallet par transaction : le verrou ne bloque pas le trafic
+            # plus longtemps que nécessaire
+            w = db.query(Wallet).filter(Wallet.id == wid).with_for_update().first()
+            if w is not None:
+                journal = _journal(db, w.user_id)
+                for cur in MINOR_UNITS:
+                    total, has_opening = journal.get(cur, (0, False))
+                    missing = to_minor(float(getattr(w, cur) or 0), cur) - total
+                    if missing and not has_opening:
+                        post_entry(db, w.user_id, cur, from_minor(missing, cur), "opening")
+                        created += 1
+            db.commit()
+
+        last_id = ids[-1]
+
+    db.close()
+    print(f"✅ Ledger backfill : {created} écritures d'ouverture")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+# app/backfill_revenue.py
+# Usage: python -m app.backfill_revenue
+#
+# À lancer une fois après le déploiement du rollup revenue_daily (ou pour
+# le reconstruire) : recalcule tous les jours depuis les recharges
+# approuvées de topup_requests.
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal, Base, engine
+from app.Services.revenue import rebuild
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    db: Session = SessionLocal()
+
+    rows = rebuild(db)
+
+    db.close()
+    print(f"✅ Revenue backfill : {rows} lignes (jour, devise, méthode)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
 import os
+import threading
+import time
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc as sa_exc
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool, StaticPool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
 load_dotenv()  # 🔥 LIGNE CRITIQUE
 
@@ -10,11 +14,135 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL not set")
 
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+
+# ==============================
+# POOL (configurable + télémétrie)
+# ==============================
+# DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT (s), DB_POOL_RECYCLE (s),
+# DB_POOL_PRE_PING (0/1). SQLite : SQLITE_BUSY_TIMEOUT_MS, SQLITE_WAL (0/1).
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, "1" if default else "0").lower() in ("1", "true", "yes")
+
+
+class PoolStats:
+    """Compteurs d'attente au checkout (temps passé à attendre une connexion)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, waited: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            n = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_total / n * 1000, 3) if n else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+            }
+
+
+class _TimedPoolMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except sa_exc.TimeoutError:
+            self.stats.record(time.perf_counter() - t0, timed_out=True)
+            print("DB pool exhausted: checkout timeout")
+            raise
+        self.stats.record(time.perf_counter() - t0)
+        return conn
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _pool_kwargs(url: str, poolclass) -> dict:
+    if url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith(":")):
+        return {"poolclass": StaticPool}
+    return {
+        "poolclass": poolclass,
+        "pool_size": _env_int("DB_POOL_SIZE", 5),
+        "max_overflow": _env_int("DB_MAX_OVERFLOW", 10),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),
+        # SQLite : pas de coupure côté serveur, inutile de recycler / pinger
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", -1 if IS_SQLITE else 1800),
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", not IS_SQLITE),
+    }
+
+
+def _sqlite_pragmas(dbapi_conn, _record):
+    # WAL : lecteurs et écrivain ne se bloquent plus ; busy_timeout : on
+    # attend le verrou d'écriture au lieu d'échouer tout de suite
+    cur = dbapi_conn.cursor()
+    cur.execute(f"PRAGMA busy_timeout = {_env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)}")
+    if _env_bool("SQLITE_WAL", True):
+        cur.execute("PRAGMA journal_mode = WAL")
+        cur.execute("PRAGMA synchronous = NORMAL")
+    cur.close()
+
+
 engine = create_engine(
     DATABASE_URL,
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+    connect_args={"check_same_thread": False} if IS_SQLITE else {},
+    **_pool_kwargs(DATABASE_URL, TimedQueuePool),
 )
 
+if IS_SQLITE:
+    event.listen(engine, "connect", _sqlite_pragmas)
+
+
+def pool_status(eng) -> dict:
+    pool = eng.pool
+    out = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        out.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": pool._max_overflow,
+            "timeout_s": pool.timeout(),
+        })
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        out.update(stats.snapshot())
+    return out
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -25,3 +153,37 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# ==============================
+# ASYNC (routes chaudes)
+# ==============================
+# Même base, driver async : aiosqlite pour SQLite, asyncpg pour Postgres.
+# ASYNC_DATABASE_URL permet de forcer l'URL si besoin.
+
+def _async_url(url: str) -> str:
+    if url.startswith("sqlite:///"):
+        return "sqlite+aiosqlite:///" + url[len("sqlite:///"):]
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    if url.startswith("postgresql://") or url.startswith("postgresql+psycopg2://"):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    return url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    **_pool_kwargs(ASYNC_DATABASE_URL, TimedAsyncQueuePool),
+)
+
+if IS_SQLITE:
+    event.listen(async_engine.sync_engine, "connect", _sqlite_pragmas)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as adb:
+        yield adb
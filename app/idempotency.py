@@ -0,0 +1,253 @@
+# app/idempotency.py
+"""En-tête Idempotency-Key pour les routes qui déplacent de l'argent.
+
+Usage dans une route :
+
+    idem: Idempotency = Depends(idempotent("wallet.transfer"))
+    ...
+    if idem.replay is not None:
+        return idem.replay
+    ...
+    return idem.save({"ok": True})      # à la place du db.commit() final
+
+Les routes async utilisent idempotent_async() et `await idem.save(...)`.
+
+Première requête : la clé est réservée (ligne "pending", index unique) avant
+le handler. save() écrit la réponse et commit la transaction du handler
+d'un bloc : le mouvement et la clé "done" partent ensemble. Un rejeu
+renvoie la réponse d'origine sans ré-exécuter le mouvement ; un rejeu
+concurrent pendant le traitement reçoit un 409. Si le handler échoue, la
+réservation est libérée pour permettre un nouvel essai ; si le process
+meurt, la clé "pending" (sans mouvement commité) est reprise après
+IDEMPOTENCY_PENDING_SECONDS.
+
+La clé est liée à la requête (empreinte de la méthode, du chemin, de la
+query string et du corps) : la réutiliser pour une autre requête donne un
+422 au lieu de rejouer la première réponse.
+Les réponses terminées sont aussi gardées dans un cache mémoire borné.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import Depends, Header, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .db import get_db, get_async_db
+from .models import User, IdempotencyKey
+from .security import get_current_user, get_current_user_async, Principal
+from .Services.cache import TTLCache
+
+TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+MEMORY_MAX = int(os.getenv("IDEMPOTENCY_MEMORY_MAX", "10000"))
+PENDING_SECONDS = int(os.getenv("IDEMPOTENCY_PENDING_SECONDS", "60"))
+PURGE_BATCH = 1000
+
+
+# réponses terminées : clé -> (empreinte, corps)
+_memory = TTLCache(maxsize=MEMORY_MAX, ttl=TTL_HOURS * 3600)
+
+
+async def request_fingerprint(request: Request) -> str:
+    # FastAPI a déjà lu le corps pour les paramètres : body() le relit du cache
+    body = await request.body()
+    h = hashlib.sha256()
+    for part in (request.method, request.url.path, request.url.query):
+        h.update(part.encode())
+        h.update(b"\0")
+    h.update(body)
+    return h.hexdigest()
+
+
+def _mismatch():
+    return HTTPException(
+        status_code=422,
+        detail="Idempotency-Key déjà utilisée pour une autre requête",
+    )
+
+
+# -------------------------
+# Réservation / rejeu
+# -------------------------
+class Idempotency:
+    def __init__(self, db: Session, user_id: int, endpoint: str, key: Optional[str],
+                 fingerprint: Optional[str] = None):
+        self.db = db
+        self.user_id = user_id
+        self.endpoint = endpoint
+        self.key = (key or "").strip()[:120] or None
+        self.fingerprint = fingerprint
+        self.replay = None
+        self._claimed = False
+        self._saved = False
+
+    def _filter(self, q):
+        return q.filter(
+            IdempotencyKey.user_id == self.user_id,
+            IdempotencyKey.endpoint == self.endpoint,
+            IdempotencyKey.key == self.key,
+        )
+
+    @property
+    def _memory_key(self) -> tuple:
+        return (self.user_id, self.endpoint, self.key)
+
+    def begin(self) -> None:
+        if not self.key:
+            return
+
+        hit = _memory.get(self._memory_key)
+        if hit is not None:
+            fingerprint, body = hit
+            if fingerprint and fingerprint != self.fingerprint:
+                raise _mismatch()
+            self.replay = body
+            return
+
+        now = datetime.utcnow()
+        row = self._filter(self.db.query(IdempotencyKey)).first()
+        # expirée, ou "pending" abandonnée (process mort avant save() : comme
+        # save() commit avec le mouvement, rien n'a été écrit)
+        if row and (
+            row.expires_at < now
+            or (row.status == "pending" and row.created_at < now - timedelta(seconds=PENDING_SECONDS))
+        ):
+            self.db.delete(row)
+            self.db.commit()
+            row = None
+
+        if row:
+            if row.request_hash and row.request_hash != self.fingerprint:
+                raise _mismatch()
+            if row.status == "done":
+                self.replay = json.loads(row.response_body)
+                _memory.set(self._memory_key, (row.request_hash, self.replay))
+                return
+            raise HTTPException(status_code=409, detail="Requête déjà en cours de traitement")
+
+        self.db.add(IdempotencyKey(
+            user_id=self.user_id,
+            endpoint=self.endpoint,
+            key=self.key,
+            status="pending",
+            request_hash=self.fingerprint,
+            created_at=now,
+            expires_at=now + timedelta(hours=TTL_HOURS),
+        ))
+        try:
+            self.db.commit()
+        except IntegrityError:
+            self.db.rollback()
+            raise HTTPException(status_code=409, detail="Requête déjà en cours de traitement")
+        self._claimed = True
+
+    def _stage(self, response):
+        if not self._claimed:
+            return None
+        body = jsonable_encoder(response)
+        self._filter(self.db.query(IdempotencyKey)).update(
+            {"status": "done", "response_body": json.dumps(body)},
+            synchronize_session=False,
+        )
+        return body
+
+    def _done(self, body) -> None:
+        if body is None:
+            return
+        self._saved = True
+        _memory.set(self._memory_key, (self.fingerprint, body))
+
+    def save(self, response):
+        """Enregistre la réponse d'origine et commit la transaction du handler
+        (remplace son db.commit() final), avec ou sans clé."""
+        body = self._stage(response)
+        self.db.commit()
+        self._done(body)
+        return response
+
+    def release(self) -> None:
+        if not self._claimed or self._saved:
+            return
+        self.db.rollback()
+        self._filter(self.db.query(IdempotencyKey)).filter(
+            IdempotencyKey.status == "pending"
+        ).delete(synchronize_session=False)
+        self.db.commit()
+
+
+def idempotent(endpoint: str):
+    """Dépendance FastAPI : lit l'en-tête Idempotency-Key (optionnel)."""
+    def dependency(
+        idempotency_key: Optional[str] = Header(None),
+        fingerprint: str = Depends(request_fingerprint),
+        user: User = Depends(get_current_user),
+        db: Session = Depends(get_db),
+    ):
+        idem = Idempotency(db, user.id, endpoint, idempotency_key, fingerprint)
+        idem.begin()
+        try:
+            yield idem
+        except Exception:
+            idem.release()
+            raise
+
+    return dependency
+
+
+class AsyncIdempotency(Idempotency):
+    """Même logique, exécutée sur la session sync sous-jacente via run_sync."""
+
+    def __init__(self, adb: AsyncSession, user_id: int, endpoint: str, key: Optional[str],
+                 fingerprint: Optional[str] = None):
+        super().__init__(adb.sync_session, user_id, endpoint, key, fingerprint)
+        self.adb = adb
+
+    async def save(self, response):
+        body = await self.adb.run_sync(lambda _: self._stage(response))
+        await self.adb.commit()
+        self._done(body)
+        return response
+
+
+def idempotent_async(endpoint: str):
+    """Variante de idempotent() pour les routes async (`return await idem.save(...)`)."""
+    async def dependency(
+        idempotency_key: Optional[str] = Header(None),
+        fingerprint: str = Depends(request_fingerprint),
+        user: Principal = Depends(get_current_user_async),
+        adb: AsyncSession = Depends(get_async_db),
+    ):
+        idem = AsyncIdempotency(adb, user.id, endpoint, idempotency_key, fingerprint)
+        await adb.run_sync(lambda _: idem.begin())
+        try:
+            yield idem
+        except Exception:
+            await adb.run_sync(lambda _: idem.release())
+            raise
+
+    return dependency
+
+
+# -------------------------
+# Purge des clés expirées
+# -------------------------
+def purge_expired(db: Session) -> int:
+    """Supprime les clés expirées par lots ; renvoie le nombre supprimé."""
+    deleted = 0
+    while True:
+        ids = [
+            i for (i,) in db.query(IdempotencyKey.id)
+            .filter(IdempotencyKey.expires_at < datetime.utcnow())
+            .limit(PURGE_BATCH)
+            .all()
+        ]
+        if not ids:
+            return deleted
+        db.query(IdempotencyKey).filter(IdempotencyKey.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        deleted += len(ids)
@@ -8,8 +8,8 @@ from fastapi import FastAPI, UploadFile, File, Depends
 from fastapi.responses import RedirectResponse
 from fastapi.staticfiles import StaticFiles
 
-from sqlalchemy import text
-from sqlalchemy.exc import ProgrammingError
+from sqlalchemy import text, inspect
+from sqlalchemy.exc import ProgrammingError, OperationalError
 from sqlalchemy.orm import Session
 
 from fastapi.middleware.cors import CORSMiddleware
@@ -17,7 +17,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from .db import Base, engine, get_db, SessionLocal
 from . import models
 from .models import User
-from .security import hash_password, get_current_user
+from .security import hash_password, get_current_user, refresh_revocations, REVOCATION_REFRESH_SECONDS
 
 from .routes_auth import router as auth_router
 from .routes_wallet import router as wallet_router
@@ -28,6 +28,7 @@ from .routes_export import router as export_router
 from .routes_partners import router as partners_router
 from .routes_partners_spend import router as partners_spend_router
 from .routes_admin_stats import router as admin_stats_router
+from .routes_admin_fees import router as admin_fees_router
 from .routes_wallet_spend import router as wallet_spend_router
 from .routes_admin_wallet import router as admin_wallet_router
 from .routes_admin_users import router as admin_users_router
@@ -35,6 +36,13 @@ from .routes_superadmin import router as superadmin_router
 from .routes_merchant import router as merchant_router
 from .routes_subscriptions import router as subscriptions_router
 from .subscription_billing import run_subscription_billing
+from .idempotency import purge_expired as purge_idempotency_keys
+from .Services.fx import purge_redeemed as purge_fx_quotes
+from .Services.password_reset import purge_expired as purge_password_resets
+from .Services import audit
+from .Services.mailer import send_pending as send_pending_emails
+from .Services import export_jobs
+from .Services.ledger import snapshot_pending, LEDGER_SNAPSHOT_SECONDS
 
 # ==============================
 # APP
@@ -48,6 +56,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # en-têtes lus par le front (pagination keyset, délai de connexion)
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "Retry-After"],
 )
 
 Base.metadata.create_all(bind=engine, checkfirst=True)
@@ -62,10 +72,106 @@ try:
         conn.execute(text("ALTER TABLE users ADD COLUMN profile_image TEXT"))
         conn.commit()
         print("profile_image column added.")
-except ProgrammingError:
+except (ProgrammingError, OperationalError):
     print("profile_image column already exists.")
 
 
+# ==============================
+# AUTO MIGRATION colonnes
+# ==============================
+# create_all n'ajoute pas les colonnes aux tables existantes.
+
+def _add_column(table: str, column: str, ddl: str):
+    existing = {c["name"] for c in inspect(engine).get_columns(table)}
+    if column in existing:
+        return
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    print(f"{table}.{column} column added.")
+
+
+_add_column("fx_settings", "version", "INTEGER NOT NULL DEFAULT 1")
+_add_column("users", "token_version", "INTEGER NOT NULL DEFAULT 0")
+_add_column("users", "token_version_at", "TIMESTAMP")
+_add_column("audit_logs", "target_user_id", "INTEGER")
+_add_column("audit_logs", "detail", "VARCHAR")
+_add_column("transactions", "method", "VARCHAR")
+_add_column("transactions", "fee_amount", "FLOAT")
+_add_column("users", "email_lower", "VARCHAR")
+_add_column("users", "first_name_lower", "VARCHAR")
+_add_column("users", "last_name_lower", "VARCHAR")
+_add_column("topup_requests", "claimed_by", "INTEGER")
+_add_column("topup_requests", "claimed_until", "TIMESTAMP")
+_add_column("idempotency_keys", "request_hash", "VARCHAR(64)")
+_add_column("refresh_tokens", "replaced_by_id", "INTEGER")
+_add_column("export_jobs", "attempt", "INTEGER NOT NULL DEFAULT 0")
+_add_column("export_jobs", "heartbeat_at", "TIMESTAMP")
+
+# remplit les copies minuscules des comptes créés avant leur ajout
+with engine.begin() as _conn:
+    _conn.execute(text(
+        "UPDATE users SET email_lower = lower(email), "
+        "first_name_lower = lower(first_name), last_name_lower = lower(last_name) "
+        "WHERE email_lower IS NULL"
+    ))
+
+# transactions de recharge antérieures aux colonnes method / fee_amount :
+# méthode et frais repris de la demande approuvée correspondante (pas de FK :
+# même user, devise, montant net et note "Topup approuvé via <méthode>"),
+# sinon méthode tirée de la note (simulateur fournisseur : note = fournisseur,
+# sans frais). method IS NULL marque les lignes pas encore traitées.
+_TOPUP_NOTE = "Topup approuvé via "
+_TOPUP_MATCH = (
+    "FROM topup_requests r WHERE r.user_id = transactions.user_id "
+    "AND r.status = 'APPROVED' AND r.currency = transactions.currency "
+    "AND r.net_amount = transactions.amount "
+    "AND transactions.note = :prefix || r.method "
+    "ORDER BY r.id LIMIT 1"
+)
+
+
+def _backfill_topup_transactions():
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"UPDATE transactions SET "
+            f"method = (SELECT r.method {_TOPUP_MATCH}), "
+            f"fee_amount = (SELECT r.amount - r.net_amount {_TOPUP_MATCH}) "
+            f"WHERE type = 'topup' AND direction = 'manual_topup' AND method IS NULL "
+            f"AND EXISTS (SELECT 1 {_TOPUP_MATCH})"
+        ), {"prefix": _TOPUP_NOTE})
+        conn.execute(text(
+            "UPDATE transactions SET method = substr(note, :skip) "
+            "WHERE type = 'topup' AND direction = 'manual_topup' AND method IS NULL "
+            "AND substr(note, 1, :n) = :prefix"
+        ), {"prefix": _TOPUP_NOTE, "n": len(_TOPUP_NOTE), "skip": len(_TOPUP_NOTE) + 1})
+        conn.execute(text(
+            "UPDATE transactions SET method = note, fee_amount = 0 "
+            "WHERE type = 'topup' AND direction = 'credit' AND method IS NULL"
+        ))
+
+
+_backfill_topup_transactions()
+
+
+# ==============================
+# AUTO MIGRATION index
+# ==============================
+# create_all ne crée les index que pour les nouvelles tables :
+# on rattrape ceux ajoutés depuis sur les tables existantes.
+
+# snapshots en double posés par plusieurs workers avant l'index unique
+with engine.begin() as conn:
+    conn.execute(text(
+        "DELETE FROM balance_snapshots WHERE id NOT IN "
+        "(SELECT min(id) FROM balance_snapshots GROUP BY user_id, currency, last_entry_id)"
+    ))
+    conn.execute(text("DROP INDEX IF EXISTS ix_balance_snapshots_user_currency_entry"))
+
+for _table in Base.metadata.sorted_tables:
+    for _index in _table.indexes:
+        _index.create(bind=engine, checkfirst=True)
+
+
 # ==============================
 # SEED SUPERADMIN
 # ==============================
@@ -110,6 +216,7 @@ app.include_router(export_router)
 app.include_router(partners_router)
 app.include_router(partners_spend_router)
 app.include_router(admin_stats_router)
+app.include_router(admin_fees_router)
 app.include_router(wallet_spend_router)
 app.include_router(admin_wallet_router)
 app.include_router(admin_users_router)
@@ -182,6 +289,9 @@ def root():
 import threading
 import time
 
+EMAIL_POLL_SECONDS = float(os.getenv("EMAIL_POLL_SECONDS", "5"))
+EXPORT_POLL_SECONDS = float(os.getenv("EXPORT_POLL_SECONDS", "5"))
+
 
 def billing_worker():
     while True:
@@ -193,4 +303,118 @@ def billing_worker():
         time.sleep(3600)
 
 
-threading.Thread(target=billing_worker, daemon=True).start()
\ No newline at end of file
+threading.Thread(target=billing_worker, daemon=True).start()
+
+
+def idempotency_purge_worker():
+    while True:
+        db = SessionLocal()
+        try:
+            purge_idempotency_keys(db)
+            purge_fx_quotes(db)
+        except Exception as e:
+            print("Idempotency purge error:", e)
+        finally:
+            db.close()
+
+        time.sleep(600)
+
+
+threading.Thread(target=idempotency_purge_worker, daemon=True).start()
+
+
+def password_reset_purge_worker():
+    while True:
+        db = SessionLocal()
+        try:
+            purge_password_resets(db)
+        except Exception as e:
+            print("Password reset purge error:", e)
+        finally:
+            db.close()
+
+        time.sleep(600)
+
+
+threading.Thread(target=password_reset_purge_worker, daemon=True).start()
+
+
+def revocation_refresh_worker():
+    # recharge les versions de token révoquées (changements de statut /
+    # rôle faits par les autres workers)
+    while True:
+        db = SessionLocal()
+        try:
+            refresh_revocations(db)
+        except Exception as e:
+            print("Revocation refresh error:", e)
+        finally:
+            db.close()
+
+        time.sleep(REVOCATION_REFRESH_SECONDS)
+
+
+threading.Thread(target=revocation_refresh_worker, daemon=True).start()
+
+
+def ledger_snapshot_worker():
+    # snapshots de solde hors du chemin d'écriture (cf. Services/ledger.py)
+    while True:
+        db = SessionLocal()
+        try:
+            snapshot_pending(db)
+        except Exception as e:
+            print("Ledger snapshot error:", e)
+        finally:
+            db.close()
+
+        time.sleep(LEDGER_SNAPSHOT_SECONDS)
+
+
+threading.Thread(target=ledger_snapshot_worker, daemon=True).start()
+
+
+def email_outbox_worker():
+    while True:
+        db = SessionLocal()
+        try:
+            send_pending_emails(db)
+        except Exception as e:
+            print("Email outbox error:", e)
+        finally:
+            db.close()
+
+        time.sleep(EMAIL_POLL_SECONDS)
+
+
+threading.Thread(target=email_outbox_worker, daemon=True).start()
+
+
+def export_job_worker():
+    while True:
+        db = SessionLocal()
+        try:
+            export_jobs.purge_expired(db)
+            job = export_jobs.claim_next(db)
+            while job is not None:
+                export_jobs.run(db, job)
+                job = export_jobs.claim_next(db)
+        except Exception as e:
+            print("Export job error:", e)
+        finally:
+            db.close()
+
+        time.sleep(EXPORT_POLL_SECONDS)
+
+
+threading.Thread(target=export_job_worker, daemon=True).start()
+
+
+@app.on_event("startup")
+def start_audit_writer():
+    audit.start()
+
+
+@app.on_event("shutdown")
+def drain_audit_writer():
+    audit.drain()
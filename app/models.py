@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text, func
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Date, DateTime, ForeignKey, Boolean, Text, Index, func, event
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -11,6 +11,9 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True, nullable=False)
     password_hash = Column(String, nullable=False)
+    # toute écriture de role / status doit appeler security.revoke_user_tokens
+    # avant le commit : les access tokens portent le rôle et sont réputés
+    # actifs sans relire la base (security._principal_from_claims)
     role = Column(String, default="user")
     status = Column(String, default="active")
 # active | suspended | banned
@@ -31,15 +34,46 @@ class User(Base):
 
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # révocation des access tokens : incrémenté à chaque changement de
+    # statut / rôle, les tokens portant une version inférieure sont refusés
+    token_version = Column(Integer, default=0, server_default="0", nullable=False)
+    token_version_at = Column(DateTime, nullable=True, index=True)
+
+    # copies en minuscules pour la recherche par préfixe de l'annuaire admin
+    # (tenues à jour par _normalize_user)
+    email_lower = Column(String, nullable=True)
+    first_name_lower = Column(String, nullable=True)
+    last_name_lower = Column(String, nullable=True)
+
 
     # relationships
     wallet = relationship("Wallet", back_populates="user", uselist=False, cascade="all, delete-orphan")
     transactions = relationship("Transaction", back_populates="user", cascade="all, delete-orphan")
 
+    # recherche par préfixe (LIKE 'abc%') : text_pattern_ops sous Postgres
+    # pour que l'index serve quelle que soit la collation
+    __table_args__ = (
+        Index("ix_users_email_lower", "email_lower", postgresql_ops={"email_lower": "text_pattern_ops"}),
+        Index("ix_users_phone", "phone", postgresql_ops={"phone": "text_pattern_ops"}),
+        Index("ix_users_first_name_lower", "first_name_lower", postgresql_ops={"first_name_lower": "text_pattern_ops"}),
+        Index("ix_users_last_name_lower", "last_name_lower", postgresql_ops={"last_name_lower": "text_pattern_ops"}),
+        Index("ix_users_status_id", "status", "id"),
+        Index("ix_users_role_id", "role", "id"),
+        Index("ix_users_created_at", "created_at"),
+    )
+
     # relation vers le parrain (optionnel mais pratique)
     referrer = relationship("User", remote_side=[id], uselist=False)
 
 
+@event.listens_for(User, "before_insert")
+@event.listens_for(User, "before_update")
+def _normalize_user(mapper, connection, target):
+    target.email_lower = (target.email or "").strip().lower() or None
+    target.first_name_lower = (target.first_name or "").strip().lower() or None
+    target.last_name_lower = (target.last_name or "").strip().lower() or None
+
+
 class Wallet(Base):
     __tablename__ = "wallets"
 
@@ -67,10 +101,21 @@ class Transaction(Base):
     direction = Column(String, nullable=False)  # credit | debit | htg_to_usd | usd_to_htg | transfer_in | transfer_out
     rate_used = Column(Float, nullable=True)
 
+    # recharges uniquement (analytics) : méthode / fournisseur et frais retenus
+    method = Column(String, nullable=True)
+    fee_amount = Column(Float, nullable=True)
+
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
     user = relationship("User", back_populates="transactions")
 
+    __table_args__ = (
+        # historique paginé par keyset : WHERE user_id = ? AND id < ? ORDER BY id DESC
+        Index("ix_transactions_user_id_id", "user_id", "id"),
+        # chargement de l'agrégat analytics par fenêtre de created_at
+        Index("ix_transactions_created_at_id", "created_at", "id"),
+    )
+
 
 class TopupRequest(Base):
     __tablename__ = "topup_requests"
@@ -95,6 +140,19 @@ class TopupRequest(Base):
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     decided_at = Column(DateTime, nullable=True)
 
+    # file de revue multi-admins : demande réservée par un admin jusqu'à claimed_until
+    claimed_by = Column(Integer, nullable=True)
+    claimed_until = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # index partiel : seules les demandes en attente, dans l'ordre de la file
+        Index(
+            "ix_topup_requests_pending_id", "id",
+            postgresql_where=(status == "PENDING"),
+            sqlite_where=(status == "PENDING"),
+        ),
+    )
+
 
 class FxSetting(Base):
     __tablename__ = "fx_settings"
@@ -103,6 +161,19 @@ class FxSetting(Base):
     sell_usd = Column(Float, default=134.0, nullable=False)
     buy_usd = Column(Float, default=126.0, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # incrémentée à chaque changement : invalide le cache FX des workers
+    version = Column(Integer, default=1, server_default="1", nullable=False)
+
+
+# devis FX déjà utilisés (usage unique, partagé entre workers) ; purgés
+# après expiration du devis
+class FxQuoteRedemption(Base):
+    __tablename__ = "fx_quote_redemptions"
+
+    jti = Column(String(32), primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    redeemed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
 
 
 # --- PARTNERS (où dépenser les crédits) ---
@@ -139,12 +210,18 @@ class PasswordReset(Base):
     __tablename__ = "password_resets"
 
     id = Column(Integer, primary_key=True)
-    email = Column(String, index=True, nullable=False)
-    token = Column(String, index=True, nullable=False)
+    email = Column(String, nullable=False)
+    # HMAC du code envoyé (jamais le code en clair) ; colonne historique "token"
+    token_hash = Column("token", String, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     expires_at = Column(DateTime, nullable=False)
     used = Column(Boolean, default=False, nullable=False)
 
+    __table_args__ = (
+        Index("ix_password_resets_email_token_used", "email", "token", "used"),
+        Index("ix_password_resets_expires_at", "expires_at"),
+    )
+
 
 class Merchant(Base):
     __tablename__ = "merchants"
@@ -178,4 +255,180 @@ class Subscription(Base):
 
     active = Column(Boolean, default=True)
 
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+# --- LEDGER (journal append-only + snapshots de solde) ---
+class LedgerEntry(Base):
+    __tablename__ = "ledger_entries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # pas de FK vers users : le journal survit à la suppression du compte
+    user_id = Column(Integer, nullable=False)
+    currency = Column(String, nullable=False)          # htg | usd
+    amount_minor = Column(BigInteger, nullable=False)  # centimes, signé (+crédit / -débit)
+    kind = Column(String, nullable=False)              # transfer | convert | spend | topup | ...
+    tx_id = Column(Integer, ForeignKey("transactions.id", ondelete="SET NULL"), nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    transaction = relationship("Transaction")
+
+    __table_args__ = (
+        Index("ix_ledger_entries_user_currency_id", "user_id", "currency", "id"),
+        Index("ix_ledger_entries_created_at", "created_at"),
+    )
+
+
+class BalanceSnapshot(Base):
+    __tablename__ = "balance_snapshots"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False)
+    currency = Column(String, nullable=False)
+    balance_minor = Column(BigInteger, nullable=False)
+    # solde cumulé jusqu'à cette écriture incluse
+    last_entry_id = Column(Integer, nullable=False)
+    as_of = Column(DateTime, nullable=False)
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        # unique : plusieurs workers peuvent poser le même snapshot (ON CONFLICT DO NOTHING)
+        Index("ux_balance_snapshots_user_currency_entry", "user_id", "currency", "last_entry_id", unique=True),
+        Index("ix_balance_snapshots_user_currency_as_of", "user_id", "currency", "as_of"),
+    )
+
+
+class WorkerCursor(Base):
+    """Position persistante d'un thread de fond (dernier id traité)."""
+    __tablename__ = "worker_cursors"
+
+    name = Column(String, primary_key=True)
+    position = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+@event.listens_for(LedgerEntry, "before_update")
+@event.listens_for(LedgerEntry, "before_delete")
+def _ledger_is_append_only(mapper, connection, target):
+    raise RuntimeError("ledger_entries est append-only")
+
+
+# --- IDEMPOTENCE (rejeu des requêtes monétaires) ---
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False)
+    endpoint = Column(String(60), nullable=False)
+    key = Column(String(120), nullable=False)
+
+    status = Column(String, default="pending", nullable=False)  # pending | done
+    response_body = Column(Text, nullable=True)                  # JSON de la réponse d'origine
+    request_hash = Column(String(64), nullable=True)             # sha256(méthode, chemin, corps)
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ux_idempotency_keys_user_endpoint_key", "user_id", "endpoint", "key", unique=True),
+        Index("ix_idempotency_keys_expires_at", "expires_at"),
+    )
+
+
+# --- REFRESH TOKENS (opaques, seul le hash est stocké) ---
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    token_hash = Column(String(64), unique=True, nullable=False, index=True)  # sha256 hex
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked_at = Column(DateTime, nullable=True)
+    # token émis en remplacement (rotation) : distingue une course entre deux
+    # onglets d'une vraie réutilisation
+    replaced_by_id = Column(Integer, nullable=True)
+
+
+# révocations d'access tokens, lues par le thread de rechargement de chaque
+# worker ; pas de FK : doit survivre à la suppression du compte
+class TokenRevocation(Base):
+    __tablename__ = "token_revocations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False)
+    min_version = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+# --- OUTBOX EMAIL (envoyé par un thread, pas par la requête) ---
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    to_email = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(Text, nullable=False)
+
+    status = Column(String, default="pending", nullable=False)  # pending | sent | failed
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_error = Column(String, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_email_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+
+# --- ROLLUP REVENUS (frais des recharges approuvées, par jour) ---
+class RevenueDaily(Base):
+    __tablename__ = "revenue_daily"
+
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False)          # date UTC de decided_at
+    currency = Column(String, nullable=False)
+    method = Column(String, nullable=False)
+
+    topup_count = Column(Integer, default=0, nullable=False)
+    amount_total = Column(Float, default=0.0, nullable=False)
+    fee_total = Column(Float, default=0.0, nullable=False)
+    net_total = Column(Float, default=0.0, nullable=False)
+
+    __table_args__ = (
+        Index("ux_revenue_daily_day_currency_method", "day", "currency", "method", unique=True),
+    )
+
+
+# --- JOBS D'EXPORT (fichiers produits en tâche de fond) ---
+class ExportJob(Base):
+    __tablename__ = "export_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    requested_by = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+    format = Column(String, nullable=False)               # csv | ndjson | parquet
+    gzip = Column(Boolean, default=False, nullable=False)
+    filters = Column(Text, nullable=False, default="{}")  # JSON (filtres de l'export admin)
+
+    status = Column(String, default="pending", nullable=False)  # pending | running | done | failed | expired
+    file_path = Column(String, nullable=True)
+    row_count = Column(Integer, nullable=True)
+    size_bytes = Column(BigInteger, nullable=True)
+    error = Column(String, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # réservation en cours : n° de tentative (jeton du worker) et dernier signe de vie
+    attempt = Column(Integer, default=0, nullable=False)
+    heartbeat_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_export_jobs_status_id", "status", "id"),
+    )
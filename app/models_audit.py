@@ -8,7 +8,9 @@ class AuditLog(Base):
     __tablename__ = "audit_logs"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, nullable=True)
+    user_id = Column(Integer, nullable=True)          # auteur
     action = Column(String, nullable=False)
     ip_address = Column(String, nullable=True)
+    target_user_id = Column(Integer, nullable=True)   # compte visé (actions admin)
+    detail = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
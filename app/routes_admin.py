@@ -4,10 +4,11 @@ from pydantic import BaseModel, EmailStr, Field
 from sqlalchemy.orm import Session
 import secrets
 from .models import Merchant
-from .db import get_db
-from .models import FxSetting, User, Transaction
+from .db import get_db, engine, async_engine, pool_status
+from .models import User, Transaction
 from .schemas import FxIn, FxOut
 from .security import require_admin
+from .Services import wallet_engine, audit, fx as fx_rates
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -17,27 +18,27 @@ router = APIRouter(prefix="/admin", tags=["admin"])
 # -------------------------
 @router.get("/fx", response_model=FxOut)
 def get_fx(db: Session = Depends(get_db), admin=Depends(require_admin)):
-    fx = db.query(FxSetting).first()
-    if not fx:
-        fx = FxSetting(sell_usd=134.0, buy_usd=126.0)
-        db.add(fx)
-        db.commit()
-        db.refresh(fx)
+    fx = fx_rates.current(db)
     return FxOut(sell_usd=fx.sell_usd, buy_usd=fx.buy_usd)
 
 
 @router.post("/fx", response_model=FxOut)
 def set_fx(data: FxIn, db: Session = Depends(get_db), admin=Depends(require_admin)):
-    fx = db.query(FxSetting).first()
-    if not fx:
-        fx = FxSetting()
-        db.add(fx)
-    fx.sell_usd = float(data.sell_usd)
-    fx.buy_usd = float(data.buy_usd)
-    db.commit()
+    fx = fx_rates.set_rates(db, data.sell_usd, data.buy_usd)
     return FxOut(sell_usd=fx.sell_usd, buy_usd=fx.buy_usd)
 
 
+# -------------------------
+# DB POOL (saturation)
+# -------------------------
+@router.get("/db/pool")
+def db_pool(admin=Depends(require_admin)):
+    return {
+        "sync": pool_status(engine),
+        "async": pool_status(async_engine.sync_engine),
+    }
+
+
 # =========================================================
 # ADMIN — WALLET ADJUST (Débiter / Créditer)
 # POST /admin/wallet/adjust
@@ -77,20 +78,6 @@ def admin_wallet_adjust(
     if not u:
         raise HTTPException(status_code=404, detail="Utilisateur introuvable")
 
-    # Sécurité: empêche solde négatif
-    if currency == "htg":
-        current = float(u.wallet.htg or 0)
-        new_val = current + amount
-        if new_val < 0:
-            raise HTTPException(status_code=400, detail="Solde HTG insuffisant pour débiter")
-        u.wallet.htg = new_val
-    else:
-        current = float(u.wallet.usd or 0)
-        new_val = current + amount
-        if new_val < 0:
-            raise HTTPException(status_code=400, detail="Solde USD insuffisant pour débiter")
-        u.wallet.usd = new_val
-
     # Audit: transaction "admin_adjust"
     # (si tes champs Transaction diffèrent, je l'adapte)
     tx = Transaction(
@@ -105,9 +92,21 @@ def admin_wallet_adjust(
     )
     db.add(tx)
 
+    # Sécurité: empêche solde négatif (débit gardé côté base)
+    if amount > 0:
+        ok = wallet_engine.credit(db, u.id, currency, amount, "admin_adjust", tx=tx)
+    else:
+        ok = wallet_engine.debit(db, u.id, currency, -amount, "admin_adjust", tx=tx)
+    if not ok:
+        raise HTTPException(status_code=400, detail=f"Solde {currency.upper()} insuffisant pour débiter")
+
     db.commit()
     db.refresh(tx)
     db.refresh(u)
+    audit.record(
+        "wallet_adjust", user_id=admin.id, target_user_id=u.id,
+        detail=f"{currency} {amount:+} tx={tx.id}",
+    )
 
     return WalletAdjustOut(
         email=u.email,
@@ -1,10 +1,14 @@
-from fastapi import APIRouter, Depends
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 
 from .db import get_db
 from .models import Transaction, User
 from .security import require_admin
+from .Services import analytics
 
 router = APIRouter(prefix="/admin/fees", tags=["admin"])
 
@@ -13,12 +17,50 @@ def fees_stats(
     db: Session = Depends(get_db),
     admin: User = Depends(require_admin),
 ):
-    # total par devise
+    # total par devise : frais retenus sur les recharges (fee_amount),
+    # la même source que /analytics
     rows = (
-        db.query(Transaction.currency, func.sum(Transaction.amount))
-        .filter(Transaction.type == "fee")
+        db.query(Transaction.currency, func.sum(Transaction.fee_amount))
+        .filter(Transaction.fee_amount.isnot(None))
         .group_by(Transaction.currency)
         .all()
     )
     totals = {cur: float(total or 0) for (cur, total) in rows}
     return {"totals": totals}
+
+
+@router.get("/analytics")
+def fees_analytics(
+    bucket: str = Query("day", description="hour | day | week | month"),
+    from_dt: Optional[datetime] = Query(None),
+    to_dt: Optional[datetime] = Query(None),
+    group_by: str = Query("", description="currency,type,direction,method"),
+    currency: Optional[str] = Query(None, description="liste séparée par des virgules"),
+    type: Optional[str] = Query(None),
+    direction: Optional[str] = Query(None),
+    method: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+    admin: User = Depends(require_admin),
+):
+    # volume / nombre / frais par période, découpés à la demande : servi
+    # par le cube NumPy en mémoire, pas par un GROUP BY sur transactions
+    if bucket not in analytics.BUCKETS:
+        raise HTTPException(status_code=400, detail="bucket invalide (hour/day/week/month)")
+
+    dims = tuple(d.strip().lower() for d in group_by.split(",") if d.strip())
+    if any(d not in analytics.DIMENSIONS for d in dims):
+        raise HTTPException(status_code=400, detail="group_by invalide (currency/type/direction/method)")
+
+    filters = {}
+    for dim, value in (("currency", currency), ("type", type), ("direction", direction), ("method", method)):
+        if value:
+            filters[dim] = [v.strip().lower() for v in value.split(",") if v.strip()]
+
+    cube = analytics.cube(db)
+    rows = cube.query(bucket=bucket, start=from_dt, end=to_dt, filters=filters, group_by=dims)
+    return {
+        "bucket": bucket,
+        "group_by": list(dims),
+        "as_of": cube.as_of.isoformat() if cube.as_of else None,
+        "rows": rows,
+    }
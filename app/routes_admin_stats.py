@@ -1,92 +1,70 @@
-from datetime import datetime, timedelta
+from datetime import datetime, date
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
+from sqlalchemy import func
 
 from .db import get_db
-from .models import TopupRequest, User
+from .models import RevenueDaily, User
 from .security import require_admin
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
 
+def _month_start(d: date, months_back: int) -> date:
+    y, m = divmod(d.year * 12 + d.month - 1 - months_back, 12)
+    return date(y, m + 1, 1)
+
+
 @router.get("/stats")
 def revenue_stats(
     db: Session = Depends(get_db),
     admin: User = Depends(require_admin),
 ):
+    # lu dans le rollup revenue_daily (alimenté à l'approbation des
+    # recharges) : deux petites requêtes au lieu de 15 SUM sur topup_requests
     today = datetime.utcnow().date()
-    now = datetime.utcnow()
+    first_month = _month_start(today, 11)
 
     # -------------------------
     # TOTAL CUMULÉ (APPROVED)
     # -------------------------
-    total = (
-        db.query(func.coalesce(func.sum(TopupRequest.fee_amount), 0))
-        .filter(
-            TopupRequest.status == "APPROVED",
-            TopupRequest.decided_at != None
-        )
-        .scalar()
-    )
+    total = db.query(func.coalesce(func.sum(RevenueDaily.fee_total), 0)).scalar()
 
     # -------------------------
-    # REVENUS AUJOURD’HUI
+    # 12 DERNIERS MOIS (par jour)
     # -------------------------
-    today_sum = (
-        db.query(func.coalesce(func.sum(TopupRequest.fee_amount), 0))
-        .filter(
-            TopupRequest.status == "APPROVED",
-            TopupRequest.decided_at != None,
-            func.date(TopupRequest.decided_at) == today
-        )
-        .scalar()
+    rows = (
+        db.query(RevenueDaily.day, RevenueDaily.currency, RevenueDaily.fee_total)
+        .filter(RevenueDaily.day >= first_month)
+        .all()
     )
 
-    # -------------------------
-    # REVENUS CE MOIS
-    # -------------------------
-    month_sum = (
-        db.query(func.coalesce(func.sum(TopupRequest.fee_amount), 0))
-        .filter(
-            TopupRequest.status == "APPROVED",
-            TopupRequest.decided_at != None,
-            extract("year", TopupRequest.decided_at) == now.year,
-            extract("month", TopupRequest.decided_at) == now.month
-        )
-        .scalar()
-    )
+    today_sum = 0.0
+    month_sum = 0.0
+    by_month = {}
+    by_currency = {}
+    for day, currency, fee in rows:
+        fee = float(fee or 0)
+        by_month[(day.year, day.month)] = by_month.get((day.year, day.month), 0.0) + fee
+        if day == today:
+            today_sum += fee
+        if (day.year, day.month) == (today.year, today.month):
+            month_sum += fee
+            by_currency[currency] = by_currency.get(currency, 0.0) + fee
 
-    # -------------------------
-    # GRAPH MENSUEL (12 derniers mois)
-    # -------------------------
     monthly_data = []
-
-    for i in range(12):
-        month_date = now - timedelta(days=i * 30)
-
-        month_total = (
-            db.query(func.coalesce(func.sum(TopupRequest.fee_amount), 0))
-            .filter(
-                TopupRequest.status == "APPROVED",
-                TopupRequest.decided_at != None,
-                extract("year", TopupRequest.decided_at) == month_date.year,
-                extract("month", TopupRequest.decided_at) == month_date.month
-            )
-            .scalar()
-        )
-
+    for i in range(11, -1, -1):
+        m = _month_start(today, i)
         monthly_data.append({
-            "year": month_date.year,
-            "month": month_date.month,
-            "total": float(month_total)
+            "year": m.year,
+            "month": m.month,
+            "total": by_month.get((m.year, m.month), 0.0),
         })
 
-    monthly_data.reverse()
-
     return {
-        "today": float(today_sum),
-        "month": float(month_sum),
+        "today": today_sum,
+        "month": month_sum,
         "total": float(total),
-        "monthly": monthly_data
-    }
\ No newline at end of file
+        "monthly": monthly_data,
+        "month_by_currency": by_currency,
+    }
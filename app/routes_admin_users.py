@@ -1,10 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import select, func, case, and_, true
 from sqlalchemy.orm import Session
 
 from .db import get_db
-from .models import User
+from .models import User, Wallet, LedgerEntry
 from .models import Transaction
-from .security import require_admin, require_superadmin
+from .Services.ledger import MINOR_UNITS, from_minor
+from .security import require_admin, require_superadmin, revoke_user_tokens
+from .Services import audit, user_directory
 
 router = APIRouter(
     prefix="/admin/users",
@@ -16,15 +22,24 @@ router = APIRouter(
 # ======================================================
 @router.get("", response_model=list[dict])
 def list_users_superadmin(
+    response: Response,
+    q: Optional[str] = Query(None, description="préfixe d'email, téléphone, prénom ou nom"),
+    role: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    created_from: Optional[datetime] = Query(None),
+    created_to: Optional[datetime] = Query(None),
+    cursor: Optional[int] = Query(None, description="X-Next-Cursor de la page précédente"),
+    limit: int = Query(user_directory.PAGE_DEFAULT, ge=1, le=user_directory.PAGE_MAX),
     db: Session = Depends(get_db),
     sa: User = Depends(require_superadmin),
 ):
-    rows = (
-        db.query(User)
-        .order_by(User.id.desc())
-        .limit(200)
-        .all()
-    )
+    # paginé par keyset : total dans X-Total-Count, page suivante via X-Next-Cursor
+    filters = dict(q=q, role=role, status=status, created_from=created_from, created_to=created_to)
+    rows, next_cursor = user_directory.search(db, cursor=cursor, limit=limit, **filters)
+
+    response.headers["X-Total-Count"] = str(user_directory.count(db, **filters))
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
     return [
         {
             "id": u.id,
@@ -41,10 +56,23 @@ def list_users_superadmin(
 # ======================================================
 @router.get("/users", response_model=list[dict])
 def list_users_admin(
+    response: Response,
+    q: Optional[str] = Query(None, description="préfixe d'email, téléphone, prénom ou nom"),
+    role: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    created_from: Optional[datetime] = Query(None),
+    created_to: Optional[datetime] = Query(None),
+    cursor: Optional[int] = Query(None, description="X-Next-Cursor de la page précédente"),
+    limit: int = Query(user_directory.PAGE_DEFAULT, ge=1, le=user_directory.PAGE_MAX),
     db: Session = Depends(get_db),
     admin: User = Depends(require_admin),
 ):
-    rows = db.query(User).order_by(User.id.desc()).all()
+    filters = dict(q=q, role=role, status=status, created_from=created_from, created_to=created_to)
+    rows, next_cursor = user_directory.search(db, cursor=cursor, limit=limit, **filters)
+
+    response.headers["X-Total-Count"] = str(user_directory.count(db, **filters))
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
     return [
         {
             "id": u.id,
@@ -75,7 +103,10 @@ def change_user_status(
         raise HTTPException(status_code=404, detail="Utilisateur introuvable")
 
     user.status = status
+    # invariant : pas de changement de statut sans révocation (cf. models.User)
+    revoke_user_tokens(db, user)
     db.commit()
+    audit.record("user_status_change", user_id=admin.id, target_user_id=user.id, detail=f"status={status}")
 
     return {
         "ok": True,
@@ -109,7 +140,9 @@ def set_user_role(
         )
 
     user.role = role
+    revoke_user_tokens(db, user)
     db.commit()
+    audit.record("user_role_change", user_id=sa.id, target_user_id=user.id, detail=f"role={role}")
 
     return {
         "ok": True,
@@ -117,49 +150,101 @@ def set_user_role(
         "role": user.role,
     }
 
+WALLET_VIEW_TOTALS_DAYS = 30
+
+
 @router.get("/users/{user_id}/wallet")
 def admin_view_user_wallet(
     user_id: int,
+    cursor: Optional[int] = Query(None, description="next_cursor de la page précédente"),
+    limit: int = Query(50, ge=1, le=200),
     db: Session = Depends(get_db),
     admin: User = Depends(require_admin),
 ):
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
+    """Compte + wallet + page de transactions (keyset, id décroissant) +
+    entrées / sorties par devise sur 30 jours, en une seule requête SQL.
+
+    Les totaux viennent du journal (montants signés en unités mineures)."""
+    since = datetime.utcnow() - timedelta(days=WALLET_VIEW_TOTALS_DAYS)
+
+    page = select(
+        Transaction.id, Transaction.type, Transaction.currency,
+        Transaction.amount, Transaction.note, Transaction.created_at,
+    ).where(Transaction.user_id == user_id)
+    if cursor is not None:
+        page = page.where(Transaction.id < cursor)
+    page = page.order_by(Transaction.id.desc()).limit(limit + 1).subquery("page")
+
+    def _flow(cur, inbound):
+        signed = LedgerEntry.amount_minor > 0 if inbound else LedgerEntry.amount_minor < 0
+        return func.coalesce(func.sum(case(
+            (and_(LedgerEntry.currency == cur, signed), func.abs(LedgerEntry.amount_minor)),
+            else_=0,
+        )), 0).label(f"{cur}_{'in' if inbound else 'out'}")
+
+    totals = select(
+        *[_flow(cur, inbound) for cur in MINOR_UNITS for inbound in (True, False)]
+    ).where(LedgerEntry.user_id == user_id, LedgerEntry.created_at >= since).subquery("totals")
+
+    stmt = (
+        select(
+            User.id, User.email, User.status, User.role, Wallet.htg, Wallet.usd,
+            totals,
+            page.c.id.label("tx_id"), page.c.type.label("tx_type"), page.c.currency.label("tx_currency"),
+            page.c.amount.label("tx_amount"), page.c.note.label("tx_note"), page.c.created_at.label("tx_created_at"),
+        )
+        .select_from(User)
+        .outerjoin(Wallet, Wallet.user_id == User.id)
+        .join(totals, true())
+        .outerjoin(page, true())
+        .where(User.id == user_id)
+        .order_by(page.c.id.desc())
+    )
+    rows = db.execute(stmt).mappings().all()
+
+    if not rows:
         raise HTTPException(404, "Utilisateur introuvable")
 
-    if not user.wallet:
+    head = rows[0]
+    if head["htg"] is None and head["usd"] is None:
         return {
-            "user_id": user.id,
+            "user_id": head["id"],
             "wallet": None,
             "transactions": []
         }
 
-    transactions = (
-        db.query(Transaction)
-        .filter(Transaction.user_id == user.id)
-        .order_by(Transaction.created_at.desc())
-        .limit(200)
-        .all()
-    )
+    txs = [r for r in rows if r["tx_id"] is not None]
+    next_cursor = None
+    if len(txs) > limit:
+        txs = txs[:limit]
+        next_cursor = txs[-1]["tx_id"]
 
     return {
-        "user_id": user.id,
-        "email": user.email,
-        "status": user.status,
-        "role": user.role,
+        "user_id": head["id"],
+        "email": head["email"],
+        "status": head["status"],
+        "role": head["role"],
         "wallet": {
-            "htg": user.wallet.htg,
-            "usd": user.wallet.usd,
+            "htg": head["htg"],
+            "usd": head["usd"],
+        },
+        "totals_30d": {
+            cur: {
+                "in": from_minor(head[f"{cur}_in"], cur),
+                "out": from_minor(head[f"{cur}_out"], cur),
+            }
+            for cur in MINOR_UNITS
         },
         "transactions": [
             {
-                "id": tx.id,
-                "type": tx.type,
-                "currency": tx.currency,
-                "amount": tx.amount,
-                "note": tx.note,
-                "created_at": tx.created_at,
+                "id": r["tx_id"],
+                "type": r["tx_type"],
+                "currency": r["tx_currency"],
+                "amount": r["tx_amount"],
+                "note": r["tx_note"],
+                "created_at": r["tx_created_at"],
             }
-            for tx in transactions
-        ]
+            for r in txs
+        ],
+        "next_cursor": next_cursor,
     }
@@ -6,6 +6,7 @@ from .db import get_db
 from .models import User, Transaction
 from .schemas import AdminAdjustIn, AdminAdjustOut
 from .security import get_current_user
+from .Services import wallet_engine, audit
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -33,16 +34,6 @@ def admin_adjust_wallet(
     if amt == 0:
         raise HTTPException(status_code=400, detail="Montant invalide (≠ 0)")
 
-    # apply
-    if data.currency == "htg":
-        u.wallet.htg = float(u.wallet.htg) + amt
-        if float(u.wallet.htg) < 0:
-            raise HTTPException(status_code=400, detail="Solde HTG deviendrait négatif")
-    else:
-        u.wallet.usd = float(u.wallet.usd) + amt
-        if float(u.wallet.usd) < 0:
-            raise HTTPException(status_code=400, detail="Solde USD deviendrait négatif")
-
     note = (data.note or "").strip()
     tx = Transaction(
         user_id=u.id,
@@ -55,7 +46,19 @@ def admin_adjust_wallet(
         created_at=datetime.utcnow(),
     )
     db.add(tx)
+
+    # apply
+    if amt > 0:
+        ok = wallet_engine.credit(db, u.id, data.currency, amt, "admin_adjust", tx=tx)
+    else:
+        ok = wallet_engine.debit(db, u.id, data.currency, -amt, "admin_adjust", tx=tx)
+    if not ok:
+        raise HTTPException(status_code=400, detail=f"Solde {data.currency.upper()} deviendrait négatif")
     db.commit()
+    audit.record(
+        "wallet_adjust", user_id=admin.id, target_user_id=u.id,
+        detail=f"{data.currency} {amt:+} tx={tx.id}",
+    )
 
     return AdminAdjustOut(
         ok=True,
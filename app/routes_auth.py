@@ -1,27 +1,41 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from sqlalchemy.exc import OperationalError
-from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime
+import os
 import string
-import secrets
-import time
-from .db import get_db
-from .models import User, Wallet, PasswordReset
-from .models_audit import AuditLog
+from .db import get_db, get_async_db
+from .models import User, Wallet
+from .Services import audit
 from .schemas import (
-    TokenOut, MeOut,
+    TokenOut, RefreshIn, MeOut,
     RegisterIn,
     ForgotPasswordIn, ForgotPasswordOut,
     ResetPasswordIn, ResetPasswordOut,
     ChangePasswordSchema
 )
 from .security import (
-    hash_password,
-    verify_password,
+    hash_password_async,
+    verify_password_async,
+    verify_and_update_async,
     create_access_token,
+    create_refresh_token,
+    find_refresh_token,
+    rotate_refresh_token,
+    in_reuse_grace,
+    revoke_refresh_tokens,
+    revoke_user_tokens,
+    ACCESS_TOKEN_EXPIRE_MINUTES,
     get_current_user,
+    get_current_user_async,
+    Principal,
 )
+from .Services.rate_limit import SlidingWindowLimiter, ProgressiveDelay, client_ip
+from .Services import password_reset
+from .Services.mailer import enqueue as enqueue_email
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -41,22 +55,43 @@ def validate_password(pwd: str):
 # -------------------------------------------------
 # Parrainage
 # -------------------------------------------------
-def generate_ref_code(db: Session, length=8):
-    alphabet = string.ascii_uppercase + string.digits
-    while True:
-        code = "".join(secrets.choice(alphabet) for _ in range(length))
-        try:
-            exists = db.query(User).filter(User.ref_code == code).first()
-        except OperationalError:
-            return code
-        if not exists:
-            return code
+# Code dérivé de user.id par une bijection (multiplication modulaire) puis
+# base 36 : unique par construction, sans aucune requête, et non séquentiel
+# à l'œil. 9 caractères : les anciens codes aléatoires en font 8, donc
+# aucune collision possible avec eux. Ne pas changer les constantes.
+REF_ALPHABET = string.digits + string.ascii_uppercase
+REF_LENGTH = 9
+REF_SPACE = 36 ** REF_LENGTH
+REF_MULT = 2654435761   # premier avec 36 => inversible modulo REF_SPACE
+REF_OFFSET = 0x2F1A5B3C7
+REF_MULT_INV = pow(REF_MULT, -1, REF_SPACE)
+
+
+def ref_code_for(user_id: int) -> str:
+    n = (user_id * REF_MULT + REF_OFFSET) % REF_SPACE
+    chars = []
+    for _ in range(REF_LENGTH):
+        n, r = divmod(n, 36)
+        chars.append(REF_ALPHABET[r])
+    return "".join(reversed(chars))
+
+
+def user_id_from_ref_code(code: str) -> int | None:
+    """Inverse de ref_code_for (None pour un ancien code aléatoire)."""
+    code = (code or "").strip().upper()
+    if len(code) != REF_LENGTH or any(c not in REF_ALPHABET for c in code):
+        return None
+    n = 0
+    for c in code:
+        n = n * 36 + REF_ALPHABET.index(c)
+    return ((n - REF_OFFSET) * REF_MULT_INV) % REF_SPACE
 
 # -------------------------------------------------
 # REGISTER
 # -------------------------------------------------
 @router.post("/register")
-def register(data: RegisterIn, db: Session = Depends(get_db)):
+async def register(data: RegisterIn, adb: AsyncSession = Depends(get_async_db)):
+    # async comme /login : le hachage attend le pool sans bloquer de thread
 
     email = data.email.lower().strip()
     password = data.password.strip()
@@ -66,36 +101,43 @@ def register(data: RegisterIn, db: Session = Depends(get_db)):
 
     validate_password(password)
 
-    existing = db.query(User).filter(User.email == email).first()
+    existing = (await adb.execute(select(User.id).where(User.email == email))).first()
     if existing:
         raise HTTPException(400, "Email déjà utilisé")
 
-    my_ref_code = generate_ref_code(db)
-
     referred_by_user_id = None
     if ref:
-        ref_user = db.query(User).filter(User.ref_code == ref).first()
+        # code dérivé : lookup par clé primaire ; ancien code aléatoire : par ref_code
+        ref_id = user_id_from_ref_code(ref)
+        if ref_id is not None:
+            stmt = select(User.id).where(User.id == ref_id)
+        else:
+            stmt = select(User.id).where(User.ref_code == ref.strip().upper())
+        ref_user = (await adb.execute(stmt)).first()
         if ref_user:
             referred_by_user_id = ref_user.id
 
     user = User(
         email=email,
-        password_hash=hash_password(password),
+        password_hash=await hash_password_async(password),
         role="user",
         status="active",
         first_name=first_name,
         last_name=last_name,
-        ref_code=my_ref_code,
         referred_by_user_id=referred_by_user_id
     )
-
-    db.add(user)
-    db.commit()
-    db.refresh(user)
-
-    wallet = Wallet(user_id=user.id)
-    db.add(wallet)
-    db.commit()
+    user.wallet = Wallet(htg=0.0, usd=0.0)
+
+    # user + wallet + code de parrainage : une seule transaction
+    adb.add(user)
+    try:
+        await adb.flush()
+        user.ref_code = ref_code_for(user.id)
+        await adb.commit()
+    except IntegrityError:
+        # course sur le même email entre deux inscriptions
+        await adb.rollback()
+        raise HTTPException(400, "Email déjà utilisé")
 
     return {
         "ok": True,
@@ -112,101 +154,196 @@ def forgot_password(data: ForgotPasswordIn, db: Session = Depends(get_db)):
     email = data.email.lower().strip()
     user = db.query(User).filter(User.email == email).first()
 
-    token = "".join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(8))
-    now = datetime.utcnow()
-
-    if user:
-        pr = PasswordReset(
-            email=email,
-            token=token,
-            created_at=now,
-            expires_at=now + timedelta(minutes=15),
-            used=False,
+    # même réponse si l'email n'existe pas ou a déjà trop de codes en cours
+    token = password_reset.issue(db, email) if user else None
+    if token:
+        # le code ne part que par email : jamais dans les logs
+        enqueue_email(
+            db, email, "Haiti Wallet - code de réinitialisation",
+            f"Votre code de réinitialisation : {token}\n"
+            f"Il expire dans {password_reset.RESET_TOKEN_TTL_MINUTES} minutes.",
         )
-        db.add(pr)
         db.commit()
-        print(f"[RESET PASSWORD] email={email} token={token}")
+        print(f"[RESET PASSWORD] code émis pour email={email}")
 
     return ForgotPasswordOut(ok=True, message="Si l'email existe, un code a été envoyé")
 
 
 @router.post("/password/reset", response_model=ResetPasswordOut)
-def reset_password(data: ResetPasswordIn, db: Session = Depends(get_db)):
-    pr = (
-        db.query(PasswordReset)
-        .filter(
-            PasswordReset.email == data.email.lower(),
-            PasswordReset.token == data.token.upper(),
-            PasswordReset.used == False,
-        )
-        .order_by(PasswordReset.created_at.desc())
-        .first()
-    )
-    if not pr or pr.expires_at < datetime.utcnow():
+async def reset_password(data: ResetPasswordIn, adb: AsyncSession = Depends(get_async_db)):
+    email = data.email.lower().strip()
+    pr = await adb.run_sync(password_reset.find_valid, email, data.token)
+    if not pr:
         raise HTTPException(400, "Code invalide ou expiré")
 
-    user = db.query(User).filter(User.email == data.email.lower()).first()
+    user = (await adb.execute(select(User).where(User.email == email))).scalar_one_or_none()
     if not user:
         raise HTTPException(400, "Utilisateur introuvable")
 
-    user.password_hash = hash_password(data.new_password)
-    pr.used = True
-    db.commit()
+    user.password_hash = await hash_password_async(data.new_password)
+    await adb.run_sync(password_reset.consume_all, email)
+    # les sessions ouvertes avant le reset ne se renouvellent plus
+    await adb.run_sync(revoke_refresh_tokens, user.id)
+    await adb.commit()
 
     return ResetPasswordOut(ok=True, message="Mot de passe mis à jour")
 
 
 @router.post("/password/change")
-def change_password(
+async def change_password(
     data: ChangePasswordSchema,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    principal: Principal = Depends(get_current_user_async),
+    adb: AsyncSession = Depends(get_async_db),
 ):
-    if not verify_password(data.old_password, current_user.password_hash):
+    user = await adb.get(User, principal.id)
+    if not await verify_password_async(data.old_password, user.password_hash):
         raise HTTPException(400, "Ancien mot de passe incorrect")
 
-    current_user.password_hash = hash_password(data.new_password)
-    db.commit()
-    return {"ok": True, "message": "Password updated successfully"}
+    user.password_hash = await hash_password_async(data.new_password)
+    # un token volé (refresh ou access) ne survit pas au changement : tout est
+    # révoqué, et la session courante reçoit une nouvelle paire
+    await adb.run_sync(lambda db: revoke_user_tokens(db, user))
+    token = create_access_token(user)
+    refresh_token = create_refresh_token(adb, user.id)
+    await adb.commit()
+    return {
+        "ok": True,
+        "message": "Password updated successfully",
+        "access_token": token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
 
 
 # -------------------------------------------------
 # LOGIN
 # -------------------------------------------------
+# échecs comptés par IP (fenêtre glissante, blocage) et par email (délai
+# progressif plafonné : pas de verrouillage du compte par un tiers) ; au-delà
+# on refuse (429) sans même vérifier le mot de passe (pas de CPU argon2)
+LOGIN_WINDOW_SECONDS = int(os.getenv("LOGIN_WINDOW_SECONDS", "900"))
+login_email_limiter = ProgressiveDelay(
+    "login_email",
+    free=int(os.getenv("LOGIN_FREE_FAILURES_PER_EMAIL", "3")),
+    base=float(os.getenv("LOGIN_DELAY_BASE_SECONDS", "1")),
+    max_delay=float(os.getenv("LOGIN_DELAY_MAX_SECONDS", "30")),
+    window=LOGIN_WINDOW_SECONDS,
+)
+login_ip_limiter = SlidingWindowLimiter(
+    "login_ip", int(os.getenv("LOGIN_MAX_FAILURES_PER_IP", "20")), LOGIN_WINDOW_SECONDS
+)
+
+
 @router.post("/login", response_model=TokenOut)
-def login(
+async def login(
     request: Request,
     form: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db),
+    adb: AsyncSession = Depends(get_async_db),
 ):
+    # async : la vérification du mot de passe part dans le pool de hachage
+    # borné, aucun thread de requête n'est bloqué pendant ce temps
 
     email = form.username.strip().lower()
-    user = db.query(User).filter(User.email == email).one_or_none()
+    ip = client_ip(request)
+
+    retry = max(await login_email_limiter.retry_after(email), await login_ip_limiter.retry_after(ip))
+    if retry:
+        raise HTTPException(
+            429,
+            "Trop de tentatives, réessayez plus tard",
+            headers={"Retry-After": str(retry)},
+        )
+
+    user = (await adb.execute(select(User).where(User.email == email))).scalar_one_or_none()
 
-    if not user or not verify_password(form.password, user.password_hash):
-        time.sleep(1)
+    ok, new_hash = False, None
+    if user:
+        ok, new_hash = await verify_and_update_async(form.password, user.password_hash)
+
+    if not ok:
+        await login_email_limiter.hit(email)
+        await login_ip_limiter.hit(ip)
         raise HTTPException(401, "Email ou mot de passe incorrect")
 
+    await login_email_limiter.reset(email)
+
     if user.status != "active":
         raise HTTPException(403, "Compte suspendu ou banni")
 
-    token = create_access_token(subject=user.email)
+    # migration transparente bcrypt -> argon2 (ou nouveau coût)
+    if new_hash:
+        user.password_hash = new_hash
+
+    token = create_access_token(user)
+    refresh_token = create_refresh_token(adb, user.id)
+    await adb.commit()
+
+    audit.record("login_success", user_id=user.id, ip_address=ip)
+
+    return TokenOut(
+        access_token=token,
+        refresh_token=refresh_token,
+        expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    )
+
+
+# -------------------------------------------------
+# REFRESH / LOGOUT
+# -------------------------------------------------
+@router.post("/refresh", response_model=TokenOut)
+def refresh(data: RefreshIn, db: Session = Depends(get_db)):
+    # rotation : chaque refresh token ne sert qu'une fois
+    rt = find_refresh_token(db, data.refresh_token)
+    now = datetime.utcnow()
+
+    if not rt or rt.expires_at < now:
+        raise HTTPException(401, "Session expirée")
 
-    db.add(AuditLog(
-        user_id=user.id,
-        action="login_success",
-        ip_address=request.client.host if request.client else None,
-    ))
+    if rt.revoked_at is not None and not in_reuse_grace(db, rt, now):
+        # token déjà échangé (rotation) hors course légitime : probablement
+        # volé, on coupe toutes les sessions. Un token révoqué par logout /
+        # changement de mot de passe est simplement refusé : le rejouer ne
+        # doit pas couper la nouvelle session du propriétaire
+        if rt.replaced_by_id is not None:
+            revoke_refresh_tokens(db, rt.user_id)
+            db.commit()
+        raise HTTPException(401, "Session expirée")
+
+    user = db.get(User, rt.user_id)
+    if not user or user.status != "active":
+        raise HTTPException(401, "Session expirée")
+
+    new_refresh = rotate_refresh_token(db, rt)
     db.commit()
 
-    return TokenOut(access_token=token)
+    return TokenOut(
+        access_token=create_access_token(user),
+        refresh_token=new_refresh,
+        expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    )
+
+
+@router.post("/logout")
+def logout(data: RefreshIn, db: Session = Depends(get_db)):
+    rt = find_refresh_token(db, data.refresh_token)
+    if rt and rt.revoked_at is None:
+        rt.revoked_at = datetime.utcnow()
+        db.commit()
+    return {"ok": True}
 
 
 # -------------------------------------------------
 # ME
 # -------------------------------------------------
 @router.get("/me", response_model=MeOut)
-def me(user: User = Depends(get_current_user)):
+async def me(
+    principal: Principal = Depends(get_current_user_async),
+    adb: AsyncSession = Depends(get_async_db),
+):
+    user = (await adb.execute(
+        select(User).options(joinedload(User.wallet)).where(User.id == principal.id)
+    )).scalar_one()
     return MeOut(
         email=user.email,
         role=user.role,
@@ -247,26 +384,6 @@ from uuid import uuid4
 import os
 
 
-import smtplib
-from email.mime.text import MIMEText
-
-def send_email(to_email, content):
-    import os
-    import smtplib
-    from email.mime.text import MIMEText
-
-    smtp_user = os.getenv("SMTP_USER")
-    smtp_pass = os.getenv("SMTP_PASS")
-
-    msg = MIMEText(content)
-    msg["Subject"] = "Haiti Wallet Notification"
-    msg["From"] = smtp_user
-    msg["To"] = to_email
-
-    with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-        server.login(smtp_user, smtp_pass)
-        server.send_message(msg)
-
 from pydantic import BaseModel
 
 class DeleteAccountRequest(BaseModel):
@@ -277,7 +394,7 @@ class DeleteAccountRequest(BaseModel):
 
 
 @router.post("/request-delete-account")
-def request_delete_account(data: DeleteAccountRequest):
+def request_delete_account(data: DeleteAccountRequest, db: Session = Depends(get_db)):
 
     subject = "Demande de suppression de compte - Haiti Wallet"
 
@@ -292,6 +409,8 @@ def request_delete_account(data: DeleteAccountRequest):
     {data.reason}
     """
 
-    send_email("contacthaitiwallet@gmail.com", body)
+    # envoyé par le thread outbox : un SMTP lent ou en panne ne bloque plus la requête
+    enqueue_email(db, "contacthaitiwallet@gmail.com", subject, body)
+    db.commit()
 
     return {"message": "Request sent successfully"}
\ No newline at end of file
@@ -1,16 +1,20 @@
 # app/routes_export.py
 from datetime import datetime
-import csv
-from io import StringIO
 from typing import Optional
 
+import json
+
 from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse, FileResponse
 from sqlalchemy.orm import Session
 
-from .db import get_db
-from .security import get_current_user
-from .models import User, Transaction
+from .db import SessionLocal, get_db
+from .security import get_current_user, require_admin
+from .models import User, ExportJob
+from .schemas import ExportJobIn, ExportJobOut
+from .Services.export import TX_COLUMNS, transactions_stmt, iter_rows, csv_chunks, gzip_chunks
+from .Services import export_jobs
 
 router = APIRouter(prefix="/export", tags=["export"])
 
@@ -28,66 +32,55 @@ def _dt(v: Optional[str]) -> Optional[datetime]:
         raise HTTPException(status_code=400, detail=f"Date invalide: {v} (format ISO attendu)")
 
 
-def _tx_to_row(tx: Transaction, user_email: str) -> list:
-    created = tx.created_at.isoformat() if tx.created_at else ""
-    return [
-        tx.id,
-        user_email,
-        tx.type,
-        tx.currency,
-        float(tx.amount),
-        tx.note or "",
-        tx.direction or "",
-        float(tx.rate_used) if tx.rate_used is not None else "",
-        created,
-    ]
+def _stream_csv(stmt, filename: str, gzip: bool) -> StreamingResponse:
+    """Réponse CSV en flux. La session est ouverte par le générateur : celle
+    de get_db est fermée avant que le corps de la réponse soit envoyé."""
+
+    def body():
+        db = SessionLocal()
+        try:
+            chunks = csv_chunks(TX_COLUMNS, iter_rows(db, stmt))
+            yield from gzip_chunks(chunks) if gzip else chunks
+        finally:
+            db.close()
+
+    if gzip:
+        filename += ".gz"
+    return StreamingResponse(
+        body(),
+        media_type="application/gzip" if gzip else "text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 
 @router.get("/me/transactions.csv")
 def export_my_transactions_csv(
-    db: Session = Depends(get_db),
     me: User = Depends(get_current_user),
     from_dt: Optional[str] = Query(None, description="ISO datetime ou date (YYYY-MM-DD)"),
     to_dt: Optional[str] = Query(None, description="ISO datetime ou date (YYYY-MM-DD)"),
-) -> Response:
+    gzip: bool = Query(False, description="Compresser (transactions.csv.gz)"),
+) -> StreamingResponse:
     """User export: only his transactions."""
     f = _dt(from_dt)
     t = _dt(to_dt)
 
-    q = db.query(Transaction).filter(Transaction.user_id == me.id)
-    if f:
-        q = q.filter(Transaction.created_at >= f)
-    if t:
-        q = q.filter(Transaction.created_at <= t)
-
-    q = q.order_by(Transaction.created_at.desc(), Transaction.id.desc())
-    rows = q.all()
-
-    buf = StringIO()
-    w = csv.writer(buf)
-    w.writerow(["id", "user_email", "type", "currency", "amount", "note", "direction", "rate_used", "created_at"])
-    for tx in rows:
-        w.writerow(_tx_to_row(tx, me.email))
+    stmt = transactions_stmt(user_id=me.id, from_dt=f, to_dt=t)
 
     filename = f"transactions_{me.email}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.csv"
-    return Response(
-        content=buf.getvalue(),
-        media_type="text/csv; charset=utf-8",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
-    )
+    return _stream_csv(stmt, filename, gzip)
 
 
 @router.get("/admin/transactions.csv")
 def export_admin_transactions_csv(
-    db: Session = Depends(get_db),
     me: User = Depends(get_current_user),
     user_email: Optional[str] = Query(None, description="Filtrer sur un email"),
     tx_type: Optional[str] = Query(None, description="Ex: transfer, convert, topup_request, topup_approved, ..."),
     currency: Optional[str] = Query(None, description="htg ou usd"),
     from_dt: Optional[str] = Query(None, description="ISO datetime ou date (YYYY-MM-DD)"),
     to_dt: Optional[str] = Query(None, description="ISO datetime ou date (YYYY-MM-DD)"),
-    limit: int = Query(5000, ge=1, le=50000),
-) -> Response:
+    limit: Optional[int] = Query(None, ge=1, description="Pas de limite par défaut"),
+    gzip: bool = Query(False, description="Compresser (transactions.csv.gz)"),
+) -> StreamingResponse:
     """Admin export: all transactions, optional filters."""
     if me.role != "admin":
         raise HTTPException(status_code=403, detail="Accès admin requis")
@@ -95,31 +88,79 @@ def export_admin_transactions_csv(
     f = _dt(from_dt)
     t = _dt(to_dt)
 
-    q = db.query(Transaction, User.email).join(User, User.id == Transaction.user_id)
+    stmt = transactions_stmt(
+        user_email=user_email, tx_type=tx_type, currency=currency,
+        from_dt=f, to_dt=t, limit=limit,
+    )
+
+    filename = f"transactions_ALL_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.csv"
+    return _stream_csv(stmt, filename, gzip)
 
-    if user_email:
-        q = q.filter(User.email == user_email.strip().lower())
-    if tx_type:
-        q = q.filter(Transaction.type == tx_type.strip())
-    if currency:
-        q = q.filter(Transaction.currency == currency.strip().lower())
-    if f:
-        q = q.filter(Transaction.created_at >= f)
-    if t:
-        q = q.filter(Transaction.created_at <= t)
 
-    q = q.order_by(Transaction.created_at.desc(), Transaction.id.desc()).limit(limit)
-    rows = q.all()
+# -------------------------
+# JOBS D'EXPORT (gros volumes)
+# -------------------------
+def _job_out(job: ExportJob) -> ExportJobOut:
+    out = ExportJobOut.model_validate(job)
+    if job.status == "done":
+        out.download_url = f"/export/admin/jobs/{job.id}/download"
+    return out
 
-    buf = StringIO()
-    w = csv.writer(buf)
-    w.writerow(["id", "user_email", "type", "currency", "amount", "note", "direction", "rate_used", "created_at"])
-    for tx, email in rows:
-        w.writerow(_tx_to_row(tx, email))
 
-    filename = f"transactions_ALL_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.csv"
-    return Response(
-        content=buf.getvalue(),
-        media_type="text/csv; charset=utf-8",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+def _get_job(db: Session, job_id: int, admin: User) -> ExportJob:
+    job = db.query(ExportJob).filter(ExportJob.id == job_id).first()
+    if not job or (job.requested_by != admin.id and admin.role != "superadmin"):
+        raise HTTPException(status_code=404, detail="Export introuvable")
+    return job
+
+
+@router.post("/admin/jobs", response_model=ExportJobOut, status_code=202)
+def create_export_job(
+    data: ExportJobIn,
+    db: Session = Depends(get_db),
+    admin: User = Depends(require_admin),
+):
+    """Mêmes filtres que /export/admin/transactions.csv ; le fichier est
+    produit en tâche de fond, interroger GET /export/admin/jobs/{id}."""
+    if data.format == "parquet" and not export_jobs.parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet indisponible (pyarrow non installé)")
+
+    filters = data.model_dump(include={"user_email", "tx_type", "currency", "from_dt", "to_dt", "limit"},
+                              exclude_none=True)
+    job = ExportJob(
+        requested_by=admin.id,
+        format=data.format,
+        gzip=data.gzip,
+        filters=json.dumps(jsonable_encoder(filters)),
+        status="pending",
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return _job_out(job)
+
+
+@router.get("/admin/jobs/{job_id}", response_model=ExportJobOut)
+def get_export_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    admin: User = Depends(require_admin),
+):
+    return _job_out(_get_job(db, job_id, admin))
+
+
+@router.get("/admin/jobs/{job_id}/download")
+def download_export_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    admin: User = Depends(require_admin),
+):
+    job = _get_job(db, job_id, admin)
+    if job.status != "done" or not job.file_path:
+        raise HTTPException(status_code=409, detail=f"Export non disponible (statut: {job.status})")
+
+    return FileResponse(
+        job.file_path,
+        media_type=export_jobs.media_type(job),
+        filename=export_jobs.filename(job),
     )
@@ -3,8 +3,10 @@ from sqlalchemy.orm import Session
 from datetime import datetime
 
 from .db import get_db
-from .models import Merchant, User, Wallet, Transaction
+from .models import Merchant, User, Transaction
 from .security import get_current_user
+from .idempotency import Idempotency, idempotent
+from .Services import wallet_engine
 
 router = APIRouter(prefix="/merchant", tags=["merchant"])
 
@@ -17,31 +19,22 @@ def merchant_pay(
     description: str | None = None,
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
+    idem: Idempotency = Depends(idempotent("merchant.pay")),
 ):
+    if idem.replay is not None:
+        return idem.replay
 
     merchant = db.query(Merchant).filter(Merchant.api_key == api_key).first()
 
     if not merchant or not merchant.active:
         raise HTTPException(403, "Merchant invalide")
 
-    wallet = db.query(Wallet).filter(Wallet.user_id == user.id).first()
-
-    if not wallet:
-        raise HTTPException(400, "Wallet introuvable")
-
-    if currency.lower() == "htg":
-        if wallet.htg < amount:
-            raise HTTPException(400, "Solde insuffisant")
-        wallet.htg -= amount
-
-    elif currency.lower() == "usd":
-        if wallet.usd < amount:
-            raise HTTPException(400, "Solde insuffisant")
-        wallet.usd -= amount
-
-    else:
+    if currency.lower() not in ("htg", "usd"):
         raise HTTPException(400, "Devise invalide")
 
+    if amount <= 0:
+        raise HTTPException(400, "Montant invalide")
+
     tx = Transaction(
         user_id=user.id,
         type="merchant_payment",
@@ -54,11 +47,12 @@ def merchant_pay(
 
     db.add(tx)
 
-    db.commit()
+    if not wallet_engine.debit(db, user.id, currency, amount, "merchant_payment", tx=tx):
+        raise HTTPException(400, "Solde insuffisant")
 
-    return {
+    return idem.save({
         "status": "success",
         "merchant": merchant.name,
         "amount": amount,
         "currency": currency
-    }
\ No newline at end of file
+    })
@@ -1,8 +1,10 @@
 # app/routes_partners.py
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from .db import get_db
+from .db import get_db, get_async_db
 from .models import Partner
 from .schemas import PartnerIn, PartnerOut
 from .security import get_current_user
@@ -15,8 +17,9 @@ def require_admin(user):
 
 # PUBLIC: liste des partenaires actifs (pour users)
 @router.get("", response_model=list[PartnerOut])
-def list_partners(db: Session = Depends(get_db)):
-    return db.query(Partner).filter(Partner.active == True).order_by(Partner.id.desc()).all()
+async def list_partners(adb: AsyncSession = Depends(get_async_db)):
+    rows = await adb.scalars(select(Partner).where(Partner.active == True).order_by(Partner.id.desc()))
+    return rows.all()
 
 # ADMIN: liste complète (actifs + inactifs)
 @router.get("/admin", response_model=list[PartnerOut])
@@ -6,6 +6,8 @@ from .db import get_db
 from .models import User, Transaction, Partner
 from .schemas import PartnerSpendIn, PartnerSpendOut
 from .security import get_current_user
+from .idempotency import Idempotency, idempotent
+from .Services import wallet_engine
 
 router = APIRouter(prefix="/partners", tags=["partners"])
 
@@ -14,7 +16,11 @@ def spend_at_partner(
     data: PartnerSpendIn,
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
+    idem: Idempotency = Depends(idempotent("partners.spend")),
 ):
+    if idem.replay is not None:
+        return idem.replay
+
     # validate
     if data.currency not in ("htg", "usd"):
         raise HTTPException(status_code=400, detail="Devise invalide")
@@ -29,19 +35,6 @@ def spend_at_partner(
     if hasattr(p, "active") and (p.active is False):
         raise HTTPException(status_code=400, detail="Partenaire inactif")
 
-    # check & debit
-    if not user.wallet:
-        raise HTTPException(status_code=400, detail="Wallet introuvable")
-
-    if data.currency == "htg":
-        if float(user.wallet.htg) < amt:
-            raise HTTPException(status_code=400, detail="Solde HTG insuffisant")
-        user.wallet.htg = float(user.wallet.htg) - amt
-    else:
-        if float(user.wallet.usd) < amt:
-            raise HTTPException(status_code=400, detail="Solde USD insuffisant")
-        user.wallet.usd = float(user.wallet.usd) - amt
-
     note = (data.note or "").strip()
     note2 = f"partner:{p.name} ({p.id})" + (f" | {note}" if note else "")
 
@@ -56,10 +49,17 @@ def spend_at_partner(
         created_at=datetime.utcnow(),
     )
     db.add(tx)
-    db.commit()
-    db.refresh(tx)
 
-    return PartnerSpendOut(
+    # check & debit (un seul UPDATE gardé)
+    if not wallet_engine.debit(db, user.id, data.currency, amt, "partner_spend", tx=tx):
+        raise HTTPException(status_code=400, detail=f"Solde {data.currency.upper()} insuffisant")
+
+    # réponse construite avant le commit (save() commit avec la clé) :
+    # flush pour l'id, wallet relu après l'UPDATE gardé
+    db.flush()
+    db.refresh(user.wallet)
+
+    return idem.save(PartnerSpendOut(
         ok=True,
         partner_id=p.id,
         currency=data.currency,
@@ -67,4 +67,4 @@ def spend_at_partner(
         new_balance_htg=float(user.wallet.htg),
         new_balance_usd=float(user.wallet.usd),
         tx_id=tx.id,
-    )
+    ))
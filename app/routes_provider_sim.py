@@ -6,6 +6,7 @@ from .db import get_db
 from .models import User, Transaction
 from .schemas import ProviderTopupIn
 from .security import require_admin
+from .Services import wallet_engine
 
 router = APIRouter(prefix="/provider", tags=["provider"])
 
@@ -20,13 +21,8 @@ def topup(data: ProviderTopupIn, db: Session = Depends(get_db), admin=Depends(re
     amt = float(data.amount)
     cur = data.currency
 
-    if cur == "htg":
-        user.wallet.htg += amt
-    else:
-        user.wallet.usd += amt
-
     # IMPORTANT: direction NOT NULL => on met une valeur
-    db.add(Transaction(
+    tx = Transaction(
         user_id=user.id,
         type="topup",
         currency=cur,
@@ -34,8 +30,13 @@ def topup(data: ProviderTopupIn, db: Session = Depends(get_db), admin=Depends(re
         note=data.provider,
         direction="credit",
         rate_used=None,
+        method=data.provider,
         created_at=datetime.utcnow(),
-    ))
+    )
+    db.add(tx)
+
+    if not wallet_engine.credit(db, user.id, cur, amt, "topup", tx=tx):
+        raise HTTPException(status_code=404, detail="Wallet introuvable")
 
     db.commit()
     return {"ok": True, "credited": {"currency": cur, "amount": amt, "provider": data.provider}}
@@ -1,10 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 
 from .db import get_db
 from .models import User
-from .security import require_superadmin, create_access_token
+from .security import require_superadmin, create_access_token, revoke_user_tokens
 from .schemas import UserOut, RoleUpdateIn
+from .Services import audit, user_directory
 
 router = APIRouter(prefix="/superadmin", tags=["superadmin"])
 
@@ -15,10 +19,25 @@ router = APIRouter(prefix="/superadmin", tags=["superadmin"])
 
 @router.get("/users", response_model=list[UserOut])
 def list_users(
+    response: Response,
+    q: Optional[str] = Query(None, description="préfixe d'email, téléphone, prénom ou nom"),
+    role: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    created_from: Optional[datetime] = Query(None),
+    created_to: Optional[datetime] = Query(None),
+    cursor: Optional[int] = Query(None, description="X-Next-Cursor de la page précédente"),
+    limit: int = Query(user_directory.PAGE_DEFAULT, ge=1, le=user_directory.PAGE_MAX),
     db: Session = Depends(get_db),
     sa: User = Depends(require_superadmin),
 ):
-    users = db.query(User).order_by(User.id.asc()).all()
+    # paginé par keyset (id décroissant) : total dans X-Total-Count,
+    # page suivante via X-Next-Cursor
+    filters = dict(q=q, role=role, status=status, created_from=created_from, created_to=created_to)
+    users, next_cursor = user_directory.search(db, cursor=cursor, limit=limit, **filters)
+
+    response.headers["X-Total-Count"] = str(user_directory.count(db, **filters))
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
 
     return [
         UserOut(
@@ -60,8 +79,10 @@ def set_user_role(
         raise HTTPException(status_code=400, detail="Role invalide")
 
     user.role = new_role
+    revoke_user_tokens(db, user)
     db.commit()
     db.refresh(user)
+    audit.record("user_role_change", user_id=sa.id, target_user_id=user.id, detail=f"role={new_role}")
 
     return user
 
@@ -95,7 +116,10 @@ def change_status(
         raise HTTPException(status_code=400, detail="Statut invalide")
 
     user.status = data.status
+    # invariant : pas de changement de statut sans révocation (cf. models.User)
+    revoke_user_tokens(db, user)
     db.commit()
+    audit.record("user_status_change", user_id=sa.id, target_user_id=user.id, detail=f"status={data.status}")
 
     return {"message": f"Statut changé en {data.status}"}
 
@@ -119,8 +143,11 @@ def delete_user(
     if user.role == "superadmin":
         raise HTTPException(status_code=403, detail="Impossible de supprimer un superadmin")
 
+    email = user.email
+    revoke_user_tokens(db, user)
     db.delete(user)
     db.commit()
+    audit.record("user_delete", user_id=sa.id, target_user_id=user_id, detail=f"email={email}")
 
     return {"message": "Utilisateur supprimé"}
 
@@ -143,7 +170,9 @@ def impersonate_user(
     if user.role == "superadmin":
         raise HTTPException(status_code=403, detail="Impossible d'impersonate un superadmin")
 
-    access_token = create_access_token(user.email)
+    # pas de refresh token : l'impersonation s'arrête à l'expiration
+    access_token = create_access_token(user)
+    audit.record("user_impersonate", user_id=sa.id, target_user_id=user.id)
 
     return {"access_token": access_token}
 
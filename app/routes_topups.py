@@ -1,12 +1,19 @@
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Response
+from sqlalchemy import or_, insert, update
 from sqlalchemy.orm import Session
 
 from .db import get_db
 from .models import TopupRequest, User, Transaction, Wallet
-from .schemas import TopupRequestOut, TopupDecisionIn
+from .schemas import (
+    TopupRequestOut, TopupDecisionIn,
+    TopupBulkDecisionIn, TopupBulkDecisionOut, TopupBulkResultOut,
+)
 from .security import get_current_user, require_admin
 from .Services.fees import compute_fee, net_amount
+from .Services.ledger import post_entries
+from .Services import wallet_engine, revenue, topup_queue
 
 import uuid
 import shutil
@@ -49,6 +56,8 @@ def _to_out(req: TopupRequest, user_email: str) -> TopupRequestOut:
         admin_note=req.admin_note,
         created_at=req.created_at,
         decided_at=req.decided_at,
+        claimed_by=req.claimed_by,
+        claimed_until=req.claimed_until,
     )
 
 
@@ -137,21 +146,210 @@ def my_requests(
 # -------------------------
 # PENDING (ADMIN)
 # -------------------------
+PENDING_PAGE_MAX = 500
+
+
 @router.get("/pending", response_model=list[TopupRequestOut])
 def pending_requests(
+    response: Response,
+    cursor: Optional[int] = Query(None, description="X-Next-Cursor de la page précédente"),
+    limit: int = Query(100, ge=1, le=PENDING_PAGE_MAX),
+    unclaimed: bool = Query(False, description="Seulement les demandes non réservées"),
     db: Session = Depends(get_db),
     admin: User = Depends(require_admin),
 ):
-    rows = (
+    # vue d'ensemble paginée (id croissant, index partiel PENDING) ; pour
+    # travailler sans collision entre admins, utiliser POST /topups/claim
+    q = (
         db.query(TopupRequest, User.email)
         .join(User, User.id == TopupRequest.user_id)
         .filter(TopupRequest.status == "PENDING")
+    )
+    if cursor is not None:
+        q = q.filter(TopupRequest.id > cursor)
+    if unclaimed:
+        q = q.filter(topup_queue.is_free(datetime.utcnow()))
+
+    rows = q.order_by(TopupRequest.id.asc()).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = str(rows[-1][0].id)
+
+    return [_to_out(r, email) for (r, email) in rows]
+
+
+# -------------------------
+# FILE DE REVUE (ADMIN)
+# -------------------------
+@router.post("/claim", response_model=list[TopupRequestOut])
+def claim_requests(
+    n: int = Query(10, ge=1, le=topup_queue.CLAIM_MAX),
+    db: Session = Depends(get_db),
+    admin: User = Depends(require_admin),
+):
+    """Réserve les n plus anciennes demandes libres pour cet admin
+    (bail de TOPUP_CLAIM_LEASE_SECONDS). Les demandes déjà détenues ne
+    sont pas reproposées : prolonger leur bail avec /claim/renew."""
+    ids = topup_queue.claim(db, admin.id, n)
+    if not ids:
+        return []
+
+    rows = (
+        db.query(TopupRequest, User.email)
+        .join(User, User.id == TopupRequest.user_id)
+        .filter(TopupRequest.id.in_(ids))
         .order_by(TopupRequest.id.asc())
         .all()
     )
     return [_to_out(r, email) for (r, email) in rows]
 
 
+@router.post("/claim/renew")
+def renew_claims(
+    db: Session = Depends(get_db),
+    admin: User = Depends(require_admin),
+):
+    # heartbeat de l'écran de revue : prolonge le bail de tout ce que
+    # l'admin détient encore
+    ids = topup_queue.renew(db, admin.id)
+    return {"ok": True, "ids": ids, "lease_seconds": topup_queue.TOPUP_CLAIM_LEASE_SECONDS}
+
+
+@router.post("/decide/bulk", response_model=TopupBulkDecisionOut)
+def decide_bulk(
+    data: TopupBulkDecisionIn,
+    db: Session = Depends(get_db),
+    admin: User = Depends(require_admin),
+):
+    # même règles que /{req_id}/decide, mais tout le lot dans une seule
+    # transaction : demandes verrouillées, crédits agrégés par wallet et
+    # appliqués en un UPDATE ... CASE par devise, transactions et journal
+    # insérés en masse. Les demandes refusées à la validation sont rendues
+    # dans `results` sans faire échouer le reste du lot.
+    decision = data.status
+    now = datetime.utcnow()
+    ids = list(dict.fromkeys(data.ids))
+
+    reqs = {
+        r.id: r
+        for r in db.query(TopupRequest)
+        .filter(TopupRequest.id.in_(ids))
+        .order_by(TopupRequest.id.asc())
+        .with_for_update()
+        .all()
+    }
+
+    results = {i: TopupBulkResultOut(id=i, ok=False) for i in ids}
+    eligible = []
+    for i in ids:
+        req, r = reqs.get(i), results[i]
+        if req is None:
+            r.error = "Demande introuvable"
+        elif admin.role == "admin" and req.user_id == admin.id:
+            r.error = "Admin ne peut pas approuver sa propre recharge"
+        elif req.status != "PENDING":
+            r.status, r.error = req.status, "Demande déjà traitée"
+        elif req.claimed_by not in (None, admin.id) and req.claimed_until and req.claimed_until > now:
+            r.error = "Demande en cours de revue par un autre admin"
+        elif decision == "APPROVED" and req.currency.lower() not in ("htg", "usd"):
+            r.error = "Devise invalide"
+        else:
+            eligible.append(i)
+
+    decided_ids = []
+    if eligible:
+        # même UPDATE gardé que la décision unitaire ; RETURNING donne
+        # exactement les demandes passées à la décision
+        values = {
+            "status": decision, "decided_at": now,
+            "claimed_by": None, "claimed_until": None,
+        }
+        if data.admin_note is not None:
+            values["admin_note"] = data.admin_note
+        updated = set(db.scalars(
+            update(TopupRequest)
+            .where(
+                TopupRequest.id.in_(eligible),
+                TopupRequest.status == "PENDING",
+                or_(TopupRequest.claimed_by == admin.id, topup_queue.is_free(now)),
+            )
+            .values(**values)
+            .returning(TopupRequest.id)
+            .execution_options(synchronize_session=False)
+        ).all())
+        for i in eligible:
+            if i not in updated:
+                results[i].error = "Demande déjà traitée"
+        decided_ids = [i for i in eligible if i in updated]
+
+    decided = [reqs[i] for i in decided_ids]
+
+    if decision == "APPROVED" and decided:
+        user_ids = {req.user_id for req in decided}
+        missing = user_ids - wallet_engine.lock_wallets(db, user_ids)
+        if missing:
+            db.execute(insert(Wallet), [
+                dict(user_id=uid, htg=0.0, usd=0.0) for uid in sorted(missing)
+            ])
+
+        tx_ids = db.scalars(
+            insert(Transaction).returning(Transaction.id, sort_by_parameter_order=True),
+            [
+                dict(
+                    user_id=req.user_id, type="topup", currency=req.currency,
+                    amount=req.net_amount, note=f"Topup approuvé via {req.method}",
+                    direction="manual_topup", rate_used=None, method=req.method,
+                    fee_amount=req.fee_amount, created_at=now,
+                )
+                for req in decided
+            ],
+        ).all()
+
+        credits = {}
+        entries = []
+        for req, tx_id in zip(decided, tx_ids):
+            cur = req.currency.lower()
+            per_cur = credits.setdefault(cur, {})
+            per_cur[req.user_id] = per_cur.get(req.user_id, 0.0) + float(req.net_amount)
+            entries.append(dict(user_id=req.user_id, currency=cur, amount=req.net_amount, kind="topup", tx_id=tx_id))
+            results[req.id].tx_id = tx_id
+
+        for cur, per_user in credits.items():
+            if not wallet_engine.credit_many(db, cur, per_user):
+                db.rollback()
+                raise HTTPException(status_code=409, detail="Wallet introuvable pendant le crédit du lot")
+
+        post_entries(db, entries)
+
+        revenue.record_topups(db, decided, now)
+
+    for i in decided_ids:
+        results[i].ok, results[i].status = True, decision
+
+    db.commit()
+
+    out = [results[i] for i in ids]
+    return TopupBulkDecisionOut(
+        ok=bool(decided_ids),
+        status=decision,
+        decided=len(decided_ids),
+        failed=len(out) - len(decided_ids),
+        results=out,
+    )
+
+
+@router.post("/{req_id}/release")
+def release_request(
+    req_id: int,
+    db: Session = Depends(get_db),
+    admin: User = Depends(require_admin),
+):
+    if not topup_queue.release(db, admin.id, req_id):
+        raise HTTPException(status_code=404, detail="Demande non réservée par vous")
+    db.commit()
+    return {"ok": True}
+
+
 # -------------------------
 # DECIDE REQUEST
 # -------------------------
@@ -175,33 +373,45 @@ def decide_request(
     if req.status != "PENDING":
         raise HTTPException(status_code=400, detail="Demande déjà traitée")
 
+    now = datetime.utcnow()
+    if req.claimed_by not in (None, admin.id) and req.claimed_until and req.claimed_until > now:
+        raise HTTPException(status_code=409, detail="Demande en cours de revue par un autre admin")
+
     decision = (data.status or "").upper()
     if decision not in ("APPROVED", "REJECTED"):
         raise HTTPException(status_code=400, detail="Décision invalide")
 
-    req.status = decision
-    req.approved_by = admin.id
-    req.decided_at = datetime.utcnow()
-
-    if decision == "APPROVED":
+    if decision == "APPROVED" and req.currency.lower() not in ("htg", "usd"):
+        raise HTTPException(status_code=400, detail="Devise invalide")
 
-        wallet = db.query(Wallet).filter(Wallet.user_id == req.user_id).first()
+    # PENDING -> décision en un UPDATE gardé : deux admins qui valident la
+    # même demande en même temps ne peuvent pas créditer deux fois ; une
+    # demande réservée par un autre admin (bail en cours) n'est pas touchée
+    decided_at = now
+    claimed = (
+        db.query(TopupRequest)
+        .filter(
+            TopupRequest.id == req.id,
+            TopupRequest.status == "PENDING",
+            or_(TopupRequest.claimed_by == admin.id, topup_queue.is_free(now)),
+        )
+        .update(
+            {"status": decision, "decided_at": decided_at, "claimed_by": None, "claimed_until": None},
+            synchronize_session=False,
+        )
+    )
+    if claimed != 1:
+        # course perdue : soit décidée entre-temps, soit réservée par un
+        # autre admin depuis notre lecture
+        db.rollback()
+        status = db.query(TopupRequest.status).filter(TopupRequest.id == req_id).scalar()
+        if status == "PENDING":
+            raise HTTPException(status_code=409, detail="Demande en cours de revue par un autre admin")
+        raise HTTPException(status_code=400, detail="Demande déjà traitée")
 
-        if not wallet:
-            wallet = Wallet(
-                user_id=req.user_id,
-                htg=0.0,
-                usd=0.0,
-            )
-            db.add(wallet)
-            db.flush()
+    req.approved_by = admin.id
 
-        if req.currency.lower() == "htg":
-            wallet.htg += req.net_amount
-        elif req.currency.lower() == "usd":
-            wallet.usd += req.net_amount
-        else:
-            raise HTTPException(status_code=400, detail="Devise invalide")
+    if decision == "APPROVED":
 
         tx = Transaction(
             user_id=req.user_id,
@@ -211,11 +421,22 @@ def decide_request(
             note=f"Topup approuvé via {req.method}",
             direction="manual_topup",
             rate_used=None,
+            method=req.method,
+            fee_amount=req.fee_amount,
             created_at=datetime.utcnow(),
         )
 
         db.add(tx)
 
+        if not wallet_engine.credit(db, req.user_id, req.currency, req.net_amount, "topup", tx=tx):
+            db.add(Wallet(user_id=req.user_id, htg=0.0, usd=0.0))
+            db.flush()
+            if not wallet_engine.credit(db, req.user_id, req.currency, req.net_amount, "topup", tx=tx):
+                db.rollback()
+                raise HTTPException(status_code=409, detail="Wallet introuvable pendant le crédit")
+
+        revenue.record_topup(db, req, decided_at)
+
     db.commit()
     db.refresh(req)
 
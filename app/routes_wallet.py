@@ -1,104 +1,272 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import datetime
+from typing import Optional
 
-from .db import get_db
-from .models import User, Transaction, FxSetting
-from .schemas import WalletOut, TransferIn, ConvertIn, ConvertOut, TxOut
-from .security import get_current_user
+from .db import get_db, get_async_db
+from .models import User, Wallet, Transaction
+from .schemas import (
+    WalletOut, TransferIn, ConvertIn, ConvertOut, ConvertQuoteIn, ConvertQuoteOut, TxOut,
+    BatchTransferIn, BatchTransferOut, BatchTransferLineOut,
+)
+from .security import get_current_user, get_current_user_async, Principal
+from .idempotency import Idempotency, idempotent, AsyncIdempotency, idempotent_async
+from .Services.ledger import balances, post_entries
+from .Services import wallet_engine, fx as fx_rates
 
 router = APIRouter(prefix="/wallet", tags=["wallet"])
 
 
-def get_fx(db: Session) -> FxSetting:
-    fx = db.query(FxSetting).first()
-    if not fx:
-        fx = FxSetting(sell_usd=134.0, buy_usd=126.0)
-        db.add(fx)
-        db.commit()
-        db.refresh(fx)
-    return fx
+@router.get("", response_model=WalletOut)
+async def get_wallet(
+    user: Principal = Depends(get_current_user_async),
+    adb: AsyncSession = Depends(get_async_db),
+):
+    row = (await adb.execute(
+        select(Wallet.htg, Wallet.usd).where(Wallet.user_id == user.id)
+    )).first()
+    if not row:
+        return WalletOut(htg=0.0, usd=0.0)
+    return WalletOut(htg=float(row.htg), usd=float(row.usd))
 
 
-@router.get("", response_model=WalletOut)
-def get_wallet(user: User = Depends(get_current_user)):
-    return user.wallet
+@router.get("/balance", response_model=WalletOut)
+def get_ledger_balance(
+    at: Optional[datetime] = Query(None, description="Solde à cette date (ISO), sinon solde courant"),
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Solde recalculé depuis le journal (snapshot + queue)."""
+    return WalletOut(**balances(db, user.id, at=at))
+
+
+TX_PAGE_MAX = 200
 
 
 @router.get("/transactions", response_model=list[TxOut])
-def transactions(user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    rows = db.query(Transaction).filter(Transaction.user_id == user.id).order_by(Transaction.id.desc()).all()
+async def transactions(
+    response: Response,
+    cursor: Optional[int] = Query(None, description="X-Next-Cursor de la page précédente"),
+    limit: int = Query(50, ge=1, le=TX_PAGE_MAX),
+    tx_type: Optional[str] = Query(None),
+    currency: Optional[str] = Query(None, description="htg ou usd"),
+    from_dt: Optional[datetime] = Query(None),
+    to_dt: Optional[datetime] = Query(None),
+    user: Principal = Depends(get_current_user_async),
+    adb: AsyncSession = Depends(get_async_db),
+):
+    """Historique paginé par keyset (id décroissant).
+
+    Une page = un range scan sur l'index (user_id, id). Le curseur de la
+    page suivante est renvoyé dans l'en-tête X-Next-Cursor (absent en fin
+    d'historique).
+    """
+    q = select(Transaction).where(Transaction.user_id == user.id)
+    if cursor is not None:
+        q = q.where(Transaction.id < cursor)
+    if tx_type:
+        q = q.where(Transaction.type == tx_type.strip())
+    if currency:
+        q = q.where(Transaction.currency == currency.strip().lower())
+    if from_dt:
+        q = q.where(Transaction.created_at >= from_dt)
+    if to_dt:
+        q = q.where(Transaction.created_at <= to_dt)
+
+    rows = (await adb.scalars(q.order_by(Transaction.id.desc()).limit(limit + 1))).all()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = str(rows[-1].id)
+
     return rows
 
 
 @router.post("/transfer")
-def transfer(data: TransferIn, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def transfer(
+    data: TransferIn,
+    user: Principal = Depends(get_current_user_async),
+    adb: AsyncSession = Depends(get_async_db),
+    idem: AsyncIdempotency = Depends(idempotent_async("wallet.transfer")),
+):
+    if idem.replay is not None:
+        return idem.replay
+
     to_email = data.to_email.lower().strip()
     if to_email == user.email:
         raise HTTPException(status_code=400, detail="Transfert vers soi-même interdit")
 
-    dest = db.query(User).filter(User.email == to_email).first()
-    if not dest:
+    dest_id = (await adb.execute(select(User.id).where(User.email == to_email))).scalar_one_or_none()
+    if dest_id is None:
         raise HTTPException(status_code=404, detail="Destinataire introuvable")
 
     amt = float(data.amount)
     cur = data.currency
 
-    if cur == "htg":
-        if user.wallet.htg < amt:
-            raise HTTPException(status_code=400, detail="Solde HTG insuffisant")
-        user.wallet.htg -= amt
-        dest.wallet.htg += amt
-    else:
-        if user.wallet.usd < amt:
-            raise HTTPException(status_code=400, detail="Solde USD insuffisant")
-        user.wallet.usd -= amt
-        dest.wallet.usd += amt
+    def move(db: Session) -> bool:
+        tx_out = Transaction(
+            user_id=user.id, type="transfer", currency=cur, amount=amt,
+            note=data.note or "transfer", direction="transfer_out", rate_used=None, created_at=datetime.utcnow()
+        )
+        tx_in = Transaction(
+            user_id=dest_id, type="transfer", currency=cur, amount=amt,
+            note=data.note or "transfer", direction="transfer_in", rate_used=None, created_at=datetime.utcnow()
+        )
+        db.add(tx_out)
+        db.add(tx_in)
+        return wallet_engine.transfer(db, user.id, dest_id, cur, amt, "transfer", tx_out=tx_out, tx_in=tx_in)
+
+    # moteur sync (UPDATE gardés + journal) exécuté sur la connexion async
+    if not await adb.run_sync(move):
+        # une jambe a pu être écrite : on annule tout avant de dire laquelle a échoué
+        await adb.rollback()
+        if await adb.scalar(select(Wallet.user_id).where(Wallet.user_id == dest_id)) is None:
+            raise HTTPException(status_code=404, detail="Wallet destinataire introuvable")
+        raise HTTPException(status_code=400, detail=f"Solde {cur.upper()} insuffisant")
+
+    return await idem.save({"ok": True})
+
+
+@router.post("/transfer/batch", response_model=BatchTransferOut)
+def transfer_batch(
+    data: BatchTransferIn,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    idem: Idempotency = Depends(idempotent("wallet.transfer_batch")),
+):
+    """Paie / virements de masse en un seul commit.
+
+    1 SELECT IN pour les destinataires, 1 SELECT FOR UPDATE des wallets,
+    1 UPDATE gardé sur le total, 1 UPDATE CASE pour les crédits, puis
+    INSERT multi-lignes des transactions et du journal. Les lignes en
+    erreur (destinataire inconnu, soi-même) sont ignorées et signalées ;
+    un solde insuffisant pour le total rejette tout le lot.
+    """
+    if idem.replay is not None:
+        return idem.replay
+
+    cur = data.currency
+    results = [
+        BatchTransferLineOut(index=i, to_email=line.to_email.lower().strip(), amount=float(line.amount), ok=True)
+        for i, line in enumerate(data.lines)
+    ]
+
+    emails = {r.to_email for r in results}
+    ids_by_email = dict(
+        db.query(User.email, User.id).filter(User.email.in_(emails)).all()
+    )
+    with_wallet = wallet_engine.lock_wallets(db, list(ids_by_email.values()) + [user.id])
 
-    db.add(Transaction(
-        user_id=user.id, type="transfer", currency=cur, amount=amt,
-        note=data.note or "transfer", direction="transfer_out", rate_used=None, created_at=datetime.utcnow()
-    ))
-    db.add(Transaction(
-        user_id=dest.id, type="transfer", currency=cur, amount=amt,
-        note=data.note or "transfer", direction="transfer_in", rate_used=None, created_at=datetime.utcnow()
-    ))
+    valid = []
+    for r in results:
+        dest_id = ids_by_email.get(r.to_email)
+        if dest_id is None:
+            r.ok, r.error = False, "Destinataire introuvable"
+        elif dest_id == user.id:
+            r.ok, r.error = False, "Transfert vers soi-même interdit"
+        elif dest_id not in with_wallet:
+            r.ok, r.error = False, "Wallet destinataire introuvable"
+        else:
+            valid.append((r, dest_id))
 
-    db.commit()
-    return {"ok": True}
+    if not valid:
+        return idem.save(BatchTransferOut(ok=False, currency=cur, total=0.0, lines=results))
+
+    credits = {}
+    for r, dest_id in valid:
+        credits[dest_id] = credits.get(dest_id, 0.0) + r.amount
+    total = sum(credits.values())
+
+    if not wallet_engine.fan_out(db, user.id, cur, credits):
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Solde {cur.upper()} insuffisant pour le lot")
+
+    now = datetime.utcnow()
+    tx_rows = []
+    for r, dest_id in valid:
+        note = data.lines[r.index].note or data.note or "transfer"
+        tx_rows.append(dict(
+            user_id=user.id, type="transfer", currency=cur, amount=r.amount,
+            note=note, direction="transfer_out", rate_used=None, created_at=now,
+        ))
+        tx_rows.append(dict(
+            user_id=dest_id, type="transfer", currency=cur, amount=r.amount,
+            note=note, direction="transfer_in", rate_used=None, created_at=now,
+        ))
+    tx_ids = db.scalars(
+        insert(Transaction).returning(Transaction.id, sort_by_parameter_order=True),
+        tx_rows,
+    ).all()
+
+    entries = []
+    for i, (r, dest_id) in enumerate(valid):
+        out_id, in_id = tx_ids[2 * i], tx_ids[2 * i + 1]
+        r.tx_id = out_id
+        entries.append(dict(user_id=user.id, currency=cur, amount=-r.amount, kind="transfer", tx_id=out_id))
+        entries.append(dict(user_id=dest_id, currency=cur, amount=r.amount, kind="transfer", tx_id=in_id))
+    post_entries(db, entries)
+
+    return idem.save(BatchTransferOut(ok=True, currency=cur, total=total, lines=results))
+
+
+@router.post("/convert/quote", response_model=ConvertQuoteOut)
+def convert_quote(data: ConvertQuoteIn, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Devis à taux figé, valable FX_QUOTE_TTL_SECONDS. Lecture seule."""
+    q = fx_rates.issue_quote(db, user.id, data.direction, float(data.amount))
+    return ConvertQuoteOut(
+        quote_id=q.quote_id,
+        direction=q.direction,
+        amount_in=q.amount_in,
+        amount_out=q.amount_out,
+        rate_used=q.rate,
+        expires_at=q.expires_at,
+    )
 
 
 @router.post("/convert", response_model=ConvertOut)
-def convert(data: ConvertIn, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    fx = get_fx(db)
+def convert(
+    data: ConvertIn,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    idem: Idempotency = Depends(idempotent("wallet.convert")),
+):
+    if idem.replay is not None:
+        return idem.replay
+
     amt = float(data.amount)
 
-    if data.direction == "htg_to_usd":
-        if user.wallet.htg < amt:
-            raise HTTPException(status_code=400, detail="Solde HTG insuffisant")
-        rate = float(fx.sell_usd)
-        out = amt / rate
-        user.wallet.htg -= amt
-        user.wallet.usd += out
+    if data.quote_id:
+        q = fx_rates.redeem_quote(db, data.quote_id, user.id)
+        if q is None:
+            raise HTTPException(status_code=400, detail="Devis invalide ou expiré")
+        if q.direction != data.direction or abs(q.amount_in - amt) > 1e-9:
+            # la rédemption est annulée avec le reste : le devis reste utilisable
+            db.rollback()
+            raise HTTPException(status_code=400, detail="Le devis ne correspond pas à cette conversion")
+        rate, out = q.rate, q.amount_out
+    else:
+        rate, out = fx_rates.apply_rate(data.direction, amt, fx_rates.current(db))
 
-        db.add(Transaction(
+    if data.direction == "htg_to_usd":
+        tx = Transaction(
             user_id=user.id, type="convert", currency="htg", amount=amt,
             note="HTG->USD", direction="htg_to_usd", rate_used=rate, created_at=datetime.utcnow()
-        ))
-        db.commit()
-        return ConvertOut(from_currency="htg", to_currency="usd", amount_in=amt, amount_out=out, rate_used=rate)
+        )
+        db.add(tx)
+        if not wallet_engine.exchange(db, user.id, "htg", amt, "usd", out, "convert", tx=tx):
+            db.rollback()
+            raise HTTPException(status_code=400, detail="Solde HTG insuffisant")
+        return idem.save(ConvertOut(from_currency="htg", to_currency="usd", amount_in=amt, amount_out=out, rate_used=rate))
 
     else:
-        if user.wallet.usd < amt:
-            raise HTTPException(status_code=400, detail="Solde USD insuffisant")
-        rate = float(fx.buy_usd)
-        out = amt * rate
-        user.wallet.usd -= amt
-        user.wallet.htg += out
-
-        db.add(Transaction(
+        tx = Transaction(
             user_id=user.id, type="convert", currency="usd", amount=amt,
             note="USD->HTG", direction="usd_to_htg", rate_used=rate, created_at=datetime.utcnow()
-        ))
-        db.commit()
-        return ConvertOut(from_currency="usd", to_currency="htg", amount_in=amt, amount_out=out, rate_used=rate)
+        )
+        db.add(tx)
+        if not wallet_engine.exchange(db, user.id, "usd", amt, "htg", out, "convert", tx=tx):
+            db.rollback()
+            raise HTTPException(status_code=400, detail="Solde USD insuffisant")
+        return idem.save(ConvertOut(from_currency="usd", to_currency="htg", amount_in=amt, amount_out=out, rate_used=rate))
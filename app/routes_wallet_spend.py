@@ -5,6 +5,8 @@ from sqlalchemy.orm import Session
 from .db import get_db
 from .models import User, Transaction, Partner
 from .security import get_current_user
+from .idempotency import Idempotency, idempotent
+from .Services import wallet_engine
 
 router = APIRouter(prefix="/wallet", tags=["wallet"])
 
@@ -13,7 +15,11 @@ def spend_wallet(
     data: dict,
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
+    idem: Idempotency = Depends(idempotent("wallet.spend")),
 ):
+    if idem.replay is not None:
+        return idem.replay
+
     partner_id = data.get("partner_id")
     currency = (data.get("currency") or "").lower()
     amount = float(data.get("amount") or 0)
@@ -30,16 +36,6 @@ def spend_wallet(
     if not p or (hasattr(p, "active") and not p.active):
         raise HTTPException(status_code=404, detail="Partenaire introuvable ou inactif")
 
-    # solde
-    if currency == "htg":
-        if user.wallet.htg < amount:
-            raise HTTPException(status_code=400, detail="Solde HTG insuffisant")
-        user.wallet.htg -= amount
-    else:
-        if user.wallet.usd < amount:
-            raise HTTPException(status_code=400, detail="Solde USD insuffisant")
-        user.wallet.usd -= amount
-
     tx = Transaction(
         user_id=user.id,
         type="spend",
@@ -51,6 +47,9 @@ def spend_wallet(
         created_at=datetime.utcnow(),
     )
     db.add(tx)
-    db.commit()
 
-    return {"ok": True}
+    # solde : contrôle + débit en un seul UPDATE
+    if not wallet_engine.debit(db, user.id, currency, amount, "spend", tx=tx):
+        raise HTTPException(status_code=400, detail=f"Solde {currency.upper()} insuffisant")
+
+    return idem.save({"ok": True})
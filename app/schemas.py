@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, EmailStr
-from typing import Optional, Literal, Dict
+from typing import Optional, Literal, Dict, List
 from datetime import datetime
 
 # -------------------------
@@ -23,6 +23,12 @@ class RegisterOut(BaseModel):
 class TokenOut(BaseModel):
     access_token: str
     token_type: str = "bearer"
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None  # secondes
+
+
+class RefreshIn(BaseModel):
+    refresh_token: str
 
 
 class WalletOut(BaseModel):
@@ -117,9 +123,52 @@ class TransferIn(BaseModel):
     note: Optional[str] = ""
 
 
+class BatchTransferLine(BaseModel):
+    to_email: EmailStr
+    amount: float = Field(gt=0)
+    note: Optional[str] = None
+
+
+class BatchTransferIn(BaseModel):
+    currency: Currency
+    lines: List[BatchTransferLine] = Field(min_length=1, max_length=1000)
+    note: Optional[str] = ""
+
+
+class BatchTransferLineOut(BaseModel):
+    index: int
+    to_email: str
+    amount: float
+    ok: bool
+    error: Optional[str] = None
+    tx_id: Optional[int] = None
+
+
+class BatchTransferOut(BaseModel):
+    ok: bool
+    currency: str
+    total: float
+    lines: List[BatchTransferLineOut]
+
+
 class ConvertIn(BaseModel):
     direction: Literal["htg_to_usd", "usd_to_htg"]
     amount: float = Field(gt=0)
+    quote_id: Optional[str] = None  # devis de /wallet/convert/quote (taux figé)
+
+
+class ConvertQuoteIn(BaseModel):
+    direction: Literal["htg_to_usd", "usd_to_htg"]
+    amount: float = Field(gt=0)
+
+
+class ConvertQuoteOut(BaseModel):
+    quote_id: str
+    direction: str
+    amount_in: float
+    amount_out: float
+    rate_used: float
+    expires_at: datetime
 
 
 class ConvertOut(BaseModel):
@@ -191,6 +240,8 @@ class TopupRequestOut(BaseModel):
     admin_note: Optional[str] = None
     created_at: datetime
     decided_at: Optional[datetime] = None
+    claimed_by: Optional[int] = None
+    claimed_until: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -201,6 +252,28 @@ class TopupDecisionIn(BaseModel):
     admin_note: Optional[str] = None
 
 
+class TopupBulkDecisionIn(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=1000)
+    status: Literal["APPROVED", "REJECTED"]
+    admin_note: Optional[str] = None
+
+
+class TopupBulkResultOut(BaseModel):
+    id: int
+    ok: bool
+    status: Optional[str] = None
+    error: Optional[str] = None
+    tx_id: Optional[int] = None
+
+
+class TopupBulkDecisionOut(BaseModel):
+    ok: bool
+    status: str
+    decided: int
+    failed: int
+    results: List[TopupBulkResultOut]
+
+
 # -------------------------
 # PARTNERS
 # -------------------------
@@ -262,3 +335,33 @@ class AdminAdjustOut(BaseModel):
     new_balance_htg: float
     new_balance_usd: float
     tx_id: int
+
+
+# -------------------------
+# EXPORT JOBS
+# -------------------------
+class ExportJobIn(BaseModel):
+    format: Literal["csv", "ndjson", "parquet"] = "csv"
+    gzip: bool = False
+    user_email: Optional[str] = None
+    tx_type: Optional[str] = None
+    currency: Optional[str] = None
+    from_dt: Optional[datetime] = None
+    to_dt: Optional[datetime] = None
+    limit: Optional[int] = Field(default=None, ge=1)
+
+
+class ExportJobOut(BaseModel):
+    id: int
+    status: str
+    format: str
+    gzip: bool
+    row_count: Optional[int] = None
+    size_bytes: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    download_url: Optional[str] = None
+
+    class Config:
+        from_attributes = True
@@ -1,42 +1,191 @@
 ﻿from datetime import datetime, timedelta
+import hashlib
+import secrets
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
+from typing import NamedTuple
 
-from .db import get_db
-from .models import User
+from .db import get_db, get_async_db
+from .models import User, RefreshToken, TokenRevocation
+from .Services.cache import TTLCache
+from .Services import hash_pool, revocation
 
 import os
 
 SECRET_KEY = os.getenv("SECRET_KEY", "dev_secret_key")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24
+# access token court (auth sans base, révocation bornée par sa durée de
+# vie) + refresh token long, opaque et révocable, pour le renouveler
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+REVOCATION_REFRESH_SECONDS = int(os.getenv("REVOCATION_REFRESH_SECONDS", "10"))
+# un refresh token tout juste remplacé reste accepté ce temps-là (requêtes
+# ou onglets concurrents) tant que son remplaçant n'est pas révoqué
+REFRESH_REUSE_GRACE_SECONDS = int(os.getenv("REFRESH_REUSE_GRACE_SECONDS", "30"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# argon2id par défaut ; les anciens hash bcrypt restent vérifiables et sont
+# rehachés au login (verify_and_update). Coûts réglables par env.
+PASSWORD_SCHEME = os.getenv("PASSWORD_SCHEME", "argon2")
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"] if PASSWORD_SCHEME == "argon2" else ["bcrypt", "argon2"],
+    deprecated="auto",
+    argon2__type="ID",
+    argon2__time_cost=int(os.getenv("ARGON2_TIME_COST", "2")),
+    argon2__memory_cost=int(os.getenv("ARGON2_MEMORY_COST", "19456")),  # KiB
+    argon2__parallelism=int(os.getenv("ARGON2_PARALLELISM", "1")),
+    bcrypt__rounds=int(os.getenv("BCRYPT_ROUNDS", "12")),
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+# principal (id, email, role, status) par sujet du token, pour les anciens
+# tokens sans claims (uid / role / tv) : évite le SELECT users à chaque
+# requête. Invalidé par invalidate_principal() quand un admin change le
+# statut / rôle ; les autres workers suivent au TTL.
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+_principals = TTLCache(maxsize=10000, ttl=PRINCIPAL_CACHE_TTL_SECONDS)
+
+
+class Principal(NamedTuple):
+    id: int
+    email: str
+    role: str
+    status: str
+
+
+def _busy():
+    return HTTPException(status_code=503, detail="Serveur occupé, réessayez dans un instant")
+
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    try:
+        return hash_pool.run(pwd_context.hash, password)
+    except hash_pool.HashPoolBusy:
+        raise _busy()
 
 
 def verify_password(password: str, password_hash: str) -> bool:
-    return pwd_context.verify(password, password_hash)
+    try:
+        return hash_pool.run(pwd_context.verify, password, password_hash)
+    except hash_pool.HashPoolBusy:
+        raise _busy()
 
 
-def create_access_token(subject: str) -> str:
+async def hash_password_async(password: str) -> str:
+    """Pour les routes async : le hachage part dans le pool sans bloquer de thread."""
+    try:
+        return await hash_pool.run_async(pwd_context.hash, password)
+    except hash_pool.HashPoolBusy:
+        raise _busy()
+
+
+async def verify_password_async(password: str, password_hash: str) -> bool:
+    try:
+        return await hash_pool.run_async(pwd_context.verify, password, password_hash)
+    except hash_pool.HashPoolBusy:
+        raise _busy()
+
+
+async def verify_and_update_async(password: str, password_hash: str) -> tuple[bool, str | None]:
+    """(ok, nouveau_hash) : nouveau_hash est non nul si le hash doit être
+    migré (bcrypt -> argon2, ou coût modifié)."""
+    try:
+        return await hash_pool.run_async(pwd_context.verify_and_update, password, password_hash)
+    except hash_pool.HashPoolBusy:
+        raise _busy()
+
+
+def create_access_token(user: User) -> str:
     now = datetime.utcnow()
     payload = {
-    "sub": subject,
-    "type": "access",
-    "iat": now,
-    "exp": now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
-}
+        "sub": user.email,
+        "uid": user.id,
+        "role": user.role,
+        "tv": user.token_version or 0,
+        "type": "access",
+        "iat": now,
+        "exp": now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+    }
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
 
+def _hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def create_refresh_token(db, user_id: int) -> str:
+    """Token opaque ; seul son sha256 est stocké. Ne commit pas.
+
+    `db` peut être une Session ou une AsyncSession (simple db.add)."""
+    token = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    db.add(RefreshToken(
+        user_id=user_id,
+        token_hash=_hash_refresh_token(token),
+        created_at=now,
+        expires_at=now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token
+
+
+def find_refresh_token(db: Session, token: str) -> RefreshToken | None:
+    return db.query(RefreshToken).filter(
+        RefreshToken.token_hash == _hash_refresh_token(token)
+    ).first()
+
+
+def rotate_refresh_token(db: Session, rt: RefreshToken) -> str:
+    """Remplace `rt` par un nouveau refresh token, renvoyé en clair. Ne commit pas."""
+    token = create_refresh_token(db, rt.user_id)
+    db.flush()
+    if rt.revoked_at is None:
+        rt.revoked_at = datetime.utcnow()
+    rt.replaced_by_id = find_refresh_token(db, token).id
+    return token
+
+
+def in_reuse_grace(db: Session, rt: RefreshToken, now: datetime) -> bool:
+    """Token déjà remplacé, mais à l'instant et par un token encore valide :
+    course entre deux requêtes du même client, pas un vol."""
+    if rt.replaced_by_id is None or rt.revoked_at is None:
+        return False
+    if now - rt.revoked_at > timedelta(seconds=REFRESH_REUSE_GRACE_SECONDS):
+        return False
+    successor = db.get(RefreshToken, rt.replaced_by_id)
+    return successor is not None and successor.revoked_at is None
+
+
+def revoke_refresh_tokens(db: Session, user_id: int) -> None:
+    db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def revoke_user_tokens(db: Session, user: User) -> None:
+    """À appeler avant le commit d'un changement de statut / rôle (ou d'une
+    suppression) : les access tokens déjà émis sont refusés tout de suite
+    dans ce worker, dans les autres au prochain rechargement, et les refresh
+    tokens ne peuvent plus en obtenir de nouveaux."""
+    user.token_version = (user.token_version or 0) + 1
+    user.token_version_at = datetime.utcnow()
+    db.add(TokenRevocation(user_id=user.id, min_version=user.token_version, created_at=user.token_version_at))
+    revoke_refresh_tokens(db, user.id)
+    revocation.revoke(user.id, user.token_version, ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+    invalidate_principal(user.email)
+
+
+def refresh_revocations(db: Session) -> int:
+    return revocation.refresh(db, ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+
 def decode_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -47,6 +196,25 @@ def decode_token(token: str) -> dict:
         raise HTTPException(status_code=401, detail="Token invalide")
 
 
+def _principal_from_claims(payload: dict) -> Principal | None:
+    """Principal lu dans le token lui-même (aucune requête). None pour les
+    anciens tokens sans claims, qui passent encore par la base / le cache.
+
+    Un token n'est émis que pour un compte actif, et tout changement de
+    statut / rôle (ou suppression) passe par revoke_user_tokens (invariant
+    noté sur models.User et aux écritures de status) : un token
+    non révoqué désigne donc un compte actif avec ce rôle. Limite : sur les
+    autres workers, la révocation n'est vue qu'au rechargement suivant, donc
+    un compte désactivé ou supprimé garde l'accès au plus
+    REVOCATION_REFRESH_SECONDS (pas toute la durée du token)."""
+    if payload.get("type") != "access" or "uid" not in payload:
+        return None
+    user_id = int(payload["uid"])
+    if revocation.is_revoked(user_id, int(payload.get("tv", 0)), payload.get("iat")):
+        raise HTTPException(status_code=401, detail="Token révoqué")
+    return Principal(user_id, payload["sub"], payload.get("role", "user"), "active")
+
+
 def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db),
@@ -57,9 +225,14 @@ def get_current_user(
     if not email:
         raise HTTPException(status_code=401, detail="Token invalide")
 
-    user = db.query(User).filter(User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=401, detail="Utilisateur introuvable")
+    principal = _principal_from_claims(payload) or _principals.get(email)
+    if principal is None:
+        user = db.query(User).filter(User.email == email).first()
+        if not user:
+            raise HTTPException(status_code=401, detail="Utilisateur introuvable")
+        _principals.set(email, Principal(user.id, user.email, user.role, user.status))
+    else:
+        user = _attach_principal(db, principal)
 
     if user.status != "active":
         raise HTTPException(status_code=403, detail="Compte suspendu ou banni")
@@ -67,6 +240,51 @@ def get_current_user(
     return user
 
 
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme),
+    adb: AsyncSession = Depends(get_async_db),
+) -> Principal:
+    """Variante async pour les routes chaudes : renvoie un Principal (pas
+    d'objet ORM, donc pas de lazy load implicite en async)."""
+    payload = decode_token(token)
+
+    email = payload.get("sub")
+    if not email:
+        raise HTTPException(status_code=401, detail="Token invalide")
+
+    principal = _principal_from_claims(payload) or _principals.get(email)
+    if principal is None:
+        row = (await adb.execute(
+            select(User.id, User.email, User.role, User.status).where(User.email == email)
+        )).first()
+        if not row:
+            raise HTTPException(status_code=401, detail="Utilisateur introuvable")
+        principal = Principal(*row)
+        _principals.set(email, principal)
+
+    if principal.status != "active":
+        raise HTTPException(status_code=403, detail="Compte suspendu ou banni")
+
+    return principal
+
+
+def _attach_principal(db: Session, principal: Principal) -> User:
+    """User persistant sans requête : seuls id/email/role/status sont
+    chargés, les autres colonnes (et user.wallet) se chargent à l'accès."""
+    user_id, email, role, status = principal
+    existing = db.identity_map.get(identity_key(User, user_id))
+    if existing is not None:
+        return existing
+
+    user = User(id=user_id, email=email, role=role, status=status)
+    make_transient_to_detached(user)
+    db.add(user)
+    return user
+
+
+def invalidate_principal(email: str) -> None:
+    _principals.pop(email)
+
 
 def require_admin(user: User = Depends(get_current_user)):
     if user.role not in ("admin", "superadmin"):
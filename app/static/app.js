@@ -8,6 +8,8 @@ const impersonateToken = urlParams.get("impersonate");
 
 if (impersonateToken) {
     localStorage.setItem("token", impersonateToken);
+    // le refresh token est celui du superadmin : ne pas le réutiliser
+    localStorage.removeItem("refresh_token");
 
     // Nettoie l'URL
     window.history.replaceState({}, document.title, "/static/index.html");
@@ -56,8 +58,12 @@ const PAY_COORDS = {
    Export CSV
 --------------------------- */
 let lastWalletTx = [];
+// curseur de la page suivante de l'historique (null = tout est chargé)
+let lastWalletTxCursor = null;
 let lastMyTopups = [];
 let lastAdminPendingTopups = [];
+// curseur de la page suivante de /topups/pending (null = tout est chargé)
+let adminPendingCursor = null;
 
 function csvEscape(v) {
   if (v === null || v === undefined) return "";
@@ -94,10 +100,17 @@ function nowStamp() {
   )}${pad(d.getMinutes())}${pad(d.getSeconds())}`;
 }
 
-function exportWalletTxCsv() {
+async function exportWalletTxCsv() {
   const msgEl = $("histExportMsg");
   hideMsg(msgEl);
 
+  // l'écran n'affiche que la première page : l'export suit le curseur
+  // jusqu'au bout de l'historique
+  if (lastWalletTxCursor && !(await loadRemainingWalletTx())) {
+    showMsg(msgEl, false, "Export impossible (historique incomplet).");
+    return;
+  }
+
   if (!lastWalletTx || lastWalletTx.length === 0) {
     showMsg(msgEl, false, "Rien à exporter (aucune transaction chargée).");
     return;
@@ -234,13 +247,23 @@ async function api(path, opts = {}) {
     headers["Authorization"] = `Bearer ${token}`;
   }
 
-  const response = await fetch(path, {
+  let response = await fetch(path, {
     ...opts,
     headers
   });
 
+  // access token court : on tente un renouvellement avant de déconnecter
+  if (response.status === 401 && token && await refreshSession()) {
+    headers["Authorization"] = `Bearer ${token}`;
+    response = await fetch(path, {
+      ...opts,
+      headers
+    });
+  }
+
   if (response.status === 401) {
     localStorage.removeItem("token");
+    localStorage.removeItem("refresh_token");
     alert("Session expirée. Reconnecte-toi.");
     window.location.hash = "#login";
     return response;
@@ -249,6 +272,50 @@ async function api(path, opts = {}) {
   return response;
 }
 
+// un seul renouvellement à la fois : des 401 simultanés attendent le même
+// appel au lieu de présenter deux fois le même refresh token (le serveur y
+// verrait une réutilisation et couperait toutes les sessions)
+let refreshInFlight = null;
+
+function refreshSession() {
+  if (!refreshInFlight) {
+    refreshInFlight = doRefreshSession().finally(() => {
+      refreshInFlight = null;
+    });
+  }
+  return refreshInFlight;
+}
+
+async function doRefreshSession() {
+  const refreshToken = localStorage.getItem("refresh_token");
+  if (!refreshToken) return false;
+
+  const res = await fetch("/auth/refresh", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ refresh_token: refreshToken }),
+  });
+  if (!res.ok) return false;
+
+  const j = await res.json();
+  token = j.access_token;
+  localStorage.setItem("token", token);
+  localStorage.setItem("refresh_token", j.refresh_token);
+  return true;
+}
+
+function logoutSession() {
+  const refreshToken = localStorage.getItem("refresh_token");
+  localStorage.removeItem("refresh_token");
+  if (!refreshToken) return;
+  fetch("/auth/logout", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ refresh_token: refreshToken }),
+    keepalive: true,
+  }).catch(() => {});
+}
+
 /* ---------------------------
    TABS
 --------------------------- */
@@ -320,6 +387,7 @@ async function login(email, password) {
   token = j.access_token;
 
   localStorage.setItem("token", token);
+  if (j.refresh_token) localStorage.setItem("refresh_token", j.refresh_token);
   await refreshAll();
 document.getElementById("loginBox").classList.add("hide");
 document.getElementById("appBox").classList.remove("hide");
@@ -443,8 +511,27 @@ async function copyPayToClipboard() {
 /* ---------------------------
    WALLET: HISTORY
 --------------------------- */
+const HISTORY_PAGE_SIZE = 50;
+const HISTORY_EXPORT_PAGE_SIZE = 200; // TX_PAGE_MAX côté serveur
+
+function fetchWalletTx(cursor, limit) {
+  const params = new URLSearchParams({ limit: String(limit) });
+  if (cursor) params.set("cursor", cursor);
+  return api(`/wallet/transactions?${params}`);
+}
+
+async function loadRemainingWalletTx() {
+  while (lastWalletTxCursor) {
+    const res = await fetchWalletTx(lastWalletTxCursor, HISTORY_EXPORT_PAGE_SIZE);
+    if (!res.ok) return false;
+    lastWalletTx = lastWalletTx.concat(await res.json());
+    lastWalletTxCursor = res.headers.get("X-Next-Cursor");
+  }
+  return true;
+}
+
 async function loadHistory() {
-  const res = await api("/wallet/transactions");
+  const res = await fetchWalletTx(null, HISTORY_PAGE_SIZE);
   const body = $("histBody");
   if (!body) return;
 
@@ -454,14 +541,18 @@ async function loadHistory() {
     body.innerHTML = `<tr><td colspan="5">Erreur chargement</td></tr>`;
     $("histHint") && ($("histHint").textContent = "");
     lastWalletTx = [];
+    lastWalletTxCursor = null;
     return;
   }
 
   const j = await res.json();
   const items = Array.isArray(j) ? j : j.items || [];
   lastWalletTx = items;
+  lastWalletTxCursor = res.headers.get("X-Next-Cursor");
 
-  $("histHint") && ($("histHint").textContent = `${items.length} transaction(s) chargée(s)`);
+  $("histHint") && ($("histHint").textContent = lastWalletTxCursor
+    ? `${items.length} dernières transactions (l'export CSV inclut tout l'historique)`
+    : `${items.length} transaction(s) chargée(s)`);
 
   if (items.length === 0) {
     body.innerHTML = `<tr><td colspan="5" class="muted">Aucune transaction</td></tr>`;
@@ -700,6 +791,14 @@ async function loadMyTopups() {
 /* ---------------------------
    TOPUPS: ADMIN PENDING
 --------------------------- */
+const ADMIN_PENDING_PAGE_SIZE = 100;
+
+function fetchPendingTopups(cursor) {
+  const params = new URLSearchParams({ limit: String(ADMIN_PENDING_PAGE_SIZE) });
+  if (cursor) params.set("cursor", cursor);
+  return api(`/topups/pending?${params}`);
+}
+
 async function loadPendingTopups() {
   const body = $("adminTopupsBody");
   const msgEl = $("adminTopupsMsg");
@@ -708,18 +807,55 @@ async function loadPendingTopups() {
   hideMsg(msgEl);
   body.innerHTML = "";
 
-  const res = await api("/topups/pending");
+  const res = await fetchPendingTopups(null);
   const j = await res.json().catch(() => ({}));
 
   if (!res.ok) {
     showMsg(msgEl, false, j.detail || "Impossible de charger les demandes");
     body.innerHTML = `<tr><td colspan="9" class="muted">Erreur chargement</td></tr>`;
     lastAdminPendingTopups = [];
+    adminPendingCursor = null;
+    renderPendingMore();
     return;
   }
 
-  const items = Array.isArray(j) ? j : j.items || [];
-  lastAdminPendingTopups = items;
+  lastAdminPendingTopups = Array.isArray(j) ? j : j.items || [];
+  adminPendingCursor = res.headers.get("X-Next-Cursor");
+  renderPendingTopups();
+}
+
+// page serveur suivante (id croissant) ajoutée à la liste affichée
+async function loadMorePendingTopups() {
+  if (!adminPendingCursor) return;
+  const res = await fetchPendingTopups(adminPendingCursor);
+  if (!res.ok) {
+    const j = await res.json().catch(() => ({}));
+    showMsg($("adminTopupsMsg"), false, j.detail || "Impossible de charger la suite");
+    return;
+  }
+  lastAdminPendingTopups = lastAdminPendingTopups.concat(await res.json());
+  adminPendingCursor = res.headers.get("X-Next-Cursor");
+  renderPendingTopups();
+}
+
+function renderPendingMore() {
+  const hint = $("adminTopupsMore");
+  const btn = $("btnAdminMore");
+  const more = Boolean(adminPendingCursor);
+  hint && (hint.textContent = more
+    ? `${lastAdminPendingTopups.length} demandes affichées — d'autres sont en attente`
+    : "");
+  btn && btn.classList.toggle("hide", !more);
+}
+
+function renderPendingTopups() {
+  const body = $("adminTopupsBody");
+  if (!body) return;
+
+  body.innerHTML = "";
+  renderPendingMore();
+
+  const items = lastAdminPendingTopups;
 
   if (items.length === 0) {
     body.innerHTML = `<tr><td colspan="9" class="muted">Aucune demande en attente</td></tr>`;
@@ -1083,7 +1219,7 @@ function updateStatsBoxFromLoaded() {
   const totalFees = pending.reduce((acc, t) => acc + computeFee(Number(t.amount || 0)), 0);
 
   box.innerHTML = `
-    Demandes pending: <b>${pending.length}</b><br/>
+    Demandes pending${adminPendingCursor ? " (chargées)" : ""}: <b>${pending.length}${adminPendingCursor ? "+" : ""}</b><br/>
     Frais estimés (pending): <b>${totalFees.toFixed(2)}</b><br/>
     <span class="muted">Quand le backend stocke les frais, on affichera le revenu réel.</span>
   `;
@@ -1190,7 +1326,7 @@ function injectSuperadminBox() {
 
   <!-- 🔎 Recherche -->
   <div class="inline">
-    <input id="saSearch" placeholder="🔎 Rechercher par email..." />
+    <input id="saSearch" placeholder="🔎 Rechercher (email, téléphone, nom)..." />
   </div>
 
   <div style="height:10px"></div>
@@ -1224,9 +1360,12 @@ function injectSuperadminBox() {
 ========================================================= */
 
 const SUPERADMIN_PAGE_SIZE = 5;
+const SUPERADMIN_FETCH_SIZE = 50;
 let superadminUsers = [];
 let superadminPage = 1;
 let superadminVisibleCount = 5;
+let superadminCursor = null;
+let superadminSearchTimer = null;
 
 /* ---------- UI Injection ---------- */
 
@@ -1247,7 +1386,7 @@ function injectSuperadminBox() {
 
     <div style="height:10px"></div>
 
-    <input id="saSearch" placeholder="🔎 Rechercher par email..." />
+    <input id="saSearch" placeholder="🔎 Rechercher (email, téléphone, nom)..." />
 
     <div style="height:10px"></div>
 
@@ -1271,16 +1410,14 @@ function injectSuperadminBox() {
   tabAdmin.insertBefore(card, tabAdmin.firstChild);
 
   $("btnSaRefresh").onclick = loadUsersSuperadmin;
-  $("btnSaMore") && ($("btnSaMore").onclick = () => {
-  superadminVisibleCount += SUPERADMIN_PAGE_SIZE;
-  renderSuperadminUsers();
-});
+  $("btnSaMore") && ($("btnSaMore").onclick = showMoreSuperadminUsers);
 
 loadUsersSuperadmin();
 
+  // recherche côté serveur (préfixe email / téléphone / nom)
   $("saSearch").addEventListener("input", () => {
-    superadminPage = 1;
-    renderSuperadminUsers();
+    clearTimeout(superadminSearchTimer);
+    superadminSearchTimer = setTimeout(loadUsersSuperadmin, 300);
   });
 }
 
@@ -1292,7 +1429,7 @@ async function loadUsersSuperadmin() {
 
   tbody.innerHTML = `<tr><td colspan="5">Chargement...</td></tr>`;
 
-  const res = await api("/superadmin/users");
+  const res = await fetchSuperadminUsers(null);
 
   if (!res.ok) {
     tbody.innerHTML = `<tr><td colspan="5">Erreur</td></tr>`;
@@ -1300,11 +1437,34 @@ async function loadUsersSuperadmin() {
   }
 
   superadminUsers = await res.json();
+  superadminCursor = res.headers.get("X-Next-Cursor");
   superadminPage = 1;
   superadminVisibleCount = SUPERADMIN_PAGE_SIZE;
   renderSuperadminUsers();
 }
 
+function fetchSuperadminUsers(cursor) {
+  const params = new URLSearchParams({ limit: String(SUPERADMIN_FETCH_SIZE) });
+  const search = ($("saSearch")?.value || "").trim();
+  if (search) params.set("q", search);
+  if (cursor) params.set("cursor", cursor);
+  return api(`/superadmin/users?${params}`);
+}
+
+async function showMoreSuperadminUsers() {
+  superadminVisibleCount += SUPERADMIN_PAGE_SIZE;
+
+  // page serveur suivante quand tout ce qui est chargé est affiché
+  if (superadminVisibleCount > superadminUsers.length && superadminCursor) {
+    const res = await fetchSuperadminUsers(superadminCursor);
+    if (res.ok) {
+      superadminUsers = superadminUsers.concat(await res.json());
+      superadminCursor = res.headers.get("X-Next-Cursor");
+    }
+  }
+  renderSuperadminUsers();
+}
+
 /* ---------- Render ---------- */
 
 function renderSuperadminUsers() {
@@ -1313,11 +1473,8 @@ function renderSuperadminUsers() {
 
   tbody.innerHTML = "";
 
-const search = $("saSearch")?.value.toLowerCase() || "";
-
-const filtered = superadminUsers.filter(u =>
-  u.email.toLowerCase().includes(search)
-);
+// déjà filtré par le serveur
+const filtered = superadminUsers;
 
 const visible = filtered.slice(0, superadminVisibleCount);
 
@@ -1363,7 +1520,7 @@ visible.forEach((u, index) => {
     const btnMore = $("btnSaMore");
 
 if (btnMore) {
-  if (superadminVisibleCount >= filtered.length) { 
+  if (superadminVisibleCount >= filtered.length && !superadminCursor) { 
     btnMore.style.display = "none";
   } else {
     btnMore.style.display = "block";
@@ -1605,6 +1762,7 @@ $("btnLogin") &&
 // Logout
 // Logout propre
 $("btnLogout") && ($("btnLogout").onclick = () => {
+  logoutSession();
   localStorage.removeItem("token");
   localStorage.removeItem("superadmin_token");
   token = "";
@@ -1613,6 +1771,7 @@ $("btnLogout") && ($("btnLogout").onclick = () => {
 });
 
 $("logoutAccount") && ($("logoutAccount").onclick = () => {
+  logoutSession();
   localStorage.removeItem("token");
   localStorage.removeItem("superadmin_token");
   token = "";
@@ -1633,10 +1792,8 @@ $("btnAdminRefresh") && ($("btnAdminRefresh").onclick = loadPendingTopups);
 
 $("btnCopyPay") && ($("btnCopyPay").onclick = copyPayToClipboard);
 
-$("btnSaMore") && ($("btnSaMore").onclick = () => {
-  superadminVisibleCount += SUPERADMIN_PAGE_SIZE;
-  renderSuperadminUsers();
-});
+$("btnSaMore") && ($("btnSaMore").onclick = showMoreSuperadminUsers);
+$("btnAdminMore") && ($("btnAdminMore").onclick = loadMorePendingTopups);
 
 
 // export
@@ -1976,6 +2133,14 @@ if (saveSecurity) {
       return;
     }
 
+    // toutes les sessions ont été révoquées : celle-ci repart sur la
+    // nouvelle paire de tokens
+    if (data.access_token) {
+      token = data.access_token;
+      localStorage.setItem("token", token);
+      localStorage.setItem("refresh_token", data.refresh_token);
+    }
+
     msgEl.textContent = "Mot de passe mis à jour avec succès.";
     msgEl.className = "ok";
     msgEl.classList.remove("hide");
@@ -2,7 +2,8 @@ from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 
 from .db import SessionLocal
-from .models import Subscription, Wallet, Transaction
+from .models import Subscription, Transaction
+from .Services import wallet_engine
 
 
 def compute_next_date(interval, count):
@@ -30,27 +31,9 @@ def run_subscription_billing():
 
     for sub in subs:
 
-        wallet = db.query(Wallet).filter(
-            Wallet.user_id == sub.user_id
-        ).first()
-
-        if not wallet:
+        if sub.currency.lower() not in ("htg", "usd"):
             continue
 
-        if sub.currency.lower() == "htg":
-
-            if wallet.htg < sub.amount:
-                continue
-
-            wallet.htg -= sub.amount
-
-        elif sub.currency.lower() == "usd":
-
-            if wallet.usd < sub.amount:
-                continue
-
-            wallet.usd -= sub.amount
-
         tx = Transaction(
             user_id=sub.user_id,
             type="subscription_payment",
@@ -61,6 +44,10 @@ def run_subscription_billing():
             created_at=datetime.utcnow(),
         )
 
+        # wallet absent ou solde insuffisant : on retentera au prochain passage
+        if not wallet_engine.debit(db, sub.user_id, sub.currency, sub.amount, "subscription_payment", tx=tx):
+            continue
+
         db.add(tx)
 
         sub.next_billing_date = compute_next_date(
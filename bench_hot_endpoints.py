@@ -0,0 +1,133 @@
+# bench_hot_endpoints.py
+"""Requêtes/seconde sur les routes chaudes (/wallet, /wallet/transactions,
+/wallet/transfer, /auth/me, /partners).
+
+Par défaut lance un uvicorn local sur une base SQLite jetable, crée deux
+comptes, les crédite, puis martèle chaque route pendant --duration secondes
+avec --concurrency clients simultanés.
+
+    python bench_hot_endpoints.py                       # SQLite jetable
+    python bench_hot_endpoints.py --database-url postgresql://...   # Postgres local
+    python bench_hot_endpoints.py --url http://127.0.0.1:8000       # serveur déjà lancé
+
+Avant / après : lancer le script sur l'ancien commit (routes sync) puis sur
+le commit courant (routes async), mêmes paramètres et même --workers.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+PASSWORD = "Bench12345"
+
+
+async def _register_and_login(client: httpx.AsyncClient, email: str) -> str:
+    await client.post("/auth/register", json={
+        "email": email, "password": PASSWORD, "first_name": "Bench", "last_name": "User",
+    })
+    r = await client.post("/auth/login", data={"username": email, "password": PASSWORD})
+    r.raise_for_status()
+    return r.json()["access_token"]
+
+
+def _seed_balance(database_url: str, email: str) -> None:
+    """Crédite directement le wallet (pas d'endpoint public pour ça)."""
+    from sqlalchemy import create_engine, text
+    eng = create_engine(database_url)
+    with eng.begin() as conn:
+        conn.execute(
+            text("UPDATE wallets SET htg = 1000000, usd = 1000000 "
+                 "WHERE user_id = (SELECT id FROM users WHERE email = :e)"),
+            {"e": email},
+        )
+    eng.dispose()
+
+
+async def _hammer(client, name, make_request, concurrency, duration):
+    done = 0
+    errors = 0
+    stop = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal done, errors
+        while time.perf_counter() < stop:
+            r = await make_request()
+            if r.status_code >= 400:
+                errors += 1
+            done += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    print(f"{name:<24} {done / elapsed:>9.1f} req/s   ({done} req, {errors} erreurs)")
+
+
+async def run(base_url, database_url, concurrency, duration):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30, limits=limits) as client:
+        tag = uuid.uuid4().hex[:8]
+        sender, receiver = f"bench-{tag}-a@example.com", f"bench-{tag}-b@example.com"
+        token = await _register_and_login(client, sender)
+        await _register_and_login(client, receiver)
+        if database_url:
+            _seed_balance(database_url, sender)
+
+        h = {"Authorization": f"Bearer {token}"}
+        print(f"{base_url}  concurrency={concurrency}  duration={duration}s")
+        await _hammer(client, "GET /wallet", lambda: client.get("/wallet", headers=h), concurrency, duration)
+        await _hammer(client, "GET /wallet/transactions",
+                      lambda: client.get("/wallet/transactions", headers=h), concurrency, duration)
+        await _hammer(client, "GET /auth/me", lambda: client.get("/auth/me", headers=h), concurrency, duration)
+        await _hammer(client, "GET /partners", lambda: client.get("/partners"), concurrency, duration)
+        await _hammer(client, "POST /wallet/transfer",
+                      lambda: client.post("/wallet/transfer", headers=h, json={
+                          "to_email": receiver, "currency": "htg", "amount": 1,
+                      }), concurrency, duration)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", help="serveur déjà lancé (sinon uvicorn local)")
+    ap.add_argument("--database-url", help="défaut: SQLite jetable")
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--concurrency", type=int, default=64)
+    ap.add_argument("--duration", type=float, default=10)
+    args = ap.parse_args()
+
+    if args.url:
+        asyncio.run(run(args.url, args.database_url, args.concurrency, args.duration))
+        return
+
+    database_url = args.database_url
+    if not database_url:
+        database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+    env = dict(os.environ, DATABASE_URL=database_url)
+    port = 8765
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        for _ in range(100):
+            try:
+                httpx.get(base_url + "/docs", timeout=1)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        asyncio.run(run(base_url, database_url, args.concurrency, args.duration))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
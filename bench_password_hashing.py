@@ -0,0 +1,50 @@
+# bench_password_hashing.py
+"""Logins/seconde par cœur selon le schéma et le coût de hachage.
+
+Un login = une vérification de mot de passe : on mesure des verify() en
+boucle sur un seul thread (donc un cœur). Multiplier par HASH_WORKERS pour
+le débit max du pool de hachage.
+
+    python bench_password_hashing.py
+    python bench_password_hashing.py --seconds 5
+"""
+import argparse
+import time
+
+from passlib.context import CryptContext
+
+PASSWORD = "Bench12345"
+
+SETTINGS = [
+    ("bcrypt rounds=10", dict(schemes=["bcrypt"], bcrypt__rounds=10)),
+    ("bcrypt rounds=12", dict(schemes=["bcrypt"], bcrypt__rounds=12)),
+    ("argon2id t=1 m=19MiB", dict(schemes=["argon2"], argon2__type="ID", argon2__time_cost=1, argon2__memory_cost=19456, argon2__parallelism=1)),
+    ("argon2id t=2 m=19MiB", dict(schemes=["argon2"], argon2__type="ID", argon2__time_cost=2, argon2__memory_cost=19456, argon2__parallelism=1)),
+    ("argon2id t=3 m=12MiB", dict(schemes=["argon2"], argon2__type="ID", argon2__time_cost=3, argon2__memory_cost=12288, argon2__parallelism=1)),
+    ("argon2id t=2 m=64MiB", dict(schemes=["argon2"], argon2__type="ID", argon2__time_cost=2, argon2__memory_cost=65536, argon2__parallelism=1)),
+]
+
+
+def bench(ctx: CryptContext, seconds: float) -> float:
+    h = ctx.hash(PASSWORD)
+    n = 0
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < seconds:
+        ctx.verify(PASSWORD, h)
+        n += 1
+    return n / (time.perf_counter() - t0)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seconds", type=float, default=2.0)
+    args = ap.parse_args()
+
+    print(f"{'réglage':<24} {'logins/s/cœur':>14} {'ms/login':>9}")
+    for name, kwargs in SETTINGS:
+        rate = bench(CryptContext(**kwargs), args.seconds)
+        print(f"{name:<24} {rate:>14.1f} {1000 / rate:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
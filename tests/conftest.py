@@ -0,0 +1,56 @@
+import os
+import tempfile
+import uuid
+
+import pytest
+
+# base SQLite jetable, avant tout import de l'app (db.py lit DATABASE_URL)
+_DB_FILE = os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_DB_FILE}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+# les threads de fond de main.py font un passage au démarrage puis dorment :
+# les tests appellent eux-mêmes send_pending, claim_next / run, snapshot_pending
+os.environ["EMAIL_POLL_SECONDS"] = "3600"
+os.environ["EXPORT_POLL_SECONDS"] = "3600"
+os.environ["LEDGER_SNAPSHOT_SECONDS"] = "3600"
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.db import SessionLocal  # noqa: E402
+from app.models import User, Wallet  # noqa: E402
+from app.security import create_access_token  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def make_user(db):
+    def _make(role: str = "user", wallet: bool = True, htg: float = 0.0, usd: float = 0.0) -> User:
+        user = User(email=f"{uuid.uuid4().hex[:12]}@test.ht", password_hash="x", role=role, status="active")
+        db.add(user)
+        db.flush()
+        if wallet:
+            db.add(Wallet(user_id=user.id, htg=htg, usd=usd))
+        db.commit()
+        return user
+    return _make
+
+
+@pytest.fixture
+def auth():
+    def _auth(user: User) -> dict:
+        return {"Authorization": f"Bearer {create_access_token(user)}"}
+    return _auth
@@ -0,0 +1,100 @@
+import uuid
+from datetime import datetime, timedelta
+
+from app.main import _backfill_topup_transactions
+from app.models import TopupRequest, Transaction
+from app.Services import analytics
+
+
+def _tx(db, user, currency, created_at, fee, id=None):
+    tx = Transaction(
+        id=id, user_id=user.id, type="topup", currency=currency, amount=100.0,
+        direction="credit", method="moncash", fee_amount=fee, created_at=created_at,
+    )
+    db.add(tx)
+    db.commit()
+    return tx
+
+
+def _fees(client, headers, currency):
+    res = client.get(f"/admin/fees/analytics?bucket=month&currency={currency}", headers=headers)
+    assert res.status_code == 200, res.text
+    return sum(r["fees"] for r in res.json()["rows"]), sum(r["count"] for r in res.json()["rows"])
+
+
+def test_cube_follows_late_commits_and_deletes(client, db, make_user, auth):
+    admin = make_user(role="admin")
+    user = make_user()
+    headers = auth(admin)
+    cur = uuid.uuid4().hex[:6]
+    now = datetime.utcnow()
+    cube = analytics.cube(db)
+
+    old = _tx(db, user, cur, now - timedelta(days=1), 10.0)
+    recent = _tx(db, user, cur, now - timedelta(seconds=30), 5.0)
+    _tx(db, user, "htg", now, 0.0)
+    cube.refresh(db, force=True)
+    assert _fees(client, headers, cur) == (15.0, 2)
+
+    # commit tardif avec un id inférieur au plus grand déjà chargé
+    recent_id = recent.id
+    db.delete(recent)
+    db.commit()
+    _tx(db, user, cur, now - timedelta(seconds=10), 7.0, id=recent_id)
+    cube.refresh(db, force=True)
+    assert _fees(client, headers, cur) == (17.0, 2)
+
+    # suppression dans la partie figée : détectée par le COUNT
+    db.delete(old)
+    db.commit()
+    cube.refresh(db, force=True)
+    assert _fees(client, headers, cur) == (7.0, 1)
+
+    # /stats lit la même source
+    stats = client.get("/admin/fees/stats", headers=headers).json()
+    assert stats["totals"][cur] == 7.0
+
+
+def test_backfill_historical_topups_and_volume_sign(client, db, make_user, auth):
+    admin = make_user(role="admin")
+    user = make_user()
+    cur = uuid.uuid4().hex[:6]
+    now = datetime.utcnow() - timedelta(days=2)
+
+    # lignes d'avant les colonnes method / fee_amount
+    db.add(TopupRequest(
+        user_id=user.id, amount=100.0, fee_amount=4.0, net_amount=96.0, currency=cur,
+        method="natcash", reference="r", status="APPROVED", decided_at=now,
+    ))
+    for note, direction, amount in (
+        ("Topup approuvé via natcash", "manual_topup", 96.0),
+        ("Topup approuvé via moncash", "manual_topup", 50.0),  # demande disparue
+        ("sim", "credit", 10.0),
+    ):
+        db.add(Transaction(
+            user_id=user.id, type="topup", currency=cur, amount=amount,
+            direction=direction, note=note, created_at=now,
+        ))
+    db.add(Transaction(
+        user_id=user.id, type="partner_spend", currency=cur, amount=-30.0,
+        direction="partner_spend", created_at=now,
+    ))
+    db.commit()
+
+    _backfill_topup_transactions()
+
+    rows = dict(
+        db.query(Transaction.amount, Transaction.method)
+        .filter(Transaction.currency == cur, Transaction.type == "topup")
+        .all()
+    )
+    assert rows == {96.0: "natcash", 50.0: "moncash", 10.0: "sim"}
+    stats = client.get("/admin/fees/stats", headers=auth(admin)).json()
+    assert stats["totals"][cur] == 4.0
+
+    analytics.cube(db).refresh(db, force=True)
+    res = client.get(
+        f"/admin/fees/analytics?bucket=month&currency={cur}&group_by=type", headers=auth(admin),
+    ).json()
+    volumes = {r["type"]: r["volume"] for r in res["rows"]}
+    assert volumes == {"topup": 156.0, "partner_spend": 30.0}
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.db import SessionLocal
+from app.models import ExportJob
+from app.Services import export_jobs
+
+
+@pytest.fixture
+def job(db, make_user, tmp_path, monkeypatch):
+    monkeypatch.setattr(export_jobs, "EXPORT_DIR", tmp_path)
+    db.add(ExportJob(requested_by=make_user(role="admin").id, format="csv"))
+    db.commit()
+    claimed = export_jobs.claim_next(db)
+    assert claimed.attempt == 1
+    return claimed
+
+
+def test_run_writes_file_and_marks_done(db, job, tmp_path):
+    export_jobs.run(db, job)
+    assert job.status == "done"
+    assert [p.name for p in tmp_path.iterdir()] == [export_jobs.filename(job)]
+
+
+def test_requeued_attempt_does_not_finish_the_job(db, job, tmp_path):
+    # bail expiré puis job repris par un autre worker pendant que le
+    # premier écrit encore
+    with SessionLocal() as other:
+        other.query(ExportJob).filter_by(id=job.id).update({"attempt": ExportJob.attempt + 1})
+        other.commit()
+
+    export_jobs.run(db, job)
+    assert (job.status, job.attempt, job.file_path) == ("running", 2, None)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_timeout_counts_from_last_heartbeat(db, job):
+    old = datetime.utcnow() - timedelta(minutes=export_jobs.EXPORT_JOB_TIMEOUT_MINUTES + 1)
+    db.query(ExportJob).filter_by(id=job.id).update({"started_at": old, "heartbeat_at": datetime.utcnow()})
+    db.commit()
+    assert export_jobs.claim_next(db) is None
+
+    db.query(ExportJob).filter_by(id=job.id).update({"heartbeat_at": old})
+    db.commit()
+    assert export_jobs.claim_next(db).attempt == 2
+
+
+def test_long_job_keeps_its_claim_through_heartbeats(db, job, tmp_path, monkeypatch):
+    monkeypatch.setattr(export_jobs, "EXPORT_HEARTBEAT_SECONDS", 0)
+    old = datetime.utcnow() - timedelta(minutes=export_jobs.EXPORT_JOB_TIMEOUT_MINUTES + 1)
+    db.query(ExportJob).filter_by(id=job.id).update({"started_at": old, "heartbeat_at": old})
+    db.commit()
+    row = tuple(range(len(export_jobs.TX_COLUMNS)))
+    others = []
+
+    def slow_rows(db, stmt):
+        # l'export a dépassé le timeout : un autre worker passe entre deux lots
+        yield [row]
+        with SessionLocal() as other:
+            others.append(export_jobs.claim_next(other))
+        yield [row]
+
+    monkeypatch.setattr(export_jobs, "iter_rows", slow_rows)
+    export_jobs.run(db, job)
+
+    assert others == [None]
+    assert (job.status, job.attempt, job.row_count) == ("done", 1, 2)
@@ -0,0 +1,60 @@
+from app.models import Wallet
+
+
+def _quote(client, headers, amount=100.0):
+    res = client.post(
+        "/wallet/convert/quote",
+        json={"direction": "usd_to_htg", "amount": amount},
+        headers=headers,
+    )
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+def test_quote_is_single_use(client, db, make_user, auth):
+    user = make_user(usd=500.0)
+    headers = auth(user)
+    quote = _quote(client, headers)
+
+    body = {"direction": "usd_to_htg", "amount": 100.0, "quote_id": quote["quote_id"]}
+    first = client.post("/wallet/convert", json=body, headers=headers)
+    assert first.status_code == 200, first.text
+    assert first.json()["rate_used"] == quote["rate_used"]
+
+    again = client.post("/wallet/convert", json=body, headers=headers)
+    assert again.status_code == 400
+
+    db.expire_all()
+    assert db.query(Wallet).filter_by(user_id=user.id).one().usd == 400.0
+
+
+def test_quote_survives_failed_conversion(client, db, make_user, auth):
+    user = make_user(usd=50.0)
+    headers = auth(user)
+    quote = _quote(client, headers)
+
+    body = {"direction": "usd_to_htg", "amount": 100.0, "quote_id": quote["quote_id"]}
+    assert client.post("/wallet/convert", json=body, headers=headers).status_code == 400
+
+    # le marquage est annulé avec la conversion : le devis reste utilisable
+    db.query(Wallet).filter_by(user_id=user.id).update({"usd": 500.0})
+    db.commit()
+    assert client.post("/wallet/convert", json=body, headers=headers).status_code == 200
+
+
+
+def test_quote_survives_mismatched_conversion(client, make_user, auth):
+    user = make_user(usd=500.0)
+    headers = auth(user)
+    quote = _quote(client, headers)
+
+    wrong = {"direction": "usd_to_htg", "amount": 90.0, "quote_id": quote["quote_id"]}
+    assert client.post("/wallet/convert", json=wrong, headers=headers).status_code == 400
+    body = {**wrong, "amount": 100.0}
+    assert client.post("/wallet/convert", json=body, headers=headers).status_code == 200
+def test_quote_bound_to_user(client, make_user, auth):
+    owner, thief = make_user(usd=500.0), make_user(usd=500.0)
+    quote = _quote(client, auth(owner))
+    body = {"direction": "usd_to_htg", "amount": 100.0, "quote_id": quote["quote_id"]}
+    assert client.post("/wallet/convert", json=body, headers=auth(thief)).status_code == 400
+    assert client.post("/wallet/convert", json=body, headers=auth(owner)).status_code == 200
@@ -0,0 +1,84 @@
+import uuid
+from datetime import datetime, timedelta
+
+from app.models import IdempotencyKey, Wallet
+
+
+def _transfer(client, headers, to_email, amount, key):
+    return client.post(
+        "/wallet/transfer",
+        json={"to_email": to_email, "currency": "htg", "amount": amount},
+        headers={**headers, "Idempotency-Key": key},
+    )
+
+
+def _htg(db, user):
+    db.expire_all()
+    return db.query(Wallet).filter_by(user_id=user.id).one().htg
+
+
+def test_replay_same_request(client, db, make_user, auth):
+    sender, dest = make_user(htg=100.0), make_user()
+    key = uuid.uuid4().hex
+    first = _transfer(client, auth(sender), dest.email, 10, key)
+    again = _transfer(client, auth(sender), dest.email, 10, key)
+    assert first.status_code == again.status_code == 200
+    assert again.json() == first.json()
+    assert _htg(db, sender) == 90.0
+
+
+def test_same_key_other_body_is_rejected(client, db, make_user, auth):
+    sender, dest = make_user(htg=100.0), make_user()
+    key = uuid.uuid4().hex
+    assert _transfer(client, auth(sender), dest.email, 10, key).status_code == 200
+    other = _transfer(client, auth(sender), dest.email, 50, key)
+    assert other.status_code == 422
+    assert _htg(db, sender) == 90.0
+
+
+def test_key_marked_done_with_the_movement(client, db, make_user, auth):
+    sender, dest = make_user(htg=100.0), make_user()
+    key = uuid.uuid4().hex
+    assert _transfer(client, auth(sender), dest.email, 10, key).status_code == 200
+    row = db.query(IdempotencyKey).filter_by(user_id=sender.id, key=key).one()
+    assert row.status == "done" and row.request_hash
+
+
+def test_abandoned_pending_key_is_taken_over(client, db, make_user, auth):
+    sender, dest = make_user(htg=100.0), make_user()
+    key = uuid.uuid4().hex
+    now = datetime.utcnow()
+    row = IdempotencyKey(
+        user_id=sender.id, endpoint="wallet.transfer", key=key, status="pending",
+        created_at=now, expires_at=now + timedelta(hours=24),
+    )
+    db.add(row)
+    db.commit()
+
+    # encore en cours : 409
+    assert _transfer(client, auth(sender), dest.email, 10, key).status_code == 409
+
+    # process mort depuis longtemps : la clé est reprise
+    row.created_at = now - timedelta(minutes=10)
+    db.commit()
+    assert _transfer(client, auth(sender), dest.email, 10, key).status_code == 200
+    assert _htg(db, sender) == 90.0
+
+
+def test_partner_spend_reports_new_balance(client, db, make_user, auth):
+    from app.models import Partner
+
+    partner = Partner(name="Boutik", url="https://boutik.ht")
+    db.add(partner)
+    db.commit()
+    user = make_user(htg=100.0)
+
+    res = client.post(
+        "/partners/spend",
+        json={"partner_id": partner.id, "currency": "htg", "amount": 30},
+        headers={**auth(user), "Idempotency-Key": uuid.uuid4().hex},
+    )
+    assert res.status_code == 200, res.text
+    body = res.json()
+    assert body["new_balance_htg"] == 70.0 and body["tx_id"]
+    assert _htg(db, user) == 70.0
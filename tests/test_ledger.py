@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+from app import backfill_ledger
+from app.models import BalanceSnapshot, LedgerEntry, Wallet, WorkerCursor
+from app.Services import ledger, wallet_engine
+
+
+def _snapshots(db, user):
+    return db.query(BalanceSnapshot).filter_by(user_id=user.id, currency="htg").count()
+
+
+def test_snapshots_are_taken_off_the_write_path(db, make_user, monkeypatch):
+    monkeypatch.setattr(ledger, "SNAPSHOT_EVERY", 3)
+    user = make_user()
+    for amount in (1.0, 2.0, 3.0, 4.0):
+        assert wallet_engine.credit(db, user.id, "htg", amount, "topup")
+        db.commit()
+    assert _snapshots(db, user) == 0
+
+    assert ledger.snapshot_pending(db) >= 1
+    assert _snapshots(db, user) == 1
+    assert ledger.balance_minor(db, user.id, "htg") == 1000
+
+
+def test_snapshots_catch_up_after_downtime(db, make_user, monkeypatch):
+    monkeypatch.setattr(ledger, "SNAPSHOT_EVERY", 3)
+    user = make_user()
+    for amount in (1.0, 2.0, 3.0):
+        assert wallet_engine.credit(db, user.id, "htg", amount, "topup")
+        db.commit()
+    # écritures plus vieilles que toute fenêtre : le worker était arrêté
+    old = datetime.utcnow() - timedelta(days=1)
+    db.query(LedgerEntry).filter_by(user_id=user.id).update({"created_at": old})
+    db.commit()
+
+    # les écritures des autres tests sont récentes : tout compte comme stable
+    monkeypatch.setattr(ledger, "LEDGER_SNAPSHOT_SLACK_SECONDS", -60)
+    assert ledger.snapshot_pending(db) >= 1
+    assert _snapshots(db, user) == 1
+    last_id = db.query(LedgerEntry.id).filter_by(user_id=user.id).order_by(LedgerEntry.id.desc()).first()[0]
+    position = db.query(WorkerCursor.position).filter_by(name=ledger.CURSOR_NAME).scalar()
+    assert position >= last_id
+
+
+def test_duplicate_snapshot_is_ignored(db, make_user, monkeypatch):
+    monkeypatch.setattr(ledger, "SNAPSHOT_EVERY", 3)
+    user = make_user()
+    for amount in (1.0, 2.0, 3.0):
+        assert wallet_engine.credit(db, user.id, "htg", amount, "topup")
+        db.commit()
+    assert ledger.snapshot_if_due(db, user.id, "htg")
+    db.commit()
+
+    # second worker qui n'a pas encore vu le premier snapshot
+    monkeypatch.setattr(ledger, "_latest_snapshot", lambda db, user_id, currency: None)
+    assert not ledger.snapshot_if_due(db, user.id, "htg")
+    db.commit()
+    assert _snapshots(db, user) == 1
+
+
+def test_backfill_covers_users_with_entries(db, make_user):
+    # compte existant avant le journal, qui a déjà eu du trafic depuis
+    user = make_user(htg=100.0)
+    assert wallet_engine.credit(db, user.id, "htg", 20.0, "topup")
+    db.commit()
+    assert ledger.balance_minor(db, user.id, "htg") == 2000
+
+    backfill_ledger.main()
+    db.expire_all()
+    assert db.query(Wallet.htg).filter_by(user_id=user.id).scalar() == 120.0
+    assert ledger.balance_minor(db, user.id, "htg") == 12000
+
+    # relancer ne poste rien de plus
+    backfill_ledger.main()
+    openings = db.query(LedgerEntry).filter_by(user_id=user.id, kind="opening").count()
+    assert openings == 1
+
@@ -0,0 +1,55 @@
+import asyncio
+import uuid
+
+from starlette.requests import Request
+
+from app.Services import rate_limit
+from app.Services.rate_limit import ProgressiveDelay, client_ip
+
+
+def _request(peer: str, forwarded: str | None = None) -> Request:
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "client": (peer, 1234), "headers": headers})
+
+
+def test_client_ip_behind_proxy(monkeypatch):
+    monkeypatch.setattr(rate_limit, "TRUSTED_PROXY_HOPS", 0)
+    assert client_ip(_request("10.0.0.1", "1.2.3.4")) == "10.0.0.1"
+
+    monkeypatch.setattr(rate_limit, "TRUSTED_PROXY_HOPS", 1)
+    assert client_ip(_request("10.0.0.1", "1.2.3.4")) == "1.2.3.4"
+    # entrée forgée par le client à gauche : ignorée
+    assert client_ip(_request("10.0.0.1", "6.6.6.6, 1.2.3.4")) == "1.2.3.4"
+    assert client_ip(_request("10.0.0.1")) == "10.0.0.1"
+
+
+def test_progressive_delay_is_capped():
+    limiter = ProgressiveDelay("test", free=3, base=1, max_delay=30, window=900)
+    assert [limiter.delay_for(n) for n in (0, 2, 3, 4, 5, 10)] == [0, 0, 1, 2, 4, 30]
+    # base float (variable d'environnement) et rafale de credential stuffing
+    assert ProgressiveDelay("test", free=3, base=1.0, max_delay=30.0, window=900).delay_for(5000) == 30.0
+
+    key = uuid.uuid4().hex
+
+    async def scenario():
+        for _ in range(3):
+            assert await limiter.retry_after(key) == 0
+            await limiter.hit(key)
+        assert 0 < await limiter.retry_after(key) <= 2
+        await limiter.reset(key)
+        assert await limiter.retry_after(key) == 0
+
+    asyncio.run(scenario())
+
+
+def test_login_throttles_email_without_locking_it(client):
+    email = f"{uuid.uuid4().hex[:10]}@test.ht"
+    client.post("/auth/register", json={
+        "email": email, "password": "motdepasse1", "first_name": "A", "last_name": "B",
+    })
+    for _ in range(3):
+        res = client.post("/auth/login", data={"username": email, "password": "faux"})
+        assert res.status_code == 401
+    res = client.post("/auth/login", data={"username": email, "password": "faux"})
+    assert res.status_code == 429
+    assert 1 <= int(res.headers["Retry-After"]) <= 2
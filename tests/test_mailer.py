@@ -0,0 +1,112 @@
+import socket
+from datetime import datetime
+
+import pytest
+from aiosmtpd.controller import Controller
+
+from app.models import EmailOutbox
+from app.Services import mailer
+
+
+class _Handler:
+    """Serveur SMTP de test : refuse certains destinataires, garde le reste."""
+
+    def __init__(self):
+        self.received = []
+        self.refuse = {}     # adresse -> réponse RCPT
+        self.sessions = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.sessions += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.refuse:
+            return self.refuse[address]
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received.extend(envelope.rcpt_tos)
+        return "250 Message accepted"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp(monkeypatch, db):
+    handler = _Handler()
+    port = _free_port()
+    controller = Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    monkeypatch.setattr(mailer, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(mailer, "SMTP_PORT", port)
+    monkeypatch.setattr(mailer, "SMTP_SSL", False)
+    monkeypatch.setattr(mailer, "SMTP_USER", None)
+    db.query(EmailOutbox).delete()
+    db.commit()
+    yield handler
+    mailer._close()
+    controller.stop()
+
+
+def _enqueue(db, *emails):
+    msgs = [mailer.enqueue(db, e, "Sujet", "Corps") for e in emails]
+    db.commit()
+    return [m.id for m in msgs]
+
+
+def _rows(db, ids):
+    db.expire_all()
+    return [db.get(EmailOutbox, i) for i in ids]
+
+
+def test_batch_sent_on_one_connection(smtp, db):
+    ids = _enqueue(db, "a@test.ht", "b@test.ht", "c@test.ht")
+    assert mailer.send_pending(db) == 3
+    assert sorted(smtp.received) == ["a@test.ht", "b@test.ht", "c@test.ht"]
+    assert smtp.sessions == 1
+    assert all(r.status == "sent" and r.sent_at for r in _rows(db, ids))
+
+
+def test_refused_recipient_fails_only_that_message(smtp, db):
+    smtp.refuse["bad@test.ht"] = "550 No such user"
+    ids = _enqueue(db, "a@test.ht", "bad@test.ht", "c@test.ht")
+
+    assert mailer.send_pending(db) == 2
+    assert sorted(smtp.received) == ["a@test.ht", "c@test.ht"]
+    assert smtp.sessions == 1  # connexion gardée après le refus
+
+    a, bad, c = _rows(db, ids)
+    assert (a.status, c.status) == ("sent", "sent")
+    assert bad.status == "failed" and bad.attempts == 1 and "550" in bad.last_error
+
+
+def test_temporary_refusal_is_retried_later(smtp, db):
+    smtp.refuse["busy@test.ht"] = "451 Try again later"
+    (busy_id,) = _enqueue(db, "busy@test.ht")
+
+    assert mailer.send_pending(db) == 0
+    (busy,) = _rows(db, [busy_id])
+    assert busy.status == "pending" and busy.attempts == 1
+    assert busy.next_attempt_at > datetime.utcnow()
+
+
+def test_connection_loss_releases_rest_of_batch(smtp, db, monkeypatch):
+    monkeypatch.setattr(mailer, "SMTP_PORT", _free_port())  # personne n'écoute
+    ids = _enqueue(db, "a@test.ht", "b@test.ht", "c@test.ht")
+
+    before = datetime.utcnow()
+    assert mailer.send_pending(db) == 0
+    first, *rest = _rows(db, ids)
+    assert first.status == "pending" and first.attempts == 1
+    assert first.next_attempt_at > datetime.utcnow()
+    # pas tentés : rendus tout de suite, sans attendre la fin du bail
+    for r in rest:
+        assert r.status == "pending" and r.attempts == 0
+        assert before <= r.next_attempt_at <= datetime.utcnow()
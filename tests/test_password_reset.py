@@ -0,0 +1,23 @@
+import re
+import uuid
+
+from app.models import EmailOutbox
+
+
+def test_reset_code_goes_to_outbox_not_logs(client, db, capsys):
+    email = f"{uuid.uuid4().hex[:10]}@test.ht"
+    client.post("/auth/register", json={
+        "email": email, "password": "motdepasse1", "first_name": "A", "last_name": "B",
+    })
+
+    res = client.post("/auth/password/forgot", json={"email": email})
+    assert res.status_code == 200
+
+    msg = db.query(EmailOutbox).filter_by(to_email=email).one()
+    code = re.search(r"code de réinitialisation : (\S+)", msg.body).group(1)
+    assert code not in capsys.readouterr().out
+
+    res = client.post("/auth/password/reset", json={
+        "email": email, "token": code, "new_password": "nouveaumdp2",
+    })
+    assert res.status_code == 200, res.text
@@ -0,0 +1,45 @@
+import uuid
+
+from app.models import User
+
+
+def _register(client, email, ref=None):
+    return client.post("/auth/register", json={
+        "email": email, "password": "motdepasse1",
+        "first_name": "Jean", "last_name": "Pierre", "ref": ref,
+    })
+
+
+def test_register_with_derived_ref_code(client, db):
+    parrain = _register(client, f"{uuid.uuid4().hex[:10]}@test.ht")
+    assert parrain.status_code == 200, parrain.text
+    code = parrain.json()["ref_code"]
+
+    email = f"{uuid.uuid4().hex[:10]}@test.ht"
+    res = _register(client, email, ref=code.lower())
+    assert res.status_code == 200, res.text
+
+    filleul = db.query(User).filter_by(email=email).one()
+    assert filleul.referrer.ref_code == code
+    assert filleul.wallet is not None
+
+
+def test_register_duplicate_email(client):
+    email = f"{uuid.uuid4().hex[:10]}@test.ht"
+    assert _register(client, email).status_code == 200
+    assert _register(client, email).status_code == 400
+
+
+def test_change_password(client):
+    email = f"{uuid.uuid4().hex[:10]}@test.ht"
+    assert _register(client, email).status_code == 200
+    login = client.post("/auth/login", data={"username": email, "password": "motdepasse1"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    bad = client.post("/auth/password/change", headers=headers,
+                      json={"old_password": "faux", "new_password": "nouveau12"})
+    assert bad.status_code == 400
+    ok = client.post("/auth/password/change", headers=headers,
+                     json={"old_password": "motdepasse1", "new_password": "nouveau12"})
+    assert ok.status_code == 200, ok.text
+    assert client.post("/auth/login", data={"username": email, "password": "nouveau12"}).status_code == 200
@@ -0,0 +1,88 @@
+import uuid
+from datetime import datetime, timedelta
+
+from app.models import RefreshToken, TokenRevocation, User
+from app.Services import revocation
+from app.security import _hash_refresh_token, refresh_revocations, revoke_user_tokens
+
+
+def _login(client):
+    email = f"{uuid.uuid4().hex[:10]}@test.ht"
+    client.post("/auth/register", json={
+        "email": email, "password": "motdepasse1", "first_name": "A", "last_name": "B",
+    })
+    res = client.post("/auth/login", data={"username": email, "password": "motdepasse1"})
+    assert res.status_code == 200, res.text
+    return email, res.json()
+
+
+def _refresh(client, token):
+    return client.post("/auth/refresh", json={"refresh_token": token})
+
+
+def test_concurrent_refresh_within_grace(client):
+    _, tokens = _login(client)
+    first = _refresh(client, tokens["refresh_token"])
+    second = _refresh(client, tokens["refresh_token"])  # l'autre onglet, même token
+    assert first.status_code == second.status_code == 200
+    # les deux branches restent utilisables
+    assert _refresh(client, first.json()["refresh_token"]).status_code == 200
+    assert _refresh(client, second.json()["refresh_token"]).status_code == 200
+
+
+def test_reuse_after_grace_revokes_everything(client, db):
+    _, tokens = _login(client)
+    new = _refresh(client, tokens["refresh_token"]).json()["refresh_token"]
+
+    old = db.query(RefreshToken).filter_by(token_hash=_hash_refresh_token(tokens["refresh_token"])).one()
+    old.revoked_at = datetime.utcnow() - timedelta(minutes=5)
+    db.commit()
+
+    assert _refresh(client, tokens["refresh_token"]).status_code == 401
+    assert _refresh(client, new).status_code == 401
+
+
+def test_deleted_user_revocation_reaches_other_workers(client, db):
+    email, tokens = _login(client)
+    user = db.query(User).filter_by(email=email).one()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.get("/auth/me", headers=headers).status_code == 200
+
+    revoke_user_tokens(db, user)
+    user_id = user.id
+    db.delete(user)
+    db.commit()
+
+    # autre worker : rien en mémoire locale, seulement la base
+    revocation._local.clear()
+    revocation._versions.clear()
+    assert not revocation.is_revoked(user_id, 0)
+    refresh_revocations(db)
+    assert revocation.is_revoked(user_id, 0)
+    assert client.get("/auth/me", headers=headers).status_code == 401
+    # un compte recréé plus tard avec le même id n'est pas visé
+    later = (datetime.utcnow() + timedelta(seconds=5) - revocation.EPOCH).total_seconds()
+    assert not revocation.is_revoked(user_id, 0, later)
+
+    # iat est à la seconde : ne pas gêner un compte créé dans la même
+    # seconde par les autres tests
+    db.query(TokenRevocation).filter_by(user_id=user_id).delete()
+    db.commit()
+    revocation._local.clear()
+    revocation._versions.clear()
+
+
+def test_password_change_revokes_other_sessions(client):
+    _, tokens = _login(client)
+    old_headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+    res = client.post("/auth/password/change", headers=old_headers, json={
+        "old_password": "motdepasse1", "new_password": "motdepasse2",
+    })
+    assert res.status_code == 200, res.text
+    fresh = res.json()
+
+    assert client.get("/auth/me", headers=old_headers).status_code == 401
+    assert _refresh(client, tokens["refresh_token"]).status_code == 401
+    assert client.get("/auth/me", headers={"Authorization": f"Bearer {fresh['access_token']}"}).status_code == 200
+    assert _refresh(client, fresh["refresh_token"]).status_code == 200
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import false
+
+from app.models import TopupRequest
+from app.Services import topup_queue
+
+
+def _request(db, user):
+    req = TopupRequest(
+        user_id=user.id, amount=100.0, fee_amount=5.0, net_amount=95.0,
+        currency="htg", method="moncash", reference="ref",
+    )
+    db.add(req)
+    db.commit()
+    return req
+
+
+def test_renew_extends_held_leases(client, db, make_user, auth):
+    admin = make_user(role="admin")
+    user = make_user()
+    # d'autres tests laissent des demandes PENDING : ne réserver que les nôtres
+    db.query(TopupRequest).filter(TopupRequest.status == "PENDING").update(
+        {"claimed_by": -1, "claimed_until": datetime.utcnow() + timedelta(hours=1)}
+    )
+    db.commit()
+    first, second = _request(db, user), _request(db, user)
+
+    res = client.post("/topups/claim?n=1", headers=auth(admin))
+    assert [r["id"] for r in res.json()] == [first.id]
+
+    db.query(TopupRequest).filter(TopupRequest.id == first.id).update(
+        {"claimed_until": datetime.utcnow() + timedelta(seconds=5)}
+    )
+    db.commit()
+
+    res = client.post("/topups/claim/renew", headers=auth(admin))
+    assert res.status_code == 200
+    assert res.json()["ids"] == [first.id]
+    db.expire_all()
+    lease = db.get(TopupRequest, first.id).claimed_until
+    assert lease > datetime.utcnow() + timedelta(seconds=topup_queue.TOPUP_CLAIM_LEASE_SECONDS - 60)
+
+    # réserver à nouveau donne la suivante, pas celle déjà détenue
+    res = client.post("/topups/claim?n=1", headers=auth(admin))
+    assert [r["id"] for r in res.json()] == [second.id]
+
+
+def test_decide_lost_lease_race_is_409(client, db, make_user, auth, monkeypatch):
+    admin = make_user(role="admin")
+    req = _request(db, make_user())
+    # le bail est pris par un autre admin entre la lecture et l'UPDATE gardé
+    monkeypatch.setattr(topup_queue, "is_free", lambda now: false())
+
+    res = client.post(f"/topups/{req.id}/decide", json={"status": "APPROVED"}, headers=auth(admin))
+    assert res.status_code == 409
+    db.expire_all()
+    assert db.get(TopupRequest, req.id).status == "PENDING"
@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from app.models import TopupRequest, Transaction, Wallet, LedgerEntry, RevenueDaily
+
+
+def _request(db, user, amount, currency="htg", method="moncash", fee=5.0, **kw):
+    req = TopupRequest(
+        user_id=user.id, amount=amount, fee_amount=fee, net_amount=amount - fee,
+        currency=currency, method=method, reference="ref", **kw,
+    )
+    db.add(req)
+    db.commit()
+    return req
+
+
+def _revenue(db, currency, method):
+    row = db.query(RevenueDaily).filter(
+        RevenueDaily.day == datetime.utcnow().date(),
+        RevenueDaily.currency == currency,
+        RevenueDaily.method == method,
+    ).first()
+    return (row.topup_count, row.fee_total, row.net_total) if row else (0, 0.0, 0.0)
+
+
+def test_bulk_approve_mixed(client, db, make_user, auth):
+    admin = make_user(role="admin")
+    other_admin = make_user(role="admin")
+    alice = make_user(htg=10.0)
+    bob = make_user(wallet=False)
+
+    a1 = _request(db, alice, 100.0)
+    a2 = _request(db, alice, 50.0)
+    b1 = _request(db, bob, 30.0, currency="usd", method="interac", fee=3.0)
+    done = _request(db, alice, 20.0, status="APPROVED")
+    own = _request(db, admin, 40.0)
+    leased = _request(
+        db, alice, 60.0,
+        claimed_by=other_admin.id, claimed_until=datetime.utcnow() + timedelta(minutes=5),
+    )
+    revenue_before = _revenue(db, "htg", "moncash")
+
+    ids = [a1.id, a2.id, b1.id, done.id, own.id, leased.id, 999999]
+    res = client.post(
+        "/topups/decide/bulk",
+        json={"ids": ids, "status": "APPROVED"},
+        headers=auth(admin),
+    )
+    assert res.status_code == 200, res.text
+    body = res.json()
+    assert body["decided"] == 3 and body["failed"] == 4
+
+    results = {r["id"]: r for r in body["results"]}
+    assert [r["id"] for r in body["results"]] == ids
+    for i in (a1.id, a2.id, b1.id):
+        assert results[i]["ok"] and results[i]["status"] == "APPROVED" and results[i]["tx_id"]
+    assert results[done.id]["error"] == "Demande déjà traitée"
+    assert results[own.id]["error"] == "Admin ne peut pas approuver sa propre recharge"
+    assert results[leased.id]["error"] == "Demande en cours de revue par un autre admin"
+    assert results[999999]["error"] == "Demande introuvable"
+
+    db.expire_all()
+
+    # crédits agrégés par wallet ; wallet créé pour bob
+    assert db.query(Wallet).filter_by(user_id=alice.id).one().htg == 10.0 + 95.0 + 45.0
+    bob_wallet = db.query(Wallet).filter_by(user_id=bob.id).one()
+    assert (bob_wallet.htg, bob_wallet.usd) == (0.0, 27.0)
+
+    # une transaction et une jambe de journal par demande approuvée
+    for i, user_id, net in ((a1.id, alice.id, 95.0), (a2.id, alice.id, 45.0), (b1.id, bob.id, 27.0)):
+        tx = db.get(Transaction, results[i]["tx_id"])
+        assert (tx.user_id, tx.type, tx.amount) == (user_id, "topup", net)
+        leg = db.query(LedgerEntry).filter_by(tx_id=tx.id).one()
+        assert (leg.user_id, leg.kind, leg.amount_minor) == (user_id, "topup", round(net * 100))
+    assert db.query(func.sum(LedgerEntry.amount_minor)).filter_by(user_id=alice.id).scalar() == 14000
+
+    count, fee, net = _revenue(db, "htg", "moncash")
+    assert (count, fee, net) == (revenue_before[0] + 2, revenue_before[1] + 10.0, revenue_before[2] + 140.0)
+    assert _revenue(db, "usd", "interac")[0] >= 1
+
+    # les demandes refusées à la validation n'ont pas bougé
+    assert db.get(TopupRequest, leased.id).status == "PENDING"
+    assert db.get(TopupRequest, own.id).status == "PENDING"
+
+
+def test_bulk_reject_does_not_credit(client, db, make_user, auth):
+    admin = make_user(role="admin")
+    carol = make_user(htg=5.0)
+    r1 = _request(db, carol, 100.0)
+    r2 = _request(db, carol, 80.0)
+
+    res = client.post(
+        "/topups/decide/bulk",
+        json={"ids": [r1.id, r2.id], "status": "REJECTED", "admin_note": "preuve illisible"},
+        headers=auth(admin),
+    )
+    assert res.status_code == 200, res.text
+    assert res.json()["decided"] == 2
+
+    db.expire_all()
+    assert db.query(Wallet).filter_by(user_id=carol.id).one().htg == 5.0
+    assert db.query(LedgerEntry).filter_by(user_id=carol.id).count() == 0
+    for r in (r1, r2):
+        req = db.get(TopupRequest, r.id)
+        assert (req.status, req.admin_note) == ("REJECTED", "preuve illisible")
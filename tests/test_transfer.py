@@ -0,0 +1,31 @@
+from app.models import LedgerEntry, Transaction, Wallet
+
+
+def _transfer(client, headers, to_email, amount):
+    return client.post("/wallet/transfer", headers=headers, json={
+        "to_email": to_email, "currency": "htg", "amount": amount,
+    })
+
+
+def test_transfer_failures_leave_nothing_behind(client, db, make_user, auth):
+    sender = make_user(htg=100.0)
+    no_wallet = make_user(wallet=False)
+    dest = make_user()
+    headers = auth(sender)
+
+    res = _transfer(client, headers, no_wallet.email, 10.0)
+    assert res.status_code == 404
+    assert res.json()["detail"] == "Wallet destinataire introuvable"
+
+    res = _transfer(client, headers, dest.email, 500.0)
+    assert res.status_code == 400
+    assert "insuffisant" in res.json()["detail"]
+
+    db.expire_all()
+    assert db.query(Wallet.htg).filter_by(user_id=sender.id).scalar() == 100.0
+    assert db.query(Transaction).filter_by(user_id=sender.id).count() == 0
+    assert db.query(LedgerEntry).filter_by(user_id=sender.id).count() == 0
+
+    assert _transfer(client, headers, dest.email, 40.0).status_code == 200
+    db.expire_all()
+    assert db.query(Wallet.htg).filter_by(user_id=dest.id).scalar() == 40.0
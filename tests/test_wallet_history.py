@@ -0,0 +1,26 @@
+from datetime import datetime
+
+from app.models import Transaction
+
+
+def test_history_cursor_is_exposed_and_followable(client, db, make_user, auth):
+    user = make_user()
+    for i in range(3):
+        db.add(Transaction(
+            user_id=user.id, type="topup", currency="htg", amount=float(i + 1),
+            direction="credit", created_at=datetime.utcnow(),
+        ))
+    db.commit()
+    headers = {**auth(user), "Origin": "https://app.example"}
+
+    res = client.get("/wallet/transactions?limit=2", headers=headers)
+    assert res.status_code == 200
+    # lisible par le front servi depuis un autre domaine
+    exposed = res.headers["access-control-expose-headers"]
+    assert "X-Next-Cursor" in exposed and "X-Total-Count" in exposed
+
+    cursor = res.headers["X-Next-Cursor"]
+    rest = client.get(f"/wallet/transactions?limit=2&cursor={cursor}", headers=headers)
+    assert "X-Next-Cursor" not in rest.headers
+    amounts = [t["amount"] for t in res.json() + rest.json()]
+    assert amounts == [3.0, 2.0, 1.0]